@@ -1,14 +1,21 @@
 # --- agents.py ---
 import os
-import json
 import base64
+import functools
 import uuid
+import time
 import asyncio
 import logging
+from types import SimpleNamespace
 from google import genai
 from google.genai import types
 from fastapi import WebSocket
 
+import serializer
+import highlight_matcher
+import response_models
+import telemetry
+
 # Configure logging
 logger = logging.getLogger("medforce-backend")
 
@@ -17,127 +24,228 @@ VOICE_MODEL = "gemini-live-2.5-flash-preview-native-audio-09-2025"
 ADVISOR_MODEL = "gemini-2.5-flash" 
 DIAGNOSER_MODEL = "gemini-2.5-flash-lite" 
 RANKER_MODEL = "gemini-2.5-flash-lite" 
+EVALUATOR_MODEL = "gemini-2.5-flash-lite"
+CHAT_MODEL = "gemini-2.5-flash"  # text-only nurse/patient turns in headless runs
+
+@functools.lru_cache(maxsize=None)
+def load_prompt(path: str, default: str) -> str:
+    """Reads a prompt file once per process; prompts ship with the image."""
+    try:
+        with open(path, "r", encoding="utf-8") as f: return f.read()
+    except: return default
 
 class BaseLogicAgent:
+    stage = "agent"  # label for metrics/traces
+
     def __init__(self):
         self.client = genai.Client(vertexai=True, project=os.getenv("PROJECT_ID"), location=os.getenv("PROJECT_LOCATION", "us-central1"))
 
+    async def _generate(self, model, contents, config):
+        """generate_content with latency, token and error accounting."""
+        telemetry.METRICS.inc("medforce_model_inflight", agent=self.stage)
+        start = time.perf_counter()
+        response = None
+        try:
+            response = await self.client.aio.models.generate_content(model=model, contents=contents, config=config)
+            return response
+        finally:
+            telemetry.METRICS.inc("medforce_model_inflight", -1, agent=self.stage)
+            telemetry.record_model_call(self.stage, model, time.perf_counter() - start, response, error=response is None)
+
+    async def _generate_stream(self, model, contents, config):
+        """generate_content_stream with the same accounting; yields response chunks."""
+        telemetry.METRICS.inc("medforce_model_inflight", agent=self.stage)
+        start = time.perf_counter()
+        last, completed = None, False
+        try:
+            async for chunk in await self.client.aio.models.generate_content_stream(model=model, contents=contents, config=config):
+                last = chunk
+                yield chunk
+            completed = True
+        finally:
+            telemetry.METRICS.inc("medforce_model_inflight", -1, agent=self.stage)
+            telemetry.record_model_call(self.stage, model, time.perf_counter() - start, last, error=not completed)
+
 class QuestionRankingAgent(BaseLogicAgent):
+    stage = "ranker"
+
     def __init__(self, patient_info):
         super().__init__()
-        self.response_schema = {"type": "ARRAY", "items": {"type": "OBJECT", "properties": {"rank": { "type": "INTEGER" }, "qid": { "type": "STRING" }}, "required": ["rank", "qid"]}}
+        self.response_schema = response_models.RANKING_SCHEMA
         self.patient_info = patient_info
-        try:
-            with open("patient_profile/q_ranker.md", "r", encoding="utf-8") as f: self.system_instruction = f.read()
-        except: self.system_instruction = "Rank by priority."
+        self.system_instruction = load_prompt("patient_profile/q_ranker.md", "Rank by priority.")
 
     async def rank_questions(self, conversation_history, current_diagnosis, q_list):
-        prompt = f"Patient Profile:\n{self.patient_info}\n\nHistory:\n{json.dumps(conversation_history)}\n\nDiagnosis:\n{json.dumps(current_diagnosis)}\n\nQuestions:\n{json.dumps(q_list)}"
+        prompt = f"Patient Profile:\n{self.patient_info}\n\nHistory:\n{serializer.dumps(conversation_history)}\n\nDiagnosis:\n{serializer.dumps(current_diagnosis)}\n\nQuestions:\n{serializer.dumps(q_list)}"
         try:
-            response = await self.client.aio.models.generate_content(
+            response = await self._generate(
                 model=RANKER_MODEL, contents=prompt,
                 config=types.GenerateContentConfig(response_mime_type="application/json", response_schema=self.response_schema, system_instruction=self.system_instruction, temperature=0.1)
             )
-            return json.loads(response.text)
+            return response_models.parse(self.stage, response, response_models.validate_ranking, [q["qid"] for q in q_list])
         except Exception as e:
             logger.error(f"Ranker Error: {e}")
+            telemetry.record_fallback(self.stage)
             return [{"rank": i+1, "qid": q["qid"]} for i, q in enumerate(q_list)]
 
 class DiagnosisTriggerAgent(BaseLogicAgent):
+    stage = "trigger"
+
     def __init__(self):
         super().__init__()
-        self.response_schema = {"type": "OBJECT", "properties": {"should_run": { "type": "BOOLEAN" }, "reason": { "type": "STRING" }}, "required": ["should_run", "reason"]}
-        try:
-            with open("patient_profile/diagnosis_trigger.md", "r", encoding="utf-8") as f: self.system_instruction = f.read()
-        except: self.system_instruction = "Return true if new info."
+        self.response_schema = response_models.TRIGGER_SCHEMA
+        self.system_instruction = load_prompt("patient_profile/diagnosis_trigger.md", "Return true if new info.")
 
     async def check_trigger(self, conversation_history):
         if not conversation_history: return False, "Empty"
         try:
-            response = await self.client.aio.models.generate_content(
-                model="gemini-2.5-flash-lite", contents=f"History:\n{json.dumps(conversation_history)}",
+            response = await self._generate(
+                model="gemini-2.5-flash-lite", contents=f"History:\n{serializer.dumps(conversation_history)}",
                 config=types.GenerateContentConfig(response_mime_type="application/json", response_schema=self.response_schema, system_instruction=self.system_instruction, temperature=0.0)
             )
-            res = json.loads(response.text)
-            return res.get("should_run", False), res.get("reason", "")
-        except: return True, "Fallback"
+            res = response_models.parse(self.stage, response, response_models.validate_trigger)
+            return res["should_run"], res["reason"]
+        except:
+            telemetry.record_fallback(self.stage)
+            return True, "Fallback"
 
 class DiagnoseEvaluatorAgent(BaseLogicAgent):
+    stage = "evaluator"
+
     def __init__(self):
         super().__init__()
-        self.response_schema = {"type": "ARRAY", "items": {"type": "OBJECT", "properties": {"diagnosis": { "type": "STRING" }, "did": { "type": "STRING" }, "indicators_point": { "type": "ARRAY", "items": { "type": "STRING" } }}, "required": ["diagnosis", "did", "indicators_point"]}}
-        try:
-            with open("patient_profile/diagnosis_eval.md", "r", encoding="utf-8") as f: self.system_instruction = f.read()
-        except: self.system_instruction = "Merge diagnoses."
+        self.response_schema = response_models.EVALUATION_SCHEMA
+        self.system_instruction = load_prompt("patient_profile/diagnosis_eval.md", "Merge diagnoses.")
 
     async def evaluate_diagnoses(self, diagnosis_pool, new_diagnosis_list, interview_data):
-        prompt = f"Context:\n{json.dumps(interview_data)}\n\nMaster Pool:\n{json.dumps(diagnosis_pool)}\n\nNew Candidates:\n{json.dumps(new_diagnosis_list)}"
+        prompt = f"Context:\n{serializer.dumps(interview_data)}\n\nMaster Pool:\n{serializer.dumps(diagnosis_pool)}\n\nNew Candidates:\n{serializer.dumps(new_diagnosis_list)}"
         try:
-            response = await self.client.aio.models.generate_content(
-                model="gemini-2.5-flash-lite", contents=prompt,
+            response = await self._generate(
+                model=EVALUATOR_MODEL, contents=prompt,
                 config=types.GenerateContentConfig(response_mime_type="application/json", response_schema=self.response_schema, system_instruction=self.system_instruction, temperature=0.1)
             )
-            return json.loads(response.text)
-        except: return diagnosis_pool + new_diagnosis_list
+            return response_models.parse(self.stage, response, response_models.validate_evaluation)
+        except:
+            telemetry.record_fallback(self.stage)
+            return diagnosis_pool + new_diagnosis_list
 
 class DiagnoseAgent(BaseLogicAgent):
+    stage = "diagnoser"
+
     def __init__(self, patient_info):
         super().__init__()
-        self.response_schema = {"type": "OBJECT", "properties": {"diagnosis_list": {"type": "ARRAY", "items": {"type": "OBJECT", "properties": {"diagnosis": { "type": "STRING" }, "did": { "type": "STRING" }, "indicators_point": { "type": "ARRAY", "items": { "type": "STRING" } }}, "required": ["diagnosis", "indicators_point", "did"]}}, "follow_up_questions": {"type": "ARRAY", "items": { "type": "STRING" }}}, "required": ["diagnosis_list", "follow_up_questions"]}
+        self.response_schema = response_models.DIAGNOSIS_SCHEMA
         self.patient_info = patient_info
-        try:
-            with open("patient_profile/diagnoser.md", "r", encoding="utf-8") as f: self.system_instruction = f.read()
-        except: self.system_instruction = "Diagnose patient."
+        self.system_instruction = load_prompt("patient_profile/diagnoser.md", "Diagnose patient.")
 
     async def get_diagnosis_update(self, interview_data, current_diagnosis_hypothesis):
-        prompt = f"Patient:\n{self.patient_info}\n\nTranscript:\n{json.dumps(interview_data)}\n\nState:\n{json.dumps(current_diagnosis_hypothesis)}"
+        prompt = f"Patient:\n{self.patient_info}\n\nTranscript:\n{serializer.dumps(interview_data)}\n\nState:\n{serializer.dumps(current_diagnosis_hypothesis)}"
         try:
-            response = await self.client.aio.models.generate_content(
+            response = await self._generate(
                 model=DIAGNOSER_MODEL, contents=prompt,
                 config=types.GenerateContentConfig(response_mime_type="application/json", response_schema=self.response_schema, system_instruction=self.system_instruction, temperature=0.2)
             )
-            res = json.loads(response.text)
-            return {"diagnosis_list": res.get("diagnosis_list", []), "follow_up_questions": res.get("follow_up_questions", [])}
-        except: return {"diagnosis_list": current_diagnosis_hypothesis, "follow_up_questions": []}
+            return response_models.parse(self.stage, response, response_models.validate_diagnosis)
+        except:
+            telemetry.record_fallback(self.stage)
+            return {"diagnosis_list": current_diagnosis_hypothesis, "follow_up_questions": []}
 
 class AdvisorAgent(BaseLogicAgent):
+    stage = "advisor"
+
     def __init__(self, patient_info):
         super().__init__()
-        self.response_schema = {"type": "OBJECT", "properties": {"question": { "type": "STRING" }, "qid": { "type": "STRING" }, "end_conversation": { "type": "BOOLEAN" }, "reasoning": { "type": "STRING" }}, "required": ["question", "end_conversation", "reasoning", "qid"]}
+        self.response_schema = response_models.ADVICE_SCHEMA
         self.patient_info = patient_info
-        try:
-            with open("patient_profile/advisor_agent.md", "r", encoding="utf-8") as f: self.system_instruction = f.read()
-        except: self.system_instruction = "Advise nurse."
+        self.system_instruction = load_prompt("patient_profile/advisor_agent.md", "Advise nurse.")
 
     async def get_advise(self, conversation_history, q_list):
-        prompt = f"Context:\n{self.patient_info}\n\nHistory:\n{json.dumps(conversation_history)}\n\nQuestions:\n{json.dumps(q_list)}"
+        prompt = f"Context:\n{self.patient_info}\n\nHistory:\n{serializer.dumps(conversation_history)}\n\nQuestions:\n{serializer.dumps(q_list)}"
         try:
-            response = await self.client.aio.models.generate_content(
+            response = await self._generate(
                 model=ADVISOR_MODEL, contents=prompt,
                 config=types.GenerateContentConfig(response_mime_type="application/json", response_schema=self.response_schema, system_instruction=self.system_instruction, temperature=0.2)
             )
-            res = json.loads(response.text)
-            return res.get("question"), res.get("reasoning"), res.get("end_conversation"), res.get("qid")
-        except: return "Continue.", "Error", False, None
+            res = response_models.parse(self.stage, response, response_models.validate_advice, [q["qid"] for q in q_list if "qid" in q])
+            return res["question"], res["reasoning"], res["end_conversation"], res["qid"]
+        except:
+            telemetry.record_fallback(self.stage)
+            return "Continue.", "Error", False, None
+
+    async def stream_advise(self, conversation_history, q_list, on_question=None):
+        """get_advise over a streamed response: on_question(question) is called as soon as the
+        "question" field is complete, before qid/end_conversation/reasoning arrive."""
+        prompt = f"Context:\n{self.patient_info}\n\nHistory:\n{serializer.dumps(conversation_history)}\n\nQuestions:\n{serializer.dumps(q_list)}"
+        parser = response_models.StreamingObjectParser()
+        question = None
+        try:
+            stream = self._generate_stream(
+                model=ADVISOR_MODEL, contents=prompt,
+                config=types.GenerateContentConfig(response_mime_type="application/json", response_schema=response_models.ADVICE_STREAM_SCHEMA, system_instruction=self.system_instruction, temperature=0.2)
+            )
+            async for chunk in stream:
+                fields = parser.feed(chunk.text or "")
+                if question is None and isinstance(fields.get("question"), str) and fields["question"].strip():
+                    question = fields["question"].strip()
+                    if on_question:
+                        on_question(question)
+            res = response_models.parse(self.stage, SimpleNamespace(text=parser.text), response_models.validate_advice, [q["qid"] for q in q_list if "qid" in q])
+            return res["question"], res["reasoning"], res["end_conversation"], res["qid"]
+        except Exception:
+            telemetry.record_fallback(self.stage)
+            # The nurse may already be asking the streamed question; keep it consistent
+            return question or "Continue.", "Error", False, None
 
 class AnswerHighlighterAgent(BaseLogicAgent):
+    stage = "highlighter"
+
     def __init__(self):
         super().__init__()
-        self.response_schema = {"type": "ARRAY", "items": {"type": "OBJECT", "properties": {"level": { "type": "STRING", "enum": ["danger", "warning"] }, "text": { "type": "STRING" }}, "required": ["level", "text"]}}
-        try:
-            with open("patient_profile/highlight_agent.md", "r", encoding="utf-8") as f: self.system_instruction = f.read()
-        except: self.system_instruction = "Extract keywords."
+        self.response_schema = response_models.HIGHLIGHTS_SCHEMA
+        self.system_instruction = load_prompt("patient_profile/highlight_agent.md", "Extract keywords.")
+
+    def local_highlights(self, patient_answer: str, diagnosis_list: list):
+        """Immediate keyword highlights from the diagnoses' indicators (no model call)."""
+        return highlight_matcher.local_highlights(patient_answer, diagnosis_list)
 
     async def highlight_text(self, patient_answer: str, diagnosis_list: list):
         if not patient_answer or len(patient_answer) < 3: return []
-        prompt = f"Context:\n{json.dumps(diagnosis_list)}\n\nAnswer:\n\"{patient_answer}\""
+        prompt = f"Context:\n{serializer.dumps(diagnosis_list)}\n\nAnswer:\n\"{patient_answer}\""
         try:
-            response = await self.client.aio.models.generate_content(
+            response = await self._generate(
                 model="gemini-2.5-flash-lite", contents=prompt,
                 config=types.GenerateContentConfig(response_mime_type="application/json", response_schema=self.response_schema, system_instruction=self.system_instruction, temperature=0.0)
             )
-            return json.loads(response.text)
-        except: return []
+            return response_models.parse(self.stage, response, response_models.validate_highlights, patient_answer)
+        except:
+            # None (not []) so callers can tell a failed call from "nothing to highlight"
+            telemetry.record_fallback(self.stage)
+            return None
+
+class TextChatAgent(BaseLogicAgent):
+    """Text-only counterpart of TextBridgeAgent for headless runs: same prompt, no audio."""
+    def __init__(self, name, system_instruction, model=CHAT_MODEL):
+        super().__init__()
+        self.name = name
+        self.stage = name.lower()
+        self.system_instruction = system_instruction
+        self.model = model
+        self.contents = []
+
+    async def reply(self, text_input):
+        self.contents.append(types.Content(role="user", parts=[types.Part(text=text_input)]))
+        try:
+            response = await self._generate(
+                model=self.model, contents=self.contents,
+                config=types.GenerateContentConfig(system_instruction=self.system_instruction, temperature=0.7)
+            )
+            text = (response.text or "").strip()
+        except Exception as e:
+            logger.error(f"Chat Error ({self.name}): {e}")
+            telemetry.record_fallback(self.stage)
+            text = ""
+        self.contents.append(types.Content(role="model", parts=[types.Part(text=text or "...")]))
+        return text
 
 class TextBridgeAgent:
     def __init__(self, name, system_instruction, voice_name):
@@ -150,6 +258,8 @@ class TextBridgeAgent:
             location=os.getenv("PROJECT_LOCATION", "us-central1")
         )
         self.session = None
+        self.first_audio_at = None  # perf_counter() of the first audio chunk sent
+        self.last_turn_id = None
 
     def get_connection_context(self):
         config = types.LiveConnectConfig(
@@ -167,6 +277,17 @@ class TextBridgeAgent:
     def set_session(self, session):
         self.session = session
 
+    async def seed_history(self, history):
+        """Gives a fresh Live session the conversation so far (e.g. after a resume) without asking for a reply."""
+        if not self.session or not history:
+            return
+        turns = [types.Content(role="model" if e["speaker"] == self.name else "user", parts=[types.Part(text=e["text"])])
+                 for e in history if e.get("text")]
+        try:
+            await self.session.send(input=types.LiveClientContent(turns=turns, turn_complete=False))
+        except Exception as e:
+            logger.error(f"{self.name} History Seed Error: {e}")
+
     async def speak_and_stream(self, text_input, websocket: WebSocket, highlighter=None, diagnosis_context=None):
         if not self.session: return None, []
         
@@ -176,11 +297,19 @@ class TextBridgeAgent:
             return None, []
 
         turn_id = str(uuid.uuid4())
+        self.last_turn_id = turn_id
         text_accumulator = []
+        sent_at = time.perf_counter()
+        first_chunk = True
         
         try:
             async for response in self.session.receive():
                 if data := response.data:
+                    if first_chunk:
+                        first_chunk = False
+                        telemetry.METRICS.observe("medforce_voice_first_chunk_seconds", time.perf_counter() - sent_at, speaker=self.name)
+                    if self.first_audio_at is None:
+                        self.first_audio_at = time.perf_counter()
                     b64_audio = base64.b64encode(data).decode('utf-8')
                     await websocket.send_json({
                         "type": "audio",
@@ -201,6 +330,7 @@ class TextBridgeAgent:
                         })
 
                 if response.server_content and response.server_content.turn_complete:
+                    telemetry.METRICS.observe("medforce_voice_turn_seconds", time.perf_counter() - sent_at, speaker=self.name)
                     await websocket.send_json({
                         "type": "turn_complete",
                         "id": turn_id,
@@ -209,10 +339,11 @@ class TextBridgeAgent:
                     
                     full_text = "".join(text_accumulator).strip()
                     if full_text:
+                        # Local matches only; the model refinement (if any) follows as a "highlights" patch
                         highlights = []
                         if highlighter and diagnosis_context:
                             try:
-                                highlights = await highlighter.highlight_text(full_text, diagnosis_context)
+                                highlights = highlighter.local_highlights(full_text, diagnosis_context)
                             except: pass
 
                         await websocket.send_json({
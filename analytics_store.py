@@ -0,0 +1,442 @@
+# --- analytics_store.py ---
+# Append-only columnar store of finished sessions for cross-session analytics:
+# final diagnoses, question outcomes and turn timings. Columns are typed arrays
+# (array module, same layout as NumPy vectors); strings (patient, did, qid, stage, ...)
+# are dictionary-encoded to integer codes. Every process appends to its own segment
+# directory (<ANALYTICS_DIR>/seg-<host>-<pid>-<ts>/<table>.<column>.col + strings.jsonl)
+# and loads all segments at startup.
+#
+# Aggregates over all patients are maintained incrementally per source ("live" sessions,
+# "batch" runs); per-patient ones slice the child rows of that patient's sessions.
+# Queries cover live sessions unless another source (or None = all) is asked for. A
+# session recorded again (resumed after a disconnect) supersedes its earlier row.
+#
+#   get_store().record_session(...)    -> one session (SimulationManager / batch_runner)
+#   get_store().diagnosis_frequency()  / question_ask_rates() / turn_latency() / summary()
+import os
+import glob
+import time
+import socket
+import logging
+import threading
+from array import array
+from collections import Counter
+from itertools import compress
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import serializer
+
+logger = logging.getLogger("medforce-backend")
+
+ANALYTICS_DIR = os.getenv("ANALYTICS_DIR", "analytics")
+ANALYTICS_ENABLED = os.getenv("ANALYTICS", "1") == "1"
+
+# table -> column -> array typecode; CATEGORICAL columns hold string-dictionary codes
+TABLES = {
+    "sessions": {"session_id": "I", "patient": "I", "source": "I", "started": "d", "duration_ms": "I",
+                 "cycles": "H", "turns": "H", "ended": "B"},
+    "diagnoses": {"session": "I", "did": "I", "label": "I", "rank": "H", "indicators": "H", "severity": "I"},
+    "questions": {"session": "I", "qid": "I", "status": "I", "answered": "B"},
+    "turns": {"session": "I", "stage": "I", "ms": "I"},
+}
+CHILD_TABLES = ("diagnoses", "questions", "turns")
+CATEGORICAL = {"session_id", "patient", "source", "did", "label", "severity", "qid", "status", "stage"}
+
+# Spans from telemetry.TRACES kept as turn timings
+TURN_STAGES = ("nurse_turn", "patient_turn", "advisor")
+
+def _percentiles(hist: Counter, ps=(50, 95, 99)) -> Dict:
+    """Percentiles from a value -> count histogram (nearest rank)."""
+    live = sorted((v, c) for v, c in hist.items() if c > 0)
+    n = sum(c for _, c in live)
+    if not n:
+        return {"count": 0}
+    out = {"count": n, "mean_ms": round(sum(v * c for v, c in live) / n, 1)}
+    targets = sorted((max(1, -(-p * n // 100)), p) for p in ps)
+    running, i = 0, 0
+    for value, c in live:
+        running += c
+        while i < len(targets) and running >= targets[i][0]:
+            out[f"p{targets[i][1]}_ms"] = value
+            i += 1
+    return out
+
+class StringDict:
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def code(self, value) -> int:
+        value = "" if value is None else str(value)
+        c = self.codes.get(value)
+        if c is None:
+            c = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return c
+
+class _Aggregates:
+    """Incremental counters of one source's current (non-superseded) sessions."""
+    def __init__(self):
+        self.sessions = 0
+        self.did_counts, self.did_sessions = Counter(), Counter()
+        self.q_seen, self.q_asked, self.q_answered, self.q_deleted = Counter(), Counter(), Counter(), Counter()
+        self.stage_ms: Dict[int, Counter] = {}
+
+    def merge(self, other: "_Aggregates") -> "_Aggregates":
+        self.sessions += other.sessions
+        for name in ("did_counts", "did_sessions", "q_seen", "q_asked", "q_answered", "q_deleted"):
+            getattr(self, name).update(getattr(other, name))
+        for stage, hist in other.stage_ms.items():
+            self.stage_ms.setdefault(stage, Counter()).update(hist)
+        return self
+
+class AnalyticsStore:
+    def __init__(self, directory: str = ANALYTICS_DIR):
+        self.directory = directory
+        self.strings = StringDict()
+        self.cols: Dict[str, Dict[str, array]] = {t: {c: array(tc) for c, tc in cols.items()} for t, cols in TABLES.items()}
+        self._lock = threading.Lock()
+        # Child rows of session r are starts[t][r] .. starts[t][r + 1] (or the end of the table)
+        self._starts: Dict[str, array] = {t: array("I") for t in CHILD_TABLES}
+        self._latest: Dict[int, int] = {}      # session_id code -> its current row
+        self._superseded = set()               # session rows replaced by a later record
+        self._segment = None
+        self._seg_codes: Dict[int, int] = {}   # global string code -> segment-local code
+        self._seg_base = 0                     # first global session row of this segment
+        self._seg_offsets: Dict[str, int] = {} # segment path -> first global session row (from _load)
+        # Incremental aggregates for the all-patient queries, per source code
+        self._aggs: Dict[int, _Aggregates] = {}
+        self._labels: Dict[int, int] = {}
+        self._load()
+
+    # ---------------------------------------------------------
+    # WRITE
+    # ---------------------------------------------------------
+    def record_session(self, session_id: str, patient_id: str, diagnoses: Iterable[Dict], questions: Iterable[Dict],
+                       turn_spans: Iterable[Dict] = (), cycles: int = 0, turns: int = 0, ended: bool = False,
+                       started: float = None, duration: float = 0.0, source: str = "live") -> int:
+        """Appends one session (final diagnoses, questions, turn spans); returns its row."""
+        with self._lock:
+            code = self.strings.code
+            row = len(self.cols["sessions"]["session_id"])
+            rows = {
+                "sessions": [(code(session_id), code(patient_id), code(source), started or time.time(), int(duration * 1000),
+                              min(cycles, 65535), min(turns, 65535), int(bool(ended)))],
+                "diagnoses": [(row, code(d.get("did")), code(d.get("diagnosis")), min(int(d.get("rank") or i + 1), 65535),
+                               min(len(d.get("indicators_point") or ()), 65535), code(d.get("severity")))
+                              for i, d in enumerate(diagnoses)],
+                "questions": [(row, code(q.get("qid")), code(q.get("status")), int(q.get("answer") is not None))
+                              for q in questions],
+                "turns": [(row, code(s["stage"]), int(s.get("duration", 0) * 1000))
+                          for s in turn_spans if s.get("stage") in TURN_STAGES],
+            }
+            for table, values in rows.items():
+                if values:
+                    self._extend(table, dict(zip(TABLES[table], zip(*values))))
+            self._index_sessions(row, {t: {row: len(rows[t])} for t in CHILD_TABLES})
+            self._persist(rows)
+        return row
+
+    def _extend(self, table: str, columns: Dict[str, Sequence]):
+        cols = self.cols[table]
+        for name, values in columns.items():
+            cols[name].extend(values)
+        self._aggregate(table, columns)
+
+    def _index_sessions(self, first_row: int, child_counts: Dict[str, Dict[int, int]]):
+        """Child row offsets for the session rows appended from first_row, and supersedes
+        older rows of the same session_id. Child tables must already hold the new rows."""
+        n = len(self.cols["sessions"]["session_id"])
+        for table in CHILD_TABLES:
+            starts, counts = self._starts[table], child_counts[table]
+            pos = len(self.cols[table]["session"]) - sum(counts.values())
+            for r in range(first_row, n):
+                starts.append(pos)
+                pos += counts.get(r, 0)
+        ids = self.cols["sessions"]["session_id"]
+        for r in range(first_row, n):
+            previous = self._latest.get(ids[r])
+            if previous is not None:
+                self._supersede(previous)
+            self._latest[ids[r]] = r
+
+    def _child_slice(self, table: str, row: int) -> slice:
+        starts = self._starts[table]
+        end = starts[row + 1] if row + 1 < len(starts) else len(self.cols[table]["session"])
+        return slice(starts[row], end)
+
+    def _supersede(self, row: int):
+        self._superseded.add(row)
+        self._aggs[self.cols["sessions"]["source"][row]].sessions -= 1
+        for table in CHILD_TABLES:
+            s = self._child_slice(table, row)
+            if s.stop > s.start:
+                self._aggregate(table, {name: col[s] for name, col in self.cols[table].items()}, sign=-1)
+
+    def _by_source(self, table: str, c: Dict[str, Sequence]):
+        """Splits rows into (source code, columns) groups; one group in the usual case."""
+        if table == "sessions":
+            sources = c["source"]
+        else:
+            source_of = self.cols["sessions"]["source"]
+            sources = [source_of[s] for s in c["session"]]
+        distinct = set(sources)
+        if len(distinct) == 1:
+            yield distinct.pop(), c
+            return
+        for source in distinct:
+            mask = [s == source for s in sources]
+            yield source, {name: list(compress(col, mask)) for name, col in c.items()}
+
+    def _aggregate(self, table: str, c: Dict[str, Sequence], sign: int = 1):
+        def add(counter: Counter, values):
+            counter.update(values) if sign > 0 else counter.subtract(values)
+
+        if table == "diagnoses" and sign > 0:
+            self._labels.update(zip(c["did"], c["label"]))
+        for source, c in self._by_source(table, c):
+            agg = self._aggs.setdefault(source, _Aggregates())
+            if table == "sessions":
+                agg.sessions += len(c["source"]) * sign
+            elif table == "diagnoses":
+                add(agg.did_counts, c["did"])
+                add(agg.did_sessions, [did for _, did in set(zip(c["session"], c["did"]))])
+            elif table == "questions":
+                asked, deleted = self.strings.code("asked"), self.strings.code("deleted")
+                add(agg.q_seen, c["qid"])
+                add(agg.q_asked, compress(c["qid"], map(asked.__eq__, c["status"])))
+                add(agg.q_deleted, compress(c["qid"], map(deleted.__eq__, c["status"])))
+                add(agg.q_answered, compress(c["qid"], c["answered"]))
+            elif table == "turns":
+                for (stage, ms), n in Counter(zip(c["stage"], c["ms"])).items():
+                    agg.stage_ms.setdefault(stage, Counter())[ms] += n * sign
+
+    def _local_code(self, code: int, new: List[str]) -> int:
+        local = self._seg_codes.get(code)
+        if local is None:
+            local = self._seg_codes[code] = len(self._seg_codes)
+            new.append(self.strings.values[code])
+        return local
+
+    def _persist(self, rows: Dict[str, List[tuple]]):
+        """Appends rows to this process's segment, re-coded to its own string dictionary."""
+        try:
+            if self._segment is None:
+                self._segment = os.path.join(self.directory, f"seg-{socket.gethostname()}-{os.getpid()}-{int(time.time())}")
+                self._seg_base = len(self.cols["sessions"]["session_id"]) - 1  # rows are already in memory
+                os.makedirs(self._segment, exist_ok=True)
+            new, columns = [], []
+            for table, values in rows.items():
+                for (name, tc), column in zip(TABLES[table].items(), zip(*values)):
+                    if name in CATEGORICAL:
+                        column = [self._local_code(c, new) for c in column]
+                    elif name == "session":
+                        column = [r - self._seg_base for r in column]
+                    columns.append((f"{table}.{name}.col", array(tc, column)))
+            # Strings first: a crash between files leaves codes defined but rows unreferenced
+            if new:
+                with open(os.path.join(self._segment, "strings.jsonl"), "ab") as f:
+                    f.write(b"".join(serializer.dumps_bytes(v) + b"\n" for v in new))
+            for filename, column in columns:
+                with open(os.path.join(self._segment, filename), "ab") as f:
+                    f.write(column.tobytes())
+        except OSError as e:
+            logger.error(f"Analytics Persist Error: {e}")
+
+    def _adopt_segment(self, old: "AnalyticsStore"):
+        """Keeps appending to `old`'s segment (already loaded from disk by this store) rather
+        than starting another one, re-deriving its string codes and first session row."""
+        if old._segment is None or old._segment not in self._seg_offsets:
+            return
+        self._segment = old._segment
+        self._seg_base = self._seg_offsets[old._segment]
+        self._seg_codes = {self.strings.code(old.strings.values[g]): local for g, local in old._seg_codes.items()}
+
+    # ---------------------------------------------------------
+    # LOAD
+    # ---------------------------------------------------------
+    def _load(self):
+        start = time.perf_counter()
+        for segment in sorted(glob.glob(os.path.join(self.directory, "seg-*"))):
+            try:
+                self._load_segment(segment)
+            except Exception as e:
+                logger.error(f"Analytics Segment Error ({segment}): {e}")
+        n = len(self.cols["sessions"]["session_id"])
+        if n:
+            logger.info(f"📊 Analytics loaded {n} sessions in {time.perf_counter() - start:.2f}s")
+
+    def _read_table(self, segment: str, table: str, remap: array, offset: int, max_session: int) -> Dict[str, array]:
+        loaded = {}
+        for name, tc in TABLES[table].items():
+            col = array(tc)
+            path = os.path.join(segment, f"{table}.{name}.col")
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    data = f.read()
+                col.frombytes(data[:len(data) - len(data) % col.itemsize])
+            loaded[name] = col
+        n = min(map(len, loaded.values()))  # drop a partially written tail row
+        if "session" in loaded:
+            # ...and child rows of a session row that was cut off
+            while n and loaded["session"][n - 1] >= max_session:
+                n -= 1
+        for name, col in loaded.items():
+            if len(col) > n:
+                del col[n:]
+            if name in CATEGORICAL:
+                loaded[name] = array("I", map(remap.__getitem__, col))
+            elif name == "session" and offset:
+                loaded[name] = array("I", (v + offset for v in col))
+        return loaded
+
+    def _load_segment(self, segment: str):
+        with open(os.path.join(segment, "strings.jsonl"), "rb") as f:
+            remap = array("I", (self.strings.code(serializer.loads(line)) for line in f))
+        # Segment-local session rows are offset by the sessions already loaded
+        offset = self._seg_offsets[segment] = len(self.cols["sessions"]["session_id"])
+        sessions = self._read_table(segment, "sessions", remap, 0, 0)
+        n = len(sessions["session_id"])
+        if not n:
+            return
+        self._extend("sessions", sessions)
+        child_counts = {}
+        for table in CHILD_TABLES:
+            loaded = self._read_table(segment, table, remap, offset, n)
+            self._extend(table, loaded)
+            child_counts[table] = Counter(loaded["session"])
+        self._index_sessions(offset, child_counts)
+
+    # ---------------------------------------------------------
+    # QUERIES
+    # ---------------------------------------------------------
+    def _rows(self, patient_id: Optional[str], source: Optional[str]) -> List[int]:
+        """Current session rows of a patient and/or source (None = any)."""
+        sessions = self.cols["sessions"]
+        rows = None  # all rows
+        for name, value in (("patient", patient_id), ("source", source)):
+            if value is None:
+                continue
+            code = self.strings.codes.get(value)
+            if code is None:
+                return []
+            column = sessions[name]
+            if rows is None:
+                rows = list(compress(range(len(column)), map(code.__eq__, column)))
+            else:
+                rows = [r for r in rows if column[r] == code]
+        if rows is None:
+            rows = range(len(sessions["session_id"]))
+        return [r for r in rows if r not in self._superseded]
+
+    def _totals(self, source: Optional[str]) -> _Aggregates:
+        """Incremental aggregates of one source, or of all sources summed (source=None)."""
+        if source is not None:
+            return self._aggs.get(self.strings.codes.get(source)) or _Aggregates()
+        total = _Aggregates()
+        for agg in self._aggs.values():
+            total.merge(agg)
+        return total
+
+    def _gather(self, table: str, rows: List[int], *names) -> List[list]:
+        """Columns of the child rows of the given sessions."""
+        out = [[] for _ in names]
+        cols = [self.cols[table][name] for name in names]
+        for r in rows:
+            s = self._child_slice(table, r)
+            for values, col in zip(out, cols):
+                values.extend(col[s])
+        return out
+
+    def diagnosis_frequency(self, patient_id: Optional[str] = None, top: int = 20, source: Optional[str] = "live") -> Dict:
+        """Most frequent final diagnoses (by did): count and share of sessions."""
+        with self._lock:
+            if patient_id is None:
+                totals = self._totals(source)
+                sessions, counts, per_session = totals.sessions, totals.did_counts, totals.did_sessions
+            else:
+                rows = self._rows(patient_id, source)
+                session, did = self._gather("diagnoses", rows, "session", "did")
+                sessions, counts = len(rows), Counter(did)
+                per_session = Counter(d for _, d in set(zip(session, did)))
+            values = self.strings.values
+            return {"sessions": sessions, "patient_id": patient_id, "source": source, "diagnoses": [
+                {"did": values[did], "diagnosis": values[self._labels.get(did, did)], "count": n,
+                 "session_rate": round(per_session[did] / sessions, 4) if sessions else 0.0}
+                for did, n in counts.most_common(top) if n > 0
+            ]}
+
+    def question_ask_rates(self, patient_id: Optional[str] = None, top: int = 50, source: Optional[str] = "live") -> Dict:
+        """Per qid: sessions it appeared in, and how often it was asked, answered or deleted."""
+        with self._lock:
+            if patient_id is None:
+                totals = self._totals(source)
+                seen, asked, answered, deleted = totals.q_seen, totals.q_asked, totals.q_answered, totals.q_deleted
+                sessions = totals.sessions
+            else:
+                rows = self._rows(patient_id, source)
+                qid, status, ans = self._gather("questions", rows, "qid", "status", "answered")
+                asked_code, deleted_code = self.strings.code("asked"), self.strings.code("deleted")
+                seen, answered = Counter(qid), Counter(compress(qid, ans))
+                asked = Counter(compress(qid, map(asked_code.__eq__, status)))
+                deleted = Counter(compress(qid, map(deleted_code.__eq__, status)))
+                sessions = len(rows)
+            values = self.strings.values
+            ranked = sorted(((q, n) for q, n in seen.items() if n > 0), key=lambda kv: (-asked[kv[0]], -kv[1]))
+            return {"sessions": sessions, "patient_id": patient_id, "source": source, "questions": [
+                {"qid": values[q], "seen": n, "asked": asked[q], "answered": answered[q], "deleted": deleted[q],
+                 "ask_rate": round(asked[q] / n, 4), "answer_rate": round(answered[q] / n, 4)}
+                for q, n in ranked[:top]
+            ]}
+
+    def turn_latency(self, patient_id: Optional[str] = None, source: Optional[str] = "live") -> Dict:
+        """p50/p95/p99 (ms) of nurse turn, patient turn and advisor durations."""
+        with self._lock:
+            if patient_id is None:
+                hists = self._totals(source).stage_ms
+            else:
+                hists = {}
+                stage, ms = self._gather("turns", self._rows(patient_id, source), "stage", "ms")
+                for (s, v), n in Counter(zip(stage, ms)).items():
+                    hists.setdefault(s, Counter())[v] += n
+            values = self.strings.values
+            return {"patient_id": patient_id, "source": source,
+                    "stages": {values[s]: _percentiles(h) for s, h in hists.items()}}
+
+    def summary(self) -> Dict:
+        with self._lock:
+            s = self.cols["sessions"]
+            n = len(s["session_id"]) - len(self._superseded)
+            if self._superseded:
+                live = [r for r in range(len(s["session_id"])) if r not in self._superseded]
+                pick = lambda col: [col[r] for r in live]
+            else:
+                pick = lambda col: col
+            return {
+                "sessions": n,
+                "by_source": {self.strings.values[code]: agg.sessions for code, agg in self._aggs.items() if agg.sessions},
+                "superseded": len(self._superseded),
+                "patients": len(set(pick(s["patient"]))),
+                "rows": {t: len(cols[next(iter(cols))]) for t, cols in self.cols.items()},
+                "strings": len(self.strings.values),
+                "bytes": sum(c.itemsize * len(c) for cols in self.cols.values() for c in cols.values()),
+                "mean_cycles": round(sum(pick(s["cycles"])) / n, 2) if n else None,
+                "ended_by_advisor_rate": round(sum(pick(s["ended"])) / n, 4) if n else None,
+                "segment": self._segment,
+            }
+
+_store: Optional[AnalyticsStore] = None
+_store_lock = threading.Lock()
+
+def get_store(reload: bool = False) -> AnalyticsStore:
+    """Process-wide store; reload=True rescans all segments (e.g. other workers' appends)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = AnalyticsStore()
+        elif reload:
+            old = _store
+            with old._lock:  # no appends to this process's segment while it is re-read
+                _store = AnalyticsStore(old.directory)
+                _store._adopt_segment(old)
+        return _store
@@ -0,0 +1,256 @@
+# --- batch_runner.py ---
+# Headless, text-only simulation of many patient interviews for regression runs of
+# the clinical logic. Nurse and patient speak through text model calls (no Live
+# audio, no WebSocket); logic runs inline once per cycle. One JSONL line per interview.
+# Batch interviews are kept out of telemetry.TRACES; jobs started from the admin API run
+# on their own thread and event loop, away from live sessions.
+#
+#   python batch_runner.py [PID ...] [--cycles 12] [--concurrency 4] [--out batch.jsonl]
+#   (no PIDs = every patient under patient_profile/)
+import os
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+import threading
+import statistics
+from typing import Dict, List, Optional
+
+from google.cloud import storage
+
+# Local Imports
+import agents
+import analytics_store
+import recorder
+import serializer
+import snapshot_store
+import telemetry
+import question_manager
+import diagnosis_manager
+from simulation import TranscriptManager, QUESTION_LIST, NURSE_PROMPT, run_logic_cycle
+from utils import fetch_gcs_texts_async
+
+logger = logging.getLogger("medforce-backend")
+
+BATCH_DIR = os.getenv("BATCH_DIR", "batches")
+# Finished jobs are kept for polling this long, and at most MAX_JOBS jobs overall
+JOB_TTL = float(os.getenv("BATCH_JOB_TTL", "3600"))
+MAX_JOBS = int(os.getenv("BATCH_MAX_JOBS", "50"))
+# Upper bounds for jobs started from the admin API (each interview in flight runs several model calls)
+MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+MAX_CYCLES = int(os.getenv("BATCH_MAX_CYCLES", "30"))
+
+# USD per 1M tokens (input, output); list prices, used for the per-interview cost estimate
+MODEL_PRICES = {
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+}
+
+def estimate_cost(usage: Dict[str, Dict]) -> float:
+    total = 0.0
+    for model, u in usage.items():
+        price_in, price_out = MODEL_PRICES.get(model, (0.0, 0.0))
+        total += u["prompt_tokens"] / 1e6 * price_in + u["completion_tokens"] / 1e6 * price_out
+    return round(total, 6)
+
+def list_patient_ids() -> List[str]:
+    blobs = storage.Client().list_blobs(snapshot_store.BUCKET_NAME, prefix="patient_profile/", delimiter="/")
+    list(blobs)
+    return sorted(p.rstrip('/').split('/')[-1] for p in blobs.prefixes)
+
+# ---------------------------------------------------------
+# ONE INTERVIEW
+# ---------------------------------------------------------
+async def run_interview(patient_id: str, max_cycles: int = 12) -> Dict:
+    """Runs one text-only interview and returns its record (transcript, diagnoses, questions, usage)."""
+    usage = {}
+    session_id = f"batch-{patient_id}-{uuid.uuid4().hex[:8]}"
+    telemetry.usage_sink.set(usage)
+    telemetry.current_session.set(session_id)  # still keys recordings (recorder.py)
+    telemetry.trace_enabled.set(False)
+    start = time.perf_counter()
+
+    try:
+        patient_prompt, patient_info = await fetch_gcs_texts_async(patient_id, ["patient_system.md", "patient_info.md"])
+        if patient_info.startswith("System: Error"):
+            raise RuntimeError(patient_info)
+
+        tm = TranscriptManager()
+        dm = diagnosis_manager.DiagnosisManager()
+        qm = question_manager.QuestionPoolManager([])
+        nurse = agents.TextChatAgent("NURSE", NURSE_PROMPT)
+        patient = agents.TextChatAgent("PATIENT", patient_prompt)
+        advisor = agents.AdvisorAgent(patient_info=patient_info)
+        highlighter = agents.AnswerHighlighterAgent()
+        diagnoser = agents.DiagnoseAgent(patient_info=patient_info)
+        evaluator = agents.DiagnoseEvaluatorAgent()
+        ranker = agents.QuestionRankingAgent(patient_info=patient_info)
+
+        # Initial state: stored snapshot when available, same as a live session
+        snapshot = await asyncio.to_thread(snapshot_store.load_snapshot, patient_id, patient_info, QUESTION_LIST)
+        if snapshot is None:
+            snapshot = await snapshot_store.compute_initial_state(patient_info, QUESTION_LIST, diagnoser, evaluator, ranker)
+        qm = snapshot_store.apply_snapshot(snapshot, dm, qm)
+        ranked = qm.get_recommend_question()
+
+        next_instruction = "Intoduce yourself and tell the patient you have patient data and will asked further question for detailed health condition."
+        patient_last_words = "Hello."
+        interview_end, last_qid, cycles = False, None, 0
+
+        while cycles < max_cycles:
+            # 1. NURSE
+            nurse_text = await nurse.reply(f"Patient said: '{patient_last_words}'\n[SUPERVISOR: {next_instruction}]")
+            tm.log("NURSE", nurse_text or "[The nurse waits]")
+
+            # 2. PATIENT
+            patient_text = await patient.reply(nurse_text or "[The nurse waits]")
+            patient_last_words = patient_text or "(Silent)"
+            patient_text = patient_text or "[The patient nods]"
+            if last_qid:
+                qm.update_answer(last_qid, patient_text)
+            tm.log("PATIENT", patient_text, highlight_data=highlighter.local_highlights(
+                patient_text, dm.get_consolidated_diagnoses_basic()))
+
+            # 3. LOGIC (inline; the live logic thread does the same pass in the background)
+            await run_logic_cycle(tm.get_history(), dm, qm, diagnoser, evaluator, ranker, cycles)
+            ranked = qm.get_recommend_question()
+            cycles += 1
+            if interview_end:
+                break
+
+            # 4. ADVISOR
+            question, reasoning, interview_end, qid = await advisor.get_advise(tm.get_history(), ranked)
+            if qid:
+                qm.update_status(qid, "asked")
+                last_qid = qid
+            next_instruction = question or "Continue assessment."
+
+        if analytics_store.ANALYTICS_ENABLED:
+            await asyncio.to_thread(
+                analytics_store.get_store().record_session, session_id, patient_id,
+                dm.get_consolidated_diagnoses(), qm.get_questions(), cycles=cycles, turns=len(tm.history),
+                ended=bool(interview_end), duration=time.perf_counter() - start, source="batch",
+            )
+
+        return {
+            "session_id": session_id,
+            "patient_id": patient_id,
+            "cycles": cycles,
+            "ended_by_advisor": bool(interview_end),
+            "duration_s": round(time.perf_counter() - start, 3),
+            "transcript": tm.get_history(),
+            "diagnoses": dm.get_consolidated_diagnoses_basic(),
+            "questions": qm.get_questions(),
+            "merge_stats": dict(dm.merge_stats),
+            "usage": usage,
+            "cost_usd": estimate_cost(usage),
+        }
+    finally:
+        await asyncio.to_thread(recorder.end_session, session_id)
+
+# ---------------------------------------------------------
+# BATCH
+# ---------------------------------------------------------
+async def run_batch(pids: List[str], out_path: str, max_cycles: int = 12, concurrency: int = 4,
+                    progress: Optional[Dict] = None) -> Dict:
+    """Runs interviews with at most `concurrency` in flight, appending each record to out_path."""
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    sem = asyncio.Semaphore(max(1, concurrency))
+    results = []
+    start = time.perf_counter()
+
+    with open(out_path, "a", encoding="utf-8") as out:
+        async def one(pid):
+            async with sem:
+                try:
+                    record = await run_interview(pid, max_cycles)
+                    logger.info(f"🧪 {pid}: {record['cycles']} cycles, ${record['cost_usd']:.4f}, {record['duration_s']}s")
+                except Exception as e:
+                    logger.error(f"Batch Interview Error ({pid}): {e}")
+                    record = {"patient_id": pid, "error": str(e)}
+                out.write(serializer.dumps(record) + "\n")
+                out.flush()
+                results.append(record)
+                if progress is not None:
+                    progress["done"] = len(results)
+                    progress["failed"] = sum(1 for r in results if "error" in r)
+
+        await asyncio.gather(*(one(pid) for pid in pids))
+
+    wall = time.perf_counter() - start
+    ok = [r for r in results if "error" not in r]
+    return {
+        "interviews": len(results),
+        "failed": len(results) - len(ok),
+        "wall_s": round(wall, 2),
+        "interviews_per_min": round(len(ok) / wall * 60, 2) if wall else 0.0,
+        "median_duration_s": round(statistics.median(r["duration_s"] for r in ok), 2) if ok else None,
+        "total_cost_usd": round(sum(r["cost_usd"] for r in ok), 4),
+        "mean_cost_usd": round(sum(r["cost_usd"] for r in ok) / len(ok), 4) if ok else None,
+        "total_tokens": sum(u["prompt_tokens"] + u["completion_tokens"] for r in ok for u in r["usage"].values()),
+        "out_path": out_path,
+    }
+
+# ---------------------------------------------------------
+# BACKGROUND JOBS (admin API)
+# ---------------------------------------------------------
+JOBS: Dict[str, Dict] = {}
+_jobs_lock = threading.Lock()
+
+def _prune_jobs():
+    """Drops finished jobs past JOB_TTL, then the oldest finished ones beyond MAX_JOBS."""
+    now = time.time()
+    with _jobs_lock:
+        finished = sorted((j["ended"], job_id) for job_id, j in JOBS.items() if j.get("ended"))
+        for ended, job_id in finished:
+            if now - ended > JOB_TTL or len(JOBS) > MAX_JOBS:
+                del JOBS[job_id]
+
+def start_job(pids: List[str], max_cycles: int = 12, concurrency: int = 4) -> Dict:
+    """Starts a batch on its own thread and event loop; poll get_job() for progress and the summary.
+    max_cycles and concurrency are clamped to MAX_CYCLES and MAX_CONCURRENCY."""
+    _prune_jobs()
+    max_cycles = max(1, min(max_cycles, MAX_CYCLES))
+    concurrency = max(1, min(concurrency, MAX_CONCURRENCY))
+    job_id = uuid.uuid4().hex[:12]
+    job = {"job_id": job_id, "status": "running", "total": len(pids), "done": 0, "failed": 0,
+           "max_cycles": max_cycles, "concurrency": concurrency,
+           "out_path": os.path.join(BATCH_DIR, f"{job_id}.jsonl"), "started": time.time(), "ended": None, "summary": None}
+    with _jobs_lock:
+        JOBS[job_id] = job
+
+    def _run():
+        try:
+            job["summary"] = asyncio.run(run_batch(pids, job["out_path"], max_cycles, concurrency, progress=job))
+            job["status"] = "finished"
+        except Exception as e:
+            logger.error(f"Batch Job Error ({job_id}): {e}")
+            job["status"], job["error"] = "failed", str(e)
+        finally:
+            job["ended"] = time.time()
+
+    threading.Thread(target=_run, name=f"batch-{job_id}", daemon=True).start()
+    return job
+
+def get_job(job_id: str) -> Optional[Dict]:
+    _prune_jobs()
+    with _jobs_lock:
+        job = JOBS.get(job_id)
+        return dict(job) if job else None
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("pids", nargs="*")
+    ap.add_argument("--cycles", type=int, default=12)
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--out", default=os.path.join(BATCH_DIR, f"batch-{time.strftime('%Y%m%d-%H%M%S')}.jsonl"))
+    args = ap.parse_args()
+
+    pids = args.pids or list_patient_ids()
+    summary = asyncio.run(run_batch(pids, args.out, args.cycles, args.concurrency))
+    print(serializer.dumps(summary))
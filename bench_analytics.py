@@ -0,0 +1,82 @@
+# --- bench_analytics.py ---
+# Benchmark for analytics_store: appends synthetic sessions, reloads them from disk
+# and times the cohort queries.
+#   python bench_analytics.py [sessions] [patients]
+import sys
+import time
+import random
+import tempfile
+
+import analytics_store
+
+DIAGNOSES = [(f"D{i}", label) for i, label in enumerate(
+    ("Hepatitis B", "Hepatitis C", "Alcoholic liver disease", "NAFLD", "Autoimmune hepatitis", "Cholestasis",
+     "Drug-induced liver injury", "Hemochromatosis", "Wilson disease", "Primary biliary cholangitis"))]
+QIDS = [f"{i:08x}" for i in range(120)]
+
+def make_session(i, patients, rng):
+    cycles = rng.randint(3, 12)
+    diagnoses = [{"did": did, "diagnosis": label, "rank": r + 1, "severity": rng.choice(["Low", "Moderate", "High"]),
+                  "indicators_point": ["x"] * rng.randint(1, 9)}
+                 for r, (did, label) in enumerate(rng.sample(DIAGNOSES, rng.randint(3, 8)))]
+    questions = [{"qid": qid, "status": rng.choice(["asked", "deleted", None]), "answer": "yes" if rng.random() < 0.4 else None}
+                 for qid in rng.sample(QIDS, rng.randint(15, 40))]
+    spans = [{"stage": stage, "duration": rng.lognormvariate(0.5 if stage != "advisor" else -0.5, 0.4)}
+             for _ in range(cycles) for stage in analytics_store.TURN_STAGES]
+    return dict(session_id=f"S{i}", patient_id=f"P{i % patients:04d}", diagnoses=diagnoses, questions=questions,
+                turn_spans=spans, cycles=cycles, turns=cycles * 2, ended=rng.random() < 0.3, duration=cycles * 8.0)
+
+def timed(label, fn, repeat=3):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:<34}{best * 1000:>9.1f} ms")
+    return result
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    patients = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    rng = random.Random(0)
+    directory = tempfile.mkdtemp(prefix="bench_analytics_")
+
+    store = analytics_store.AnalyticsStore(directory)
+    sessions = [make_session(i, patients, rng) for i in range(n)]
+    start = time.perf_counter()
+    for s in sessions:
+        store.record_session(**s)
+    elapsed = time.perf_counter() - start
+    # A resumed session recorded again replaces its first row
+    store.record_session(**{**sessions[0], "cycles": 99})
+    print(f"appended {n} sessions in {elapsed:.2f}s ({n / elapsed:.0f}/s), {store.summary()['bytes'] / 1e6:.1f} MB in memory")
+
+    start = time.perf_counter()
+    store = analytics_store.AnalyticsStore(directory)
+    print(f"reloaded from {directory} in {time.perf_counter() - start:.2f}s: {store.summary()['rows']}")
+    assert store.summary()["sessions"] == n and store.summary()["superseded"] == 1
+
+    print("queries:")
+    timed("diagnosis_frequency()", store.diagnosis_frequency)
+    timed("question_ask_rates()", store.question_ask_rates)
+    latency = timed("turn_latency()", store.turn_latency)
+    timed("diagnosis_frequency(patient)", lambda: store.diagnosis_frequency("P0007"))
+    timed("question_ask_rates(patient)", lambda: store.question_ask_rates("P0007"))
+    timed("turn_latency(patient)", lambda: store.turn_latency("P0007"))
+    timed("summary()", store.summary)
+    for stage, stats in latency["stages"].items():
+        print(f"  {stage:<14}{stats}")
+
+    # Patient-filtered path agrees with the incremental aggregates on a one-patient store
+    single = analytics_store.AnalyticsStore(tempfile.mkdtemp(prefix="bench_analytics_"))
+    for s in sessions[:2000]:
+        single.record_session(**{**s, "patient_id": "P"})
+    single.record_session(**{**sessions[1], "patient_id": "P"})
+    for query in ("diagnosis_frequency", "question_ask_rates", "turn_latency"):
+        everyone, one = getattr(single, query)(), getattr(single, query)("P")
+        everyone.pop("patient_id"), one.pop("patient_id")
+        assert everyone == one, query
+    print("filtered/unfiltered consistency: ok")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# --- bench_load.py ---
+# Offline load test for /ws/simulation and the admin endpoints, with genai and GCS
+# replaced by in-process fakes (fakes.py). No network, no credentials.
+#
+#   python bench_load.py --sessions 200 --cycles 3 --latency 0.3 --jitter 0.1 --error-rate 0.02
+import os
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+
+def _pct(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+class FakeWebSocket:
+    """Minimal stand-in for fastapi.WebSocket driving one simulated client."""
+    def __init__(self, stats, patient_id, cycles):
+        self.stats = stats
+        self.cycles = cycles
+        self.client_state = type("State", (), {"name": "CONNECTED"})()
+        self._start = {"type": "start", "patient_id": patient_id, "gender": "Male"}
+        self._turns = 0
+        self._last_turn = None
+        self.opened = time.perf_counter()
+
+    async def accept(self):
+        pass
+
+    async def receive_json(self):
+        return self._start
+
+    async def send_text(self, text):
+        await self.send_json(json.loads(text))
+
+    async def send_json(self, data):
+        if self.client_state.name == "DISCONNECTED":
+            self.stats["dropped"] += 1  # client already gone; the server loop notices on its next check
+            return
+        now = time.perf_counter()
+        self.stats["messages"] += 1
+        if data.get("type") == "audio" and "first_audio" not in self.__dict__:
+            self.first_audio = now
+            self.stats["first_audio"].append(now - self.opened)
+        if data.get("type") == "turn" and data.get("data") == "finish cycle":
+            self.stats["turn_latency"].append(now - (self._last_turn or self.opened))
+            self._last_turn = now
+            self._turns += 1
+            if self._turns >= self.cycles:
+                self.client_state.name = "DISCONNECTED"
+
+async def _loop_lag_probe(samples, stop, interval=0.05):
+    while not stop.is_set():
+        t = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - t - interval)
+
+async def run_sessions(server, args, stats):
+    sem = asyncio.Semaphore(args.concurrency or args.sessions)
+    done = 0
+
+    async def one(i):
+        nonlocal done
+        async with sem:
+            ws = FakeWebSocket(stats, f"P{i % args.patients:04d}", args.cycles)
+            await server.websocket_endpoint(ws)
+            done += 1
+
+    await asyncio.gather(*(one(i) for i in range(args.sessions)))
+    return done
+
+async def run_admin(server, args):
+    """Hammers the (sync, threadpool-run) admin endpoints like FastAPI would."""
+    req = server.PatientFileRequest(pid="P0000", file_name="patient_info.md")
+    calls = [lambda: server.list_patient_files("P0000"), lambda: server.get_patient_file(req), server.list_patients]
+    t = time.perf_counter()
+    await asyncio.gather(*(asyncio.to_thread(calls[i % len(calls)]) for i in range(args.admin_requests)))
+    return args.admin_requests / (time.perf_counter() - t)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=0, help="max concurrent sessions (0 = all)")
+    ap.add_argument("--cycles", type=int, default=3, help="interview cycles per session")
+    ap.add_argument("--patients", type=int, default=20)
+    ap.add_argument("--latency", type=float, default=0.3)
+    ap.add_argument("--jitter", type=float, default=0.1)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--gcs-latency", type=float, default=0.02)
+    ap.add_argument("--admin-requests", type=int, default=500)
+    ap.add_argument("--verbose", action="store_true", help="keep app logging (injected errors are logged)")
+    ap.add_argument("--replay", help="serve model traffic from a recording (recorder.py) instead of the fake client")
+    ap.add_argument("--replay-speed", type=float, default=0.0, help="0 = full speed, 1 = recorded timing")
+    ap.add_argument("--advisor-stream", choices=["0", "1"], default=os.getenv("ADVISOR_STREAM", "1"),
+                    help="stream the advisor (compare turn latency / time to first audio with 0)")
+    args = ap.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_load_")
+    os.environ.setdefault("SESSION_DB", os.path.join(tmp_dir, "sessions.db"))
+    os.environ.setdefault("ANALYTICS_DIR", os.path.join(tmp_dir, "analytics"))
+    os.environ.setdefault("CLUSTER_BACKEND", "local")
+    os.environ["ADVISOR_STREAM"] = args.advisor_stream
+
+    import fakes
+    cfg, store = fakes.install(
+        fakes.FakeGenAIConfig(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=1),
+        fakes.FakeStorage(latency=args.gcs_latency),
+    )
+    replayer = None
+    if args.replay:
+        import recorder
+        replayer = recorder.install_replay(args.replay, args.replay_speed)
+    for i in range(args.patients):
+        store.seed_patient(f"P{i:04d}", f"# Patient P{i:04d}\nAge: {30 + i}\nComplaint: jaundice and fatigue",
+                           "You are the patient. Answer briefly.")
+
+    import logging
+    logging.getLogger("medforce-backend").setLevel(logging.INFO if args.verbose else logging.CRITICAL)
+    import server
+
+    stats = {"messages": 0, "dropped": 0, "turn_latency": [], "first_audio": []}
+    lag = []
+
+    async def drive():
+        stop = asyncio.Event()
+        probe = asyncio.create_task(_loop_lag_probe(lag, stop))
+        rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        t = time.perf_counter()
+        done = await run_sessions(server, args, stats)
+        wall = time.perf_counter() - t
+        rss1 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        admin_rps = await run_admin(server, args) if args.admin_requests else 0.0
+        stop.set()
+        await probe
+        return done, wall, (rss1 - rss0), admin_rps
+
+    done, wall, rss_kb, admin_rps = asyncio.run(drive())
+    concurrent = args.concurrency or args.sessions
+
+    print(f"sessions={done} cycles={args.cycles} concurrency={concurrent} "
+          f"latency={args.latency}±{args.jitter}s error_rate={args.error_rate}")
+    print(f"  sessions/sec        : {done / wall:8.2f}  (wall {wall:.1f}s)")
+    print(f"  messages/sec        : {stats['messages'] / wall:8.0f}  ({stats['dropped']} sent after disconnect)")
+    tl = stats["turn_latency"]
+    print(f"  turn latency (s)    : p50={_pct(tl, 50):.3f} p95={_pct(tl, 95):.3f} p99={_pct(tl, 99):.3f}")
+    fa = stats["first_audio"]
+    print(f"  time to first audio : p50={_pct(fa, 50):.3f} p95={_pct(fa, 95):.3f}")
+    print(f"  event-loop lag (ms) : p50={_pct(lag, 50) * 1000:.1f} p95={_pct(lag, 95) * 1000:.1f} "
+          f"max={max(lag, default=0) * 1000:.1f}")
+    print(f"  memory/session      : {rss_kb / max(1, concurrent):8.1f} KiB (peak RSS growth / concurrent sessions)")
+    print(f"  model calls         : {cfg.calls} ({cfg.errors} injected errors), GCS ops: {store.ops}")
+    import telemetry
+    q, head = telemetry.METRICS.get("medforce_advisor_question_seconds"), telemetry.METRICS.get("medforce_advisor_head_start_seconds")
+    if q:
+        print(f"  advisor question    : mean={q[1] / q[2]:.3f}s over {q[2]} turns (stream={args.advisor_stream})"
+              + (f", nurse head start mean={head[1] / head[2]:.3f}s" if head else ""))
+    if replayer:
+        print(f"  replay              : {replayer.stats}")
+    if args.admin_requests:
+        print(f"  admin req/sec       : {admin_rps:8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# --- bench_question_dedup.py ---
+# Benchmark for near-duplicate question detection on large pools.
+#   python bench_question_dedup.py [pool_size] [threshold]
+import sys
+import time
+import random
+
+from question_dedup import QuestionDeduplicator
+from question_manager import QuestionPoolManager
+
+SYLLABLES = ["ab", "an", "car", "di", "do", "gas", "hep", "kin", "lo", "ma", "neu", "os", "pan",
+             "pul", "ren", "sal", "tro", "ur", "vas", "zo", "cre", "fib", "gly", "lym", "my"]
+QUALIFIERS = ["onset", "duration", "severity", "frequency", "triggers", "location", "history",
+              "medication for", "family history of", "recent change in", "timing of", "relief of"]
+CONTEXT = ["left side", "right side", "at night", "after meals", "when walking", "at rest",
+           "in the morning", "during exercise", "since last week", "for months"]
+TEMPLATES = ["{q} {s} {c}", "Do you have {s} {c}?", "Any {q} {s} {c}?", "Tell me about {q} {s} {c}"]
+
+def make_terms(n, rng):
+    """Synthetic clinical terms so large pools stay lexically diverse."""
+    return ["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) + rng.choice(["itis", "osis", "algia", "emia", ""])
+            for _ in range(n)]
+
+def make_pool(n, rng):
+    terms = make_terms(max(100, n // 4), rng)
+    seen, pool = set(), []
+    while len(pool) < n:
+        text = rng.choice(TEMPLATES).format(q=rng.choice(QUALIFIERS), s=rng.choice(terms), c=rng.choice(CONTEXT))
+        if text not in seen:
+            seen.add(text)
+            pool.append(text)
+    return pool
+
+def paraphrase(text, rng):
+    words = text.rstrip("?").split()
+    rng.shuffle(words)
+    return ("Any " if rng.random() < 0.5 else "Do you have ") + " ".join(words) + "?"
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    threshold = float(sys.argv[2]) if len(sys.argv) > 2 else 0.75
+    rng = random.Random(42)
+    pool = make_pool(n, rng)
+    queries = [paraphrase(rng.choice(pool), rng) for _ in range(500)] + make_pool(500, random.Random(7))
+
+    dedup = QuestionDeduplicator(threshold)
+    t = time.perf_counter()
+    for i, text in enumerate(pool):
+        dedup.add(str(i), text)
+    build_s = time.perf_counter() - t
+
+    t = time.perf_counter()
+    fast = [dedup.find(q) for q in queries]
+    fast_s = time.perf_counter() - t
+
+    t = time.perf_counter()
+    slow = [dedup.find_brute_force(q) for q in queries]
+    slow_s = time.perf_counter() - t
+
+    agree = sum((a[1] if a else None) == (b[1] if b else None) for a, b in zip(fast, slow))
+    hits = sum(1 for a in fast if a)
+
+    # End-to-end: pool manager absorbing generated follow-ups
+    qm = QuestionPoolManager([], similarity_threshold=threshold)
+    t = time.perf_counter()
+    qm.add_questions_from_text(pool)
+    add_s = time.perf_counter() - t
+    t = time.perf_counter()
+    merged_before = len(qm.get_questions())
+    qm.add_questions_from_text(queries)
+    merge_s = time.perf_counter() - t
+
+    print(f"pool={n} threshold={threshold} queries={len(queries)}")
+    print(f"  index build        : {build_s * 1000:8.1f} ms ({build_s / n * 1e6:.1f} us/question)")
+    print(f"  indexed lookup     : {fast_s / len(queries) * 1e6:8.1f} us/query")
+    print(f"  brute-force lookup : {slow_s / len(queries) * 1e6:8.1f} us/query ({slow_s / fast_s:.0f}x slower)")
+    print(f"  agreement          : {agree}/{len(queries)}  matches: {hits}")
+    print(f"  pool add {n:>6}     : {add_s * 1000:8.1f} ms (kept {merged_before})")
+    print(f"  pool add queries   : {merge_s * 1000:8.1f} ms (new {len(qm.get_questions()) - merged_before})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# --- bench_serializer.py ---
+# Microbenchmark: stdlib json vs orjson on the payloads the app serializes.
+#   python bench_serializer.py [turns ...]
+import sys
+import json
+import time
+import base64
+import random
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+WORDS = ("yes the pain started about two weeks ago mostly after meals and my skin looks "
+         "more yellow than usual I have been very tired and my urine is dark").split()
+
+def make_transcript(turns, rng):
+    return [{"timestamp": f"10:{i // 60:02d}:{i % 60:02d}", "speaker": "NURSE" if i % 2 == 0 else "PATIENT",
+             "text": " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 40))),
+             **({"highlight": [{"level": "warning", "text": rng.choice(WORDS)}]} if i % 2 else {})}
+            for i in range(turns)]
+
+def make_questions(n, rng):
+    return [{"qid": f"{i:08x}", "content": f"Do you have {rng.choice(WORDS)} {rng.choice(WORDS)}?",
+             "status": rng.choice(["asked", None]), "rank": i + 1, "score": rng.randint(1, 10), "answer": None}
+            for i in range(n)]
+
+def make_diagnoses(n, rng):
+    return [{"did": f"D{i}", "diagnosis": f"Condition {i}", "indicators_point": rng.sample(WORDS, 5),
+             "indicators_count": 5, "probability": "High", "rank": i + 1} for i in range(n)]
+
+def stdlib_dumps(obj):
+    # What starlette's JSONResponse/send_json and the agents' json.dumps do today
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+def timeit(fn, obj, min_time=0.2):
+    n, start = 0, time.perf_counter()
+    while True:
+        fn(obj)
+        n += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / n * 1e6
+
+def main():
+    turns_list = [int(a) for a in sys.argv[1:]] or [10, 50, 200]
+    rng = random.Random(0)
+    audio = {"type": "audio", "id": "x" * 36, "speaker": "NURSE",
+             "data": base64.b64encode(bytes(rng.getrandbits(8) for _ in range(3200))).decode()}
+    payloads = [("audio frame", audio),
+                ("questions push (60)", {"type": "questions", "data": make_questions(60, rng)}),
+                ("diagnosis push (8)", {"type": "diagnosis", "data": make_diagnoses(8, rng)})]
+    for turns in turns_list:
+        payloads.append((f"prompt history ({turns} turns)", make_transcript(turns, rng)))
+
+    print(f"{'payload':<28}{'bytes':>9}{'stdlib us':>12}{'orjson us':>12}{'speedup':>9}")
+    for name, obj in payloads:
+        size = len(stdlib_dumps(obj).encode())
+        std = timeit(stdlib_dumps, obj)
+        if orjson is not None:
+            fast = timeit(lambda o: orjson.dumps(o).decode(), obj)
+            print(f"{name:<28}{size:>9}{std:>12.1f}{fast:>12.1f}{std / fast:>8.1f}x")
+        else:
+            print(f"{name:<28}{size:>9}{std:>12.1f}{'n/a':>12}{'':>9}")
+
+    text = stdlib_dumps(make_transcript(turns_list[-1], rng))
+    std = timeit(json.loads, text)
+    if orjson is not None:
+        fast = timeit(orjson.loads, text)
+        print(f"{'loads (' + str(turns_list[-1]) + ' turns)':<28}{len(text):>9}{std:>12.1f}{fast:>12.1f}{std / fast:>8.1f}x")
+    if orjson is None:
+        print("orjson not installed: pip install orjson")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# --- bench_workers.py ---
+# Local multi-process harness for horizontal scaling.
+#   python bench_workers.py [max_workers] [sessions_per_worker] [cycles]
+#
+# Each worker process runs the per-cycle clinical logic of its sessions (question
+# pool + diagnosis merge, no model calls), checkpoints them to a shared session
+# store and registers them in a shared SQLite registry - the same stores uvicorn
+# --workers uses. It does not start uvicorn or WebSocket sessions, so it measures
+# only the CPU-bound logic path plus shared-store overhead; speedup is bounded by the
+# available cores. Throughput is reported for 1..N workers, and every session's
+# routing token is checked to resolve back to the worker that served it.
+import os
+import sys
+import time
+import random
+import tempfile
+import multiprocessing as mp
+
+CANDIDATE_QUESTIONS = [f"{q} {s}" for q in ("Any", "How long have you had", "Is there", "Family history of")
+                       for s in ("fever", "jaundice", "itching", "dark urine", "weight loss", "abdominal pain",
+                                 "fatigue", "nausea", "joint pain", "rash", "pale stools", "confusion")]
+INDICATORS = ["jaundice", "fatigue", "dark urine", "fever", "RUQ pain", "itching", "weight loss",
+              "nausea", "elevated ALT", "pale stools", "ascites", "spider naevi"]
+
+def _run_session(session_id, cycles, rng, store, registry):
+    import question_manager
+    import diagnosis_manager
+
+    qm = question_manager.QuestionPoolManager([])
+    dm = diagnosis_manager.DiagnosisManager()
+    store.create(session_id, {"patient_id": "BENCH", "gender": "Male"})
+    registry.register(session_id)
+
+    for cycle in range(cycles):
+        candidates = [
+            {"did": f"D{rng.randint(1, 6)}", "diagnosis": f"Dx {rng.randint(1, 6)}",
+             "indicators_point": rng.sample(INDICATORS, rng.randint(2, 6))}
+            for _ in range(rng.randint(1, 4))
+        ]
+        dm.update_diagnoses(candidates)
+        merged, ambiguous = dm.merge_locally(candidates)
+        dm.set_consolidated_diagnoses(merged + ambiguous)
+        qm.add_questions_from_text(rng.sample(CANDIDATE_QUESTIONS, 5))
+        active = qm.get_recommend_question()
+        kept = rng.sample(active, min(len(active), 8))
+        qm.update_ranking([{"rank": i + 1, "qid": q["qid"]} for i, q in enumerate(kept)])
+        if kept:
+            qm.update_status(kept[0]["qid"], "asked")
+        transcript = [{"speaker": "NURSE", "text": f"q{cycle}"}, {"speaker": "PATIENT", "text": f"a{cycle}"}]
+        store.checkpoint(session_id, transcript, {
+            "questions": qm.get_questions(),
+            "consolidated_diagnoses": dm.get_consolidated_diagnoses_basic(),
+            "cycle": cycle,
+        })
+        registry.register(session_id)  # heartbeat
+
+def _worker(worker_id, sessions, cycles, db_dir, start_evt, results):
+    os.environ.update({
+        "WORKER_ID": worker_id,
+        "CLUSTER_BACKEND": "sqlite",
+        "CLUSTER_DB": os.path.join(db_dir, "cluster.db"),
+        "SESSION_DB": os.path.join(db_dir, "sessions.db"),
+    })
+    import cluster
+    import session_store
+
+    store = session_store.get_store()
+    registry = cluster.get_registry()
+    rng = random.Random(worker_id)
+    start_evt.wait()
+    t = time.perf_counter()
+    served = []
+    for i in range(sessions):
+        session_id = f"{worker_id}-s{i}"
+        _run_session(session_id, cycles, rng, store, registry)
+        served.append(session_id)
+    results.put((worker_id, time.perf_counter() - t, served))
+
+def run(n_workers, sessions, cycles):
+    ctx = mp.get_context("spawn")
+    db_dir = tempfile.mkdtemp(prefix="bench_workers_")
+    start_evt, results = ctx.Event(), ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(f"w{i}", sessions, cycles, db_dir, start_evt, results))
+             for i in range(n_workers)]
+    for p in procs:
+        p.start()
+    time.sleep(1.0)  # let workers import before the clock starts
+    t = time.perf_counter()
+    start_evt.set()
+    out = [results.get() for _ in procs]
+    wall = time.perf_counter() - t
+    for p in procs:
+        p.join()
+
+    # Routing check: every session's token must resolve to the worker that served it
+    os.environ.update({"CLUSTER_BACKEND": "sqlite", "CLUSTER_DB": os.path.join(db_dir, "cluster.db")})
+    import cluster
+    registry = cluster.SQLiteRegistry(os.path.join(db_dir, "cluster.db"))
+    misrouted = 0
+    for worker_id, _, served in out:
+        for sid in served:
+            entry = registry.lookup(sid)
+            if not entry or cluster.parse_route_token(entry["route"]) != worker_id:
+                misrouted += 1
+    return n_workers * sessions / wall, misrouted
+
+def main():
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else min(4, os.cpu_count() or 1)
+    sessions = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    cycles = int(sys.argv[3]) if len(sys.argv) > 3 else 30
+
+    os.environ.setdefault("ROUTE_SECRET", "bench-workers")  # shared by the spawned workers
+    print(f"sessions/worker={sessions} cycles/session={cycles} cpus={os.cpu_count()}")
+    base = None
+    n = 1
+    while n <= max_workers:
+        rate, misrouted = run(n, sessions, cycles)
+        base = base or rate
+        print(f"  workers={n}: {rate:7.1f} sessions/s  speedup={rate / base:4.2f}x  misrouted={misrouted}")
+        n *= 2
+
+if __name__ == "__main__":
+    main()
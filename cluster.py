@@ -0,0 +1,314 @@
+# --- cluster.py ---
+# Cross-worker plumbing: worker identity, routing tokens, a shared cache and a
+# session registry. Backend is chosen by CLUSTER_BACKEND:
+#   local  - in-process (single worker, default)
+#   sqlite - shared file (CLUSTER_DB), for several uvicorn workers on one host
+#   redis  - REDIS_URL, for several instances (needs the optional `redis` package)
+#
+# Any worker can resume a session from the shared session store once its previous owner
+# has stopped; a session is never forwarded to a specific worker (uvicorn workers share
+# one socket, so a client cannot pick one). Still per worker: batch JOBS, telemetry
+# TRACES and metrics, and the in-memory analytics columns (other workers' segments are
+# only seen after a reload).
+import os
+import hmac
+import json
+import time
+import base64
+import socket
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("medforce-backend")
+
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+# Shared by all workers with a shared backend; without it each worker signs with a per-process secret
+ROUTE_SECRET = os.getenv("ROUTE_SECRET")
+_LOCAL_SECRET = os.urandom(16).hex()
+SESSION_TTL = float(os.getenv("SESSION_TTL", "120"))  # seconds without heartbeat before an owner is stale
+
+# ---------------------------------------------------------
+# ROUTING TOKENS
+# ---------------------------------------------------------
+def _sign(payload: str) -> str:
+    return hmac.new((ROUTE_SECRET or _LOCAL_SECRET).encode(), payload.encode(), hashlib.sha256).hexdigest()[:16]
+
+def check_config():
+    """Warns about settings that only matter once several workers share state."""
+    if _backend() != "local" and not ROUTE_SECRET:
+        logger.warning(f"⚠️ ROUTE_SECRET is not set with CLUSTER_BACKEND={_backend()}: route tokens "
+                       f"are signed per worker and cannot be verified by the others")
+
+def make_route_token(worker_id: str = None) -> str:
+    """Signed token naming a worker, for instance-level affinity at a load balancer
+    (e.g. cookie hashing across Redis-backed instances); nothing in-process routes on it."""
+    payload = base64.urlsafe_b64encode((worker_id or WORKER_ID).encode()).decode().rstrip("=")
+    return f"{payload}.{_sign(payload)}"
+
+def parse_route_token(token: str) -> Optional[str]:
+    """Returns the worker id in a valid token, or None."""
+    try:
+        payload, sig = token.rsplit(".", 1)
+        if not hmac.compare_digest(sig, _sign(payload)):
+            return None
+        return base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)).decode()
+    except Exception:
+        return None
+
+# ---------------------------------------------------------
+# SHARED CACHE
+# ---------------------------------------------------------
+class Cache:
+    """Key/value cache of JSON-serializable values with optional TTL (seconds)."""
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+class LocalCache(Cache):
+    def __init__(self, max_items: int = 1024):
+        self.max_items = max_items
+        self._data: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return None
+            value, expires = hit
+            if expires and expires < time.time():
+                del self._data[key]
+                return None
+            return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            if len(self._data) >= self.max_items and key not in self._data:
+                self._data.pop(next(iter(self._data)))  # drop oldest insert
+            self._data[key] = (json.dumps(value), time.time() + ttl if ttl else None)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+class SQLiteCache(Cache):
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] and row[1] < time.time()):
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl if ttl else None)
+            )
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+class RedisCache(Cache):
+    def __init__(self, client, prefix: str = "medforce:cache:"):
+        self.r = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.r.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.r.set(self.prefix + key, json.dumps(value), ex=int(ttl) if ttl else None)
+
+    def delete(self, key):
+        self.r.delete(self.prefix + key)
+
+# ---------------------------------------------------------
+# SESSION REGISTRY
+# ---------------------------------------------------------
+class SessionRegistry:
+    """Which worker currently drives which live session (refreshed by heartbeat).
+    `owner` is a token of the driving manager, so a manager that lost the session to a
+    resume elsewhere does not remove the new owner's entry when it shuts down."""
+    def register(self, session_id: str, worker_id: str = None, owner: str = None):
+        raise NotImplementedError
+
+    def lookup(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Returns {"worker_id", "route", "updated", "owner"} or None."""
+        raise NotImplementedError
+
+    def unregister(self, session_id: str, owner: str = None):
+        """Removes the entry; with `owner`, only if that owner still holds it."""
+        raise NotImplementedError
+
+    def sessions_for(self, worker_id: str = None) -> List[str]:
+        raise NotImplementedError
+
+    def live_owner(self, session_id: str, owner: str = None) -> Optional[Dict[str, Any]]:
+        """Registry entry if a manager other than `owner` is still actively driving the session,
+        on any worker including this one (e.g. a fast reconnect before the old socket drops)."""
+        entry = self.lookup(session_id)
+        if entry and (owner is None or entry["owner"] != owner) and time.time() - entry["updated"] < SESSION_TTL:
+            return entry
+        return None
+
+    def _entry(self, worker_id, owner=None):
+        worker_id = worker_id or WORKER_ID
+        return {"worker_id": worker_id, "route": make_route_token(worker_id), "updated": time.time(), "owner": owner}
+
+class LocalRegistry(SessionRegistry):
+    def __init__(self):
+        self._data: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def register(self, session_id, worker_id=None, owner=None):
+        with self._lock:
+            self._data[session_id] = self._entry(worker_id, owner)
+
+    def lookup(self, session_id):
+        with self._lock:
+            entry = self._data.get(session_id)
+            return dict(entry) if entry else None
+
+    def unregister(self, session_id, owner=None):
+        with self._lock:
+            entry = self._data.get(session_id)
+            if entry and (owner is None or entry["owner"] == owner):
+                del self._data[session_id]
+
+    def sessions_for(self, worker_id=None):
+        worker_id = worker_id or WORKER_ID
+        with self._lock:
+            return [sid for sid, e in self._data.items() if e["worker_id"] == worker_id]
+
+class SQLiteRegistry(SessionRegistry):
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_registry ("
+                "session_id TEXT PRIMARY KEY, worker_id TEXT NOT NULL, route TEXT NOT NULL, updated REAL NOT NULL, owner TEXT)"
+            )
+            try:  # registries created before owner tokens
+                conn.execute("ALTER TABLE session_registry ADD COLUMN owner TEXT")
+            except sqlite3.OperationalError:
+                pass
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def register(self, session_id, worker_id=None, owner=None):
+        e = self._entry(worker_id, owner)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO session_registry (session_id, worker_id, route, updated, owner) VALUES (?, ?, ?, ?, ?)",
+                (session_id, e["worker_id"], e["route"], e["updated"], owner)
+            )
+
+    def lookup(self, session_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT worker_id, route, updated, owner FROM session_registry WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return {"worker_id": row[0], "route": row[1], "updated": row[2], "owner": row[3]} if row else None
+
+    def unregister(self, session_id, owner=None):
+        with self._connect() as conn:
+            if owner is None:
+                conn.execute("DELETE FROM session_registry WHERE session_id = ?", (session_id,))
+            else:
+                conn.execute("DELETE FROM session_registry WHERE session_id = ? AND owner = ?", (session_id, owner))
+
+    def sessions_for(self, worker_id=None):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT session_id FROM session_registry WHERE worker_id = ?", (worker_id or WORKER_ID,)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+class RedisRegistry(SessionRegistry):
+    def __init__(self, client, prefix: str = "medforce:session:"):
+        self.r = client
+        self.prefix = prefix
+
+    def register(self, session_id, worker_id=None, owner=None):
+        e = self._entry(worker_id, owner)
+        self.r.set(self.prefix + session_id, json.dumps(e), ex=int(SESSION_TTL))
+        self.r.sadd(f"{self.prefix}worker:{e['worker_id']}", session_id)
+
+    def lookup(self, session_id):
+        value = self.r.get(self.prefix + session_id)
+        return json.loads(value) if value is not None else None
+
+    def unregister(self, session_id, owner=None):
+        entry = self.lookup(session_id)
+        if entry and owner is not None and entry.get("owner") != owner:
+            return
+        self.r.delete(self.prefix + session_id)
+        if entry:
+            self.r.srem(f"{self.prefix}worker:{entry['worker_id']}", session_id)
+
+    def sessions_for(self, worker_id=None):
+        members = self.r.smembers(f"{self.prefix}worker:{worker_id or WORKER_ID}")
+        return [m.decode() if isinstance(m, bytes) else m for m in members]
+
+# ---------------------------------------------------------
+# FACTORIES
+# ---------------------------------------------------------
+_cache = None
+_registry = None
+_init_lock = threading.Lock()
+
+def _redis_client():
+    try:
+        import redis
+    except ImportError as e:
+        raise RuntimeError("CLUSTER_BACKEND=redis requires the 'redis' package") from e
+    return redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+def _backend() -> str:
+    return os.getenv("CLUSTER_BACKEND", "local").lower()
+
+def get_cache() -> Cache:
+    global _cache
+    with _init_lock:
+        if _cache is None:
+            backend = _backend()
+            if backend == "redis":
+                _cache = RedisCache(_redis_client())
+            elif backend == "sqlite":
+                _cache = SQLiteCache(os.getenv("CLUSTER_DB", "cluster.db"))
+            else:
+                _cache = LocalCache()
+        return _cache
+
+def get_registry() -> SessionRegistry:
+    global _registry
+    with _init_lock:
+        if _registry is None:
+            backend = _backend()
+            if backend == "redis":
+                _registry = RedisRegistry(_redis_client())
+            elif backend == "sqlite":
+                _registry = SQLiteRegistry(os.getenv("CLUSTER_DB", "cluster.db"))
+            else:
+                _registry = LocalRegistry()
+        return _registry
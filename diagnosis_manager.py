@@ -1,4 +1,34 @@
-from typing import List, Dict, Any, Union
+import re
+import copy
+import bisect
+import threading
+from typing import List, Dict, Any, Union, Callable, Awaitable, Tuple
+
+PRIORITY_MAP = {"High": 3, "Medium": 2, "Low": 1}
+
+_PUNCT_RE = re.compile(r"[^\w\s]")
+_SPACE_RE = re.compile(r"\s+")
+
+def normalize_label(text: str) -> str:
+    """Case/punctuation/whitespace-folded form used to compare names and indicators."""
+    return _SPACE_RE.sub(" ", _PUNCT_RE.sub(" ", str(text).lower())).strip()
+
+class FrozenDict(dict):
+    """Read-only dict used for cached views. Still a dict, so json.dumps handles it."""
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Diagnosis views are read-only")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(dict(self), memo)
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
 
 class DiagnosisManager:
     def __init__(self, high_threshold: int = 5, min_threshold: int = 3):
@@ -7,7 +37,7 @@ class DiagnosisManager:
             high_threshold: Count required for 'High' probability.
             min_threshold: Count required for 'Medium'. Anything below this is 'Low'.
         """
-        # Main recursive diagnosis pool
+        # Main recursive diagnosis pool (insertion order)
         self.diagnoses: List[Dict[str, Any]] = []
         
         # Consolidated diagnosis pool (Separate list for refined/merged results)
@@ -16,6 +46,20 @@ class DiagnosisManager:
         self.high_threshold = high_threshold
         self.min_threshold = min_threshold
 
+        self._lock = threading.RLock()
+        self._by_did: Dict[str, Dict] = {}       # did -> main pool item
+        self._points: Dict[str, set] = {}        # did -> indicator set (mirrors indicators_point)
+        self._seq: Dict[str, int] = {}           # did -> insertion order (stable tie-break)
+        self._order: List[tuple] = []            # sorted (-priority, -count, seq, did) of main pool
+
+        # Memoized views, invalidated whenever the matching version moves
+        self.version = 0                         # main pool
+        self.consolidated_version = 0            # consolidated pool
+        self._views: Dict[str, tuple] = {}       # name -> (version, view)
+
+        # Local merge engine
+        self.merge_stats = {"local": 0, "escalated": 0}
+
     # ---------------------------------------------------------
     # CONSOLIDATED DIAGNOSIS FUNCTIONS
     # ---------------------------------------------------------
@@ -29,7 +73,7 @@ class DiagnosisManager:
             clean_item = {
                 "did": item.get("did"),
                 "diagnosis": item.get("diagnosis"),
-                "indicators_point": item.get("indicators_point", [])
+                "indicators_point": list(item.get("indicators_point", []))
             }
             
             # Calculate count and probability
@@ -37,82 +81,72 @@ class DiagnosisManager:
             processed_list.append(clean_item)
 
         # Sort by probability (High -> Low)
-        priority_map = {"High": 3, "Medium": 2, "Low": 1}
-        self.consolidated_diagnoses = sorted(
-            processed_list, 
-            key=lambda x: (priority_map.get(x["probability"], 0), x["indicators_count"]), 
-            reverse=True
-        )
+        with self._lock:
+            self.consolidated_diagnoses = sorted(
+                processed_list, 
+                key=lambda x: (PRIORITY_MAP.get(x["probability"], 0), x["indicators_count"]), 
+                reverse=True
+            )
+            self.consolidated_version += 1
 
     def get_consolidated_diagnoses(self) -> List[Dict[str, Any]]:
-        """Returns the full consolidated list with metrics."""
+        """Returns the full consolidated list with metrics, rank and severity."""
+        return self._cached("consolidated", "consolidated_version", self._build_consolidated)
+
+    def _build_consolidated(self) -> tuple:
         ranked_d = []
         for i, d in enumerate(self.consolidated_diagnoses):
-            d['rank'] = i + 1
             points = len(d.get('indicators_point', [])) 
 
             # 1. HIGH: Must be Rank 1 (index 0) AND have > 8 points
             if (i == 0) and (points > 8):
-                d['severity'] = "High"
+                severity = "High"
                 
             # 2. MODERATE: Points > 5 (This covers 6, 7, 8, AND >8 if Rank is not 1)
             elif points > 5:
-                d['severity'] = "Moderate"
+                severity = "Moderate"
                 
             # 3. LOW: Points 4, 5
             elif points > 3:
-                d['severity'] = "Low"
+                severity = "Low"
                 
             # 4. VERY LOW: Points <= 3
             else:
-                d['severity'] = "Very Low"
+                severity = "Very Low"
 
-            ranked_d.append(d)
-        return ranked_d
+            ranked_d.append(self._freeze(d, rank=i + 1, severity=severity))
+        return tuple(ranked_d)
 
     def get_consolidated_diagnoses_basic(self) -> List[Dict[str, Any]]:
         """
         Returns the consolidated list EXCLUDING 'indicators_count' and 'probability'.
         Keys returned: did, diagnosis, indicators_point.
         """
-        simplified_list = []
-        for item in self.consolidated_diagnoses:
-            simplified_list.append({
-                "did": item["did"],
-                "diagnosis": item["diagnosis"],
-                "indicators_point": item["indicators_point"]
-            })
-        return simplified_list
+        return self._cached(
+            "consolidated_basic", "consolidated_version",
+            lambda: tuple(self._freeze(item, keys=("did", "diagnosis", "indicators_point")) for item in self.consolidated_diagnoses)
+        )
 
     # ---------------------------------------------------------
     # MAIN POOL FUNCTIONS
     # ---------------------------------------------------------
     def get_diagnosis_sum(self) -> List[Dict[str, Any]]:
         """Returns the WHOLE data object from main pool."""
-        return self._get_sorted_list()
+        return self._cached("sum", "version", lambda: tuple(self._freeze(item) for item in self._iter_sorted()))
 
     def get_diagnosis_basic(self) -> List[Dict[str, Any]]:
-        """Returns main pool excluding 'indicators_point' and 'probability'."""
-        full_list = self._get_sorted_list()
-        simplified_list = []
-        for item in full_list:
-            simplified_list.append({
-                "did": item["did"],
-                "diagnosis": item["diagnosis"],
-                "indicators_point": item["indicators_point"] 
-            })
-        return simplified_list
+        """Returns main pool excluding 'indicators_count' and 'probability'."""
+        return self._cached(
+            "basic", "version",
+            lambda: tuple(self._freeze(item, keys=("did", "diagnosis", "indicators_point")) for item in self._iter_sorted())
+        )
 
     def get_diagnosis_normal(self) -> List[Dict[str, Any]]:
         """Returns main pool with diagnosis and points only."""
-        full_list = self._get_sorted_list()
-        simplified_list = []
-        for item in full_list:
-            simplified_list.append({
-                "diagnosis": item["diagnosis"],
-                "indicators_point": item["indicators_point"] 
-            })
-        return simplified_list
+        return self._cached(
+            "normal", "version",
+            lambda: tuple(self._freeze(item, keys=("diagnosis", "indicators_point")) for item in self._iter_sorted())
+        )
 
     # ---------------------------------------------------------
     # CORE LOGIC
@@ -121,33 +155,110 @@ class DiagnosisManager:
         """
         Merges new diagnosis data into existing records (Recursive Pool).
         """
-        for new_item in new_data:
-            target_did = new_item.get("did")
-            existing_item = self._find_by_did(target_did)
-
-            if existing_item:
-                current_points = set(existing_item.get("indicators_point", []))
-                new_points = set(new_item.get("indicators_point", []))
-                merged_points = list(current_points.union(new_points))
-                existing_item["indicators_point"] = merged_points
-                self._recalculate_metrics(existing_item)
-            else:
-                clean_item = {
-                    "diagnosis": new_item["diagnosis"],
-                    "did": new_item["did"],
-                    "indicators_point": new_item.get("indicators_point", [])
-                }
-                self._recalculate_metrics(clean_item)
-                self.diagnoses.append(clean_item)
+        with self._lock:
+            for new_item in new_data:
+                target_did = new_item.get("did")
+                existing_item = self._find_by_did(target_did)
+
+                if existing_item:
+                    points = self._points[target_did]
+                    old_key = self._order_key(existing_item)
+                    changed = False
+                    for p in new_item.get("indicators_point", []):
+                        if p not in points:
+                            points.add(p)
+                            existing_item["indicators_point"].append(p)
+                            changed = True
+                    if not changed:
+                        continue
+                    self._recalculate_metrics(existing_item)
+                    self._reorder(existing_item, old_key)
+                else:
+                    points = []
+                    for p in new_item.get("indicators_point", []):
+                        if p not in points:
+                            points.append(p)
+                    clean_item = {
+                        "diagnosis": new_item["diagnosis"],
+                        "did": new_item["did"],
+                        "indicators_point": points
+                    }
+                    self._recalculate_metrics(clean_item)
+                    self.diagnoses.append(clean_item)
+                    self._by_did[clean_item["did"]] = clean_item
+                    self._points[clean_item["did"]] = set(points)
+                    self._seq[clean_item["did"]] = len(self._seq)
+                    bisect.insort(self._order, self._order_key(clean_item))
+                self.version += 1
+
+    # ---------------------------------------------------------
+    # LOCAL MERGE ENGINE
+    # ---------------------------------------------------------
+    def merge_locally(self, candidates: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Deterministically merges new candidates into the consolidated pool.
+        Only an exact did or normalized diagnosis name match is merged locally:
+        shared indicators say nothing about whether two labels are the same disease
+        (Hepatitis C vs NAFLD), and a new label may be a synonym of an existing one
+        (NAFLD vs non-alcoholic fatty liver disease). Every other candidate is
+        ambiguous and left to the evaluator, except when the pool is still empty.
+        Returns (merged_pool, ambiguous_candidates); the merged pool is in basic
+        form (did, diagnosis, indicators_point).
+        """
+        pool = [
+            {"did": d["did"], "diagnosis": d["diagnosis"], "indicators_point": list(d["indicators_point"])}
+            for d in self.get_consolidated_diagnoses_basic()
+        ]
+        by_did = {d["did"]: d for d in pool}
+        by_name = {normalize_label(d["diagnosis"]): d for d in pool}
+        point_sets = {id(d): {normalize_label(p) for p in d["indicators_point"]} for d in pool}
+        ambiguous = []
+        empty_pool = not pool
+
+        for cand in candidates:
+            cand_points = list(cand.get("indicators_point", []))
+
+            target = by_did.get(cand.get("did")) or by_name.get(normalize_label(cand.get("diagnosis", "")))
+            if target is None and not empty_pool:
+                ambiguous.append(cand)
+                continue
+
+            if target is None:
+                target = {"did": cand.get("did"), "diagnosis": cand.get("diagnosis"), "indicators_point": []}
+                pool.append(target)
+                point_sets[id(target)] = set()
+                by_did[target["did"]] = target
+                by_name[normalize_label(target["diagnosis"] or "")] = target
+
+            seen = point_sets[id(target)]
+            for p in cand_points:
+                key = normalize_label(p)
+                if key not in seen:
+                    seen.add(key)
+                    target["indicators_point"].append(p)
+
+        return pool, ambiguous
+
+    async def consolidate(self, candidates: List[Dict[str, Any]],
+                          escalate: Callable[[List[Dict], List[Dict]], Awaitable[List[Dict]]]) -> bool:
+        """
+        Merges candidates into the consolidated pool, calling `escalate(merged_pool,
+        ambiguous)` (the evaluator model) only when some candidates are ambiguous.
+        Returns True if the model call was avoided.
+        """
+        merged, ambiguous = self.merge_locally(candidates)
+        if ambiguous:
+            merged = await escalate(merged, ambiguous)
+        self.set_consolidated_diagnoses(merged)
+        with self._lock:
+            self.merge_stats["escalated" if ambiguous else "local"] += 1
+        return not ambiguous
 
     # ---------------------------------------------------------
     # HELPERS
     # ---------------------------------------------------------
     def _find_by_did(self, did: str) -> Union[Dict, None]:
-        for item in self.diagnoses:
-            if item["did"] == did:
-                return item
-        return None
+        return self._by_did.get(did)
 
     def _recalculate_metrics(self, item: Dict):
         """
@@ -166,14 +277,40 @@ class DiagnosisManager:
         else:
             item["probability"] = "High"
 
+    def _order_key(self, item: Dict) -> tuple:
+        # Same ordering as sorting (priority, count) descending with a stable tie-break
+        return (-PRIORITY_MAP.get(item["probability"], 0), -item["indicators_count"], self._seq[item["did"]], item["did"])
+
+    def _reorder(self, item: Dict, old_key: tuple):
+        i = bisect.bisect_left(self._order, old_key)
+        if i < len(self._order) and self._order[i] == old_key:
+            del self._order[i]
+        bisect.insort(self._order, self._order_key(item))
+
+    def _iter_sorted(self):
+        for key in self._order:
+            yield self._by_did[key[3]]
+
     def _get_sorted_list(self) -> List[Dict]:
         """Helper to return list sorted by Importance."""
-        priority_map = {"High": 3, "Medium": 2, "Low": 1}
-        return sorted(
-            self.diagnoses, 
-            key=lambda x: (priority_map.get(x["probability"], 0), x["indicators_count"]), 
-            reverse=True
-        )
+        with self._lock:
+            return list(self._iter_sorted())
+
+    def _freeze(self, item: Dict, keys=None, **extra) -> FrozenDict:
+        keys = keys or item.keys()
+        view = {k: (tuple(item[k]) if isinstance(item[k], list) else item[k]) for k in keys}
+        view.update(extra)
+        return FrozenDict(view)
+
+    def _cached(self, name: str, version_attr: str, build) -> List[Dict[str, Any]]:
+        """Returns a memoized read-only view, rebuilt only when its version counter has moved."""
+        with self._lock:
+            version = getattr(self, version_attr)
+            hit = self._views.get(name)
+            if hit is None or hit[0] != version:
+                hit = (version, build())
+                self._views[name] = hit
+            return list(hit[1])
 
 # ==========================================
 # EXAMPLE USAGE
@@ -0,0 +1,307 @@
+# --- fakes.py ---
+# In-process stand-ins for google.genai.Client and google.cloud.storage.Client,
+# used by the offline load test (bench_load.py). install() patches both SDKs so the
+# unmodified app code talks to the fakes.
+import re
+import json
+import time
+import random
+import asyncio
+import datetime
+import threading
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+# ---------------------------------------------------------
+# FAKE GENAI
+# ---------------------------------------------------------
+class FakeGenAIError(Exception):
+    pass
+
+class FakeGenAIConfig:
+    def __init__(self, latency: float = 0.3, jitter: float = 0.1, error_rate: float = 0.0,
+                 end_probability: float = 0.0, audio_chunks: int = 10, audio_chunk_bytes: int = 3200,
+                 audio_interval: float = 0.02, connect_latency: float = 0.2, seed: Optional[int] = None):
+        self.latency = latency                      # mean generate_content latency (s)
+        self.jitter = jitter                        # +/- uniform jitter (s)
+        self.error_rate = error_rate                # probability a call raises
+        self.end_probability = end_probability      # probability the advisor ends the interview
+        self.audio_chunks = audio_chunks            # audio chunks per Live turn
+        self.audio_chunk_bytes = audio_chunk_bytes  # 100 ms of 16 kHz 16-bit mono
+        self.audio_interval = audio_interval        # delay between streamed chunks (s)
+        self.connect_latency = connect_latency      # live.connect handshake (s)
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def delay(self, base: float) -> float:
+        with self._lock:
+            return max(0.0, base + self.rng.uniform(-self.jitter, self.jitter))
+
+    def maybe_fail(self, what: str):
+        with self._lock:
+            self.calls += 1
+            if self.rng.random() < self.error_rate:
+                self.errors += 1
+                raise FakeGenAIError(f"Injected {what} failure")
+
+_QID_RE = re.compile(r'"qid":\s*"([^"]+)"')
+_DID_RE = re.compile(r'"did":\s*"([^"]+)"')
+_WORDS = ["fever", "jaundice", "fatigue", "itching", "nausea", "abdominal pain", "dark urine",
+          "weight loss", "joint pain", "pale stools", "alcohol use", "travel history"]
+
+def _fake_value(schema: Dict, name: str, prompt: str, cfg: FakeGenAIConfig):
+    """Builds a schema-conforming value; qid/did fields reuse ids found in the prompt."""
+    kind = schema.get("type", "STRING").upper()
+    rng = cfg.rng
+    if kind == "OBJECT":
+        props = schema.get("properties", {})
+        order = schema.get("propertyOrdering") or list(props)
+        return {k: _fake_value(props[k], k, prompt, cfg) for k in order}
+    if kind == "ARRAY":
+        if name == "" and "qid" in json.dumps(schema.get("items", {})) and "rank" in json.dumps(schema.get("items", {})):
+            qids = list(dict.fromkeys(_QID_RE.findall(prompt)))
+            rng.shuffle(qids)
+            return [{"rank": i + 1, "qid": q} for i, q in enumerate(qids[:max(3, len(qids) * 2 // 3)])]
+        return [_fake_value(schema.get("items", {}), name, prompt, cfg) for _ in range(rng.randint(1, 3))]
+    if kind == "BOOLEAN":
+        if name == "end_conversation":
+            return rng.random() < cfg.end_probability
+        return True
+    if kind == "INTEGER":
+        return rng.randint(1, 10)
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    if name == "qid":
+        qids = _QID_RE.findall(prompt)
+        return rng.choice(qids) if qids else ""
+    if name == "did":
+        dids = _DID_RE.findall(prompt)
+        return rng.choice(dids) if dids and rng.random() < 0.5 else f"D{rng.randint(1, 8)}"
+    if name == "diagnosis":
+        return f"Condition {rng.randint(1, 8)}"
+    if name == "question":
+        return f"Ask about {rng.choice(_WORDS)}."
+    return rng.choice(_WORDS)
+
+class _FakeModels:
+    def __init__(self, cfg: FakeGenAIConfig):
+        self.cfg = cfg
+
+    async def generate_content(self, model, contents, config=None):
+        await asyncio.sleep(self.cfg.delay(self.cfg.latency))
+        self.cfg.maybe_fail("generate_content")
+        return self._build(contents, config)
+
+    def _build(self, contents, config):
+        prompt = contents if isinstance(contents, str) else json.dumps(contents, default=str)
+        schema = getattr(config, "response_schema", None) or {"type": "STRING"}
+        value = _fake_value(schema, "", prompt, self.cfg)
+        if isinstance(value, dict) and "follow_up_questions" in value:
+            value["follow_up_questions"] = [f"Any {w}?" for w in self.cfg.rng.sample(_WORDS, 3)]
+        text = json.dumps(value)
+        return SimpleNamespace(
+            text=text,
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=len(prompt) // 4,
+                candidates_token_count=len(text) // 4,
+                total_token_count=(len(prompt) + len(text)) // 4,
+            ),
+        )
+
+    async def generate_content_stream(self, model, contents, config=None, chunks: int = 6):
+        """Same output as generate_content, as text chunks spread over the call's latency
+        (first chunk after 40% of it, like time-to-first-token)."""
+        total = self.cfg.delay(self.cfg.latency)
+        await asyncio.sleep(total * 0.4)
+        self.cfg.maybe_fail("generate_content_stream")
+        response = self._build(contents, config)
+        text, step = response.text, max(1, -(-len(response.text) // chunks))
+
+        async def stream():
+            for i in range(0, len(text), step):
+                if i:
+                    await asyncio.sleep(total * 0.6 / chunks)
+                last = i + step >= len(text)
+                yield SimpleNamespace(text=text[i:i + step], usage_metadata=response.usage_metadata if last else None)
+        return stream()
+
+class _FakeLiveSession:
+    def __init__(self, cfg: FakeGenAIConfig):
+        self.cfg = cfg
+        self._pending = None
+
+    async def send(self, input=None, end_of_turn=False):
+        self.cfg.maybe_fail("live.send")
+        self._pending = str(input)
+
+    async def receive(self):
+        words = f"Synthetic reply to: {(self._pending or '')[:60]}".split()
+        per_chunk = max(1, len(words) // max(1, self.cfg.audio_chunks))
+        for i in range(self.cfg.audio_chunks):
+            await asyncio.sleep(self.cfg.audio_interval)
+            yield SimpleNamespace(data=b"\x00" * self.cfg.audio_chunk_bytes, server_content=None)
+            chunk = " ".join(words[i * per_chunk:(i + 1) * per_chunk])
+            if chunk:
+                yield SimpleNamespace(data=None, server_content=SimpleNamespace(
+                    output_transcription=SimpleNamespace(text=chunk + " "), turn_complete=False))
+        yield SimpleNamespace(data=None, server_content=SimpleNamespace(output_transcription=None, turn_complete=True))
+
+class _FakeLiveConnection:
+    def __init__(self, cfg: FakeGenAIConfig):
+        self.cfg = cfg
+
+    async def __aenter__(self):
+        await asyncio.sleep(self.cfg.delay(self.cfg.connect_latency))
+        self.cfg.maybe_fail("live.connect")
+        return _FakeLiveSession(self.cfg)
+
+    async def __aexit__(self, *exc):
+        return False
+
+class _FakeLive:
+    def __init__(self, cfg: FakeGenAIConfig):
+        self.cfg = cfg
+
+    def connect(self, model=None, config=None):
+        return _FakeLiveConnection(self.cfg)
+
+class FakeGenAIClient:
+    """Drop-in for genai.Client(vertexai=..., project=..., location=...)."""
+    config = FakeGenAIConfig()
+
+    def __init__(self, *args, **kwargs):
+        self.aio = SimpleNamespace(models=_FakeModels(self.config), live=_FakeLive(self.config))
+        self.models = self.aio.models
+
+# ---------------------------------------------------------
+# FAKE GCS
+# ---------------------------------------------------------
+class _FakeBlob:
+    def __init__(self, store, bucket_name, name):
+        self._store = store
+        self.bucket_name = bucket_name
+        self.name = name
+
+    def _key(self):
+        return (self.bucket_name, self.name)
+
+    @property
+    def size(self):
+        data = self._store.objects.get(self._key())
+        return len(data[0]) if data else None
+
+    @property
+    def updated(self):
+        data = self._store.objects.get(self._key())
+        return data[1] if data else None
+
+    def exists(self):
+        self._store.tick()
+        return self._key() in self._store.objects
+
+    def download_as_bytes(self):
+        self._store.tick()
+        data = self._store.objects.get(self._key())
+        if data is None:
+            raise FileNotFoundError(self.name)
+        return data[0]
+
+    def download_as_text(self):
+        return self.download_as_bytes().decode("utf-8")
+
+    def upload_from_string(self, data, content_type=None):
+        self._store.tick()
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        with self._store.lock:
+            self._store.objects[self._key()] = (data, datetime.datetime.now(datetime.timezone.utc))
+
+    def delete(self):
+        self._store.tick()
+        with self._store.lock:
+            self._store.objects.pop(self._key(), None)
+
+class _FakeBlobIterator:
+    def __init__(self, blobs, prefixes):
+        self._blobs = blobs
+        self.prefixes = set()
+        self._all_prefixes = prefixes
+
+    def __iter__(self):
+        self.prefixes = self._all_prefixes
+        return iter(self._blobs)
+
+class _FakeBucket:
+    def __init__(self, store, name):
+        self._store = store
+        self.name = name
+
+    def blob(self, name):
+        return _FakeBlob(self._store, self.name, name)
+
+    def list_blobs(self, prefix="", delimiter=None):
+        return self._store.list(self.name, prefix, delimiter)
+
+    def delete_blobs(self, blobs):
+        for b in blobs:
+            b.delete()
+
+class FakeStorage:
+    """Shared in-memory object store with an optional per-operation latency (s)."""
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.objects = {}
+        self.lock = threading.Lock()
+        self.ops = 0
+
+    def tick(self):
+        with self.lock:
+            self.ops += 1
+        if self.latency:
+            time.sleep(self.latency)  # the real client is blocking, so is the fake
+
+    def list(self, bucket_name, prefix="", delimiter=None):
+        self.tick()
+        with self.lock:
+            names = sorted(n for (b, n) in self.objects if b == bucket_name and n.startswith(prefix))
+        blobs, prefixes = [], set()
+        for n in names:
+            rest = n[len(prefix):]
+            if delimiter and delimiter in rest:
+                prefixes.add(prefix + rest.split(delimiter, 1)[0] + delimiter)
+            else:
+                blobs.append(_FakeBlob(self, bucket_name, n))
+        return _FakeBlobIterator(blobs, prefixes)
+
+    def seed_patient(self, pid, info, system_prompt, bucket="clinic_sim"):
+        _FakeBlob(self, bucket, f"patient_profile/{pid}/patient_info.md").upload_from_string(info)
+        _FakeBlob(self, bucket, f"patient_profile/{pid}/patient_system.md").upload_from_string(system_prompt)
+
+class FakeStorageClient:
+    """Drop-in for storage.Client()."""
+    store = FakeStorage()
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def bucket(self, name):
+        return _FakeBucket(self.store, name)
+
+    def list_blobs(self, bucket_name, prefix="", delimiter=None):
+        return self.store.list(bucket_name, prefix, delimiter)
+
+# ---------------------------------------------------------
+# INSTALL
+# ---------------------------------------------------------
+def install(genai_config: FakeGenAIConfig = None, storage: FakeStorage = None):
+    """Patches google.genai.Client and google.cloud.storage.Client process-wide."""
+    from google import genai
+    from google.cloud import storage as gcs
+
+    FakeGenAIClient.config = genai_config or FakeGenAIConfig()
+    FakeStorageClient.store = storage or FakeStorage()
+    genai.Client = FakeGenAIClient
+    gcs.Client = FakeStorageClient
+    return FakeGenAIClient.config, FakeStorageClient.store
@@ -0,0 +1,168 @@
+# --- highlight_matcher.py ---
+# Local (no model call) highlighting of patient answers: an Aho-Corasick automaton over
+# the indicator phrases of the current diagnoses plus a fixed red-flag list. Automata
+# are cached by pattern set, so one is rebuilt only when the diagnoses change. Matches
+# preceded by a negation in the same clause ("I have no chest pain") are skipped.
+import re
+import functools
+from collections import deque
+from typing import Any, Dict, Iterable, List, Tuple
+
+from question_dedup import STOPWORDS
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+# Indicator phrases are split into their listed parts ("Jaundice (yellow skin)", "nausea and vomiting")
+_SEGMENT_RE = re.compile(r"[,;:/()\[\]]|\band\b|\bor\b|\bwith\b")
+_CLAUSE_RE = re.compile(r"[.,;:!?]|\bbut\b")
+
+LEVEL_ORDER = {"warning": 1, "danger": 2}
+
+# Always "danger", mirroring the red flags in patient_profile/highlight_agent.md
+RED_FLAGS = (
+    "chest pain", "shortness of breath", "short of breath", "can't breathe", "cannot breathe",
+    "vomiting blood", "vomited blood", "blood in my vomit", "black stool", "black stools", "blood in my stool",
+    "passed out", "fainted", "lost consciousness", "confused", "confusion", "worst pain",
+    "agony", "unbearable", "suicidal", "seizure", "numbness",
+)
+
+# Indicator words too generic to highlight on their own
+GENERIC = {
+    "history", "elevated", "level", "levels", "patient", "symptom", "symptoms", "sign", "signs",
+    "recent", "possible", "positive", "negative", "test", "tests", "result", "results", "normal",
+}
+
+# Cue words that negate a finding within NEGATION_WINDOW words before it, same clause only
+NEGATIONS = {
+    "no", "not", "never", "none", "nor", "neither", "without", "deny", "denies", "denied",
+    "don't", "doesn't", "didn't", "haven't", "hasn't", "hadn't", "isn't", "wasn't", "aren't", "weren't",
+}
+NEGATION_WINDOW = 3
+
+class AhoCorasick:
+    """Multi-pattern substring matcher; patterns map to an arbitrary payload."""
+    def __init__(self, patterns: Iterable[Tuple[str, Any]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, Any]]] = [[]]
+        for pattern, payload in patterns:
+            if pattern:
+                self._insert(pattern, payload)
+        self._link()
+
+    def _insert(self, pattern, payload):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(pattern), payload))
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find_all(self, text: str):
+        """Yields (start, end, payload) for every occurrence, overlaps included."""
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for length, payload in self._out[state]:
+                yield i - length + 1, i + 1, payload
+
+def _patterns(diagnosis_context) -> Tuple[Tuple[str, str], ...]:
+    patterns = {p: "danger" for p in RED_FLAGS}
+    for diagnosis in diagnosis_context or []:
+        for indicator in diagnosis.get("indicators_point") or []:
+            for segment in _SEGMENT_RE.split(str(indicator).lower()):
+                p = " ".join(_TOKEN_RE.findall(segment))
+                # Single words only when specific enough; words of a longer phrase ("skin") are not matched alone
+                if not p or (" " not in p and (len(p) < 4 or p in STOPWORDS or p in GENERIC)):
+                    continue
+                level = "danger" if any(flag in p for flag in RED_FLAGS) else "warning"
+                if LEVEL_ORDER[level] > LEVEL_ORDER.get(patterns.get(p), 0):
+                    patterns[p] = level
+    return tuple(sorted(patterns.items()))
+
+@functools.lru_cache(maxsize=64)
+def build_matcher(patterns: Tuple[Tuple[str, str], ...]) -> AhoCorasick:
+    return AhoCorasick(patterns)
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "'"
+
+def _negated(lowered: str, start: int) -> bool:
+    clause = _CLAUSE_RE.split(lowered[:start])[-1]
+    return any(w in NEGATIONS for w in _TOKEN_RE.findall(clause)[-NEGATION_WINDOW:])
+
+def local_highlights(answer: str, diagnosis_context) -> List[Dict[str, str]]:
+    """Highlights for `answer` as [{"level", "text"}], text being exact substrings."""
+    if not answer or len(answer) < 3:
+        return []
+    lowered = answer.lower()
+    if len(lowered) != len(answer):  # offsets would not map back onto the original
+        return []
+    lowered = lowered.replace("\u2019", "'")
+    matcher = build_matcher(_patterns(diagnosis_context))
+
+    spans = []
+    for start, end, level in matcher.find_all(lowered):
+        # Whole words only, allowing a plural suffix ("headache" -> "headaches")
+        for suffix in ("", "s", "es"):
+            if lowered.startswith(suffix, end) and (end + len(suffix) == len(lowered) or not _is_word_char(lowered[end + len(suffix)])):
+                end += len(suffix)
+                break
+        else:
+            continue
+        if start > 0 and _is_word_char(lowered[start - 1]):
+            continue
+        if _negated(lowered, start):
+            continue
+        spans.append((start, end, level))
+
+    # Merge overlapping spans and spans separated only by spaces ("dark" + "urine")
+    merged = []
+    for start, end, level in sorted(spans):
+        if merged and start <= merged[-1][1] + 1 and not answer[merged[-1][1]:start].strip():
+            prev = merged[-1]
+            merged[-1] = (prev[0], max(prev[1], end), max(prev[2], level, key=LEVEL_ORDER.get))
+        else:
+            merged.append((start, end, level))
+    return [{"level": level, "text": answer[start:end]} for start, end, level in merged]
+
+def collapse_overlaps(answer: str, items: List[Dict]) -> List[Dict]:
+    """Drops highlights overlapping a longer one (keeping the higher level), in answer order."""
+    lowered = answer.lower() if len(answer.lower()) == len(answer) else answer
+    located = []
+    for item in items or []:
+        text = item.get("text")
+        pos = lowered.find(text.lower()) if text else -1
+        if pos >= 0:
+            located.append([pos, pos + len(text), item.get("level", "warning")])
+    kept = []
+    for span in sorted(located, key=lambda s: (s[0] - s[1], s[0])):
+        other = next((k for k in kept if span[0] < k[1] and k[0] < span[1]), None)
+        if other is None:
+            kept.append(span)
+        elif LEVEL_ORDER.get(span[2], 0) > LEVEL_ORDER.get(other[2], 0):
+            other[2] = span[2]
+    return [{"level": level, "text": answer[start:end]} for start, end, level in sorted(kept)]
+
+def final_highlights(answer: str, local: List[Dict], refined) -> List[Dict]:
+    """The model's refined highlights replace the local ones (so it can drop false flags);
+    the local ones stand only when the refine call failed (refined is None)."""
+    return collapse_overlaps(answer, local if refined is None else refined)
@@ -0,0 +1,138 @@
+# --- loop_monitor.py ---
+# Event-loop health: a probe task measures scheduling drift (loop lag), and in debug
+# mode a watchdog thread captures the loop thread's stack whenever the probe is
+# starved for longer than the threshold, i.e. while something is blocking the loop.
+#   LOOP_MONITOR_INTERVAL  probe period in seconds (default 0.1)
+#   LOOP_STALL_THRESHOLD   lag counted as a stall, in seconds (default 0.1)
+#   LOOP_DEBUG=1           record stack traces of stalls (see /api/admin/loop-health)
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+from typing import Optional
+
+import telemetry
+
+logger = logging.getLogger("medforce-backend")
+
+telemetry.METRICS.describe("medforce_loop_lag_seconds", "histogram", "Event-loop scheduling drift of the probe task.",
+                           buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+telemetry.METRICS.describe("medforce_loop_lag_max_seconds", "gauge", "Largest loop lag seen in the last reporting window.")
+telemetry.METRICS.describe("medforce_loop_stalls_total", "counter", "Probe wake-ups late by more than the stall threshold.")
+
+class LoopMonitor:
+    def __init__(self, name: str = "main", interval: float = None, threshold: float = None,
+                 debug: bool = None, max_stalls: int = 50, window: float = 60.0):
+        self.name = name
+        self.interval = interval if interval is not None else float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1"))
+        self.threshold = threshold if threshold is not None else float(os.getenv("LOOP_STALL_THRESHOLD", "0.1"))
+        self.debug = debug if debug is not None else os.getenv("LOOP_DEBUG", "0") == "1"
+        self.window = window
+        self.stalls = deque(maxlen=max_stalls)   # recorded stalls, newest last
+        self.samples = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._window_max = 0.0
+        self._window_start = time.monotonic()
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Starts the probe on the running loop (and the watchdog in debug mode)."""
+        if self._task:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._probe())
+        if self.debug:
+            self._watchdog = threading.Thread(target=self._watch, name=f"loop-watchdog-{self.name}", daemon=True)
+            self._watchdog.start()
+        logger.info(f"🩺 Loop monitor started ({self.name}, interval={self.interval}s, threshold={self.threshold}s, debug={self.debug})")
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _probe(self):
+        while True:
+            t = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            self._record(max(0.0, now - t - self.interval))
+
+    def _record(self, lag: float):
+        self.samples += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        telemetry.METRICS.observe("medforce_loop_lag_seconds", lag, loop=self.name)
+        now = time.monotonic()
+        if now - self._window_start > self.window:
+            self._window_start, self._window_max = now, 0.0
+        self._window_max = max(self._window_max, lag)
+        telemetry.METRICS.set("medforce_loop_lag_max_seconds", self._window_max, loop=self.name)
+        if lag > self.threshold:
+            telemetry.METRICS.inc("medforce_loop_stalls_total", loop=self.name)
+            if not self.debug:
+                self.stalls.append({"at": time.time(), "lag": round(lag, 4)})
+            elif self.stalls and self.stalls[-1].get("open"):
+                # The watchdog already captured this stall's stack; close it with the measured lag
+                self.stalls[-1].update(lag=round(lag, 4), open=False)
+        elif self.debug and self.stalls and self.stalls[-1].get("open"):
+            self.stalls[-1]["open"] = False
+
+    def _watch(self):
+        """Runs in its own thread; samples the loop thread's stack while the probe is overdue."""
+        check = max(0.01, self.threshold / 2)
+        captured_for = None
+        while not self._stop.wait(check):
+            beat = self._heartbeat
+            overdue = time.monotonic() - beat - self.interval
+            if overdue <= self.threshold or captured_for == beat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            captured_for = beat
+            stack = "".join(traceback.format_stack(frame))
+            self.stalls.append({"at": time.time(), "lag": round(overdue, 4), "open": True, "stack": stack})
+            logger.warning(f"🐢 Event loop ({self.name}) blocked for >{overdue:.3f}s:\n{stack}")
+
+    def snapshot(self) -> dict:
+        return {
+            "loop": self.name,
+            "interval": self.interval,
+            "threshold": self.threshold,
+            "debug": self.debug,
+            "samples": self.samples,
+            "last_lag": round(self.last_lag, 4),
+            "max_lag": round(self.max_lag, 4),
+            "window_max_lag": round(self._window_max, 4),
+            "stalls": list(self.stalls),
+        }
+
+_monitor: Optional[LoopMonitor] = None
+
+def start(**kwargs) -> LoopMonitor:
+    """Starts the process-wide monitor on the running loop."""
+    global _monitor
+    if _monitor is None:
+        _monitor = LoopMonitor(**kwargs)
+        _monitor.start()
+    return _monitor
+
+def get_monitor() -> Optional[LoopMonitor]:
+    return _monitor
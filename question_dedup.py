@@ -0,0 +1,172 @@
+# --- question_dedup.py ---
+import re
+import math
+from collections import Counter
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+# Filler words that carry no clinical meaning in intake questions.
+# Negations ("no", "not") are deliberately kept.
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "at", "for", "with", "by", "from",
+    "do", "does", "did", "you", "your", "yours", "have", "has", "had", "any", "are", "is", "was",
+    "were", "be", "been", "there", "ever", "please", "tell", "me", "can", "could", "would",
+    "about", "some", "that", "this", "it", "if",
+}
+
+def _stem(token: str) -> str:
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+# Words whose difference changes the question however similar the rest is
+LATERALITY = {"left", "right", "both", "bilateral", "upper", "lower"}
+NEGATIONS = {"no", "not", "never", "none", "without", "don't", "doesn't", "didn't", "haven't", "hasn't", "hadn't"}
+PAST = {"did", "was", "were", "used", "didn't"}
+
+def _content_tokens(text: str) -> List[str]:
+    tokens = _TOKEN_RE.findall(text.lower())
+    return [_stem(t) for t in ([t for t in tokens if t not in STOPWORDS] or tokens)]
+
+def _token_grams(token: str) -> Set[str]:
+    padded = f"^{token}$"
+    if len(padded) <= 3:
+        return {padded}
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def shingles(text: str) -> Set[str]:
+    """
+    Order-insensitive character trigrams over stemmed content tokens, e.g.
+    "Any allergies to drugs?" and "Drug Allergies" yield the same set.
+    """
+    grams = set()
+    for tok in _content_tokens(text):
+        grams.update(_token_grams(tok))
+    return grams
+
+def signature(text: str) -> FrozenSet[str]:
+    """
+    Short or discriminating markers two paraphrases must share exactly: single
+    letters and numbers ("hepatitis B" vs "C"), laterality, negation and tense
+    ("Do you smoke?" vs "Did you smoke?").
+    """
+    words = _WORD_RE.findall(text.lower().replace("\u2019", "'"))
+    marks = {w for w in words if len(w) == 1 or any(c.isdigit() for c in w) or w in LATERALITY}
+    if any(w in NEGATIONS for w in words):
+        marks.add("<neg>")
+    # "had" is past unless perfect ("Have you ever had ...?", same as "Any history of ...?")
+    if any(w in PAST for w in words) or ("had" in words and not {"have", "has"} & set(words)):
+        marks.add("<past>")
+    return frozenset(marks)
+
+def _one_edit(a: str, b: str) -> bool:
+    """True if a and b differ by at most one insertion, deletion or substitution."""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i + (len(a) == len(b)):] == b[i + 1:]
+
+def _aligned(a: List[str], b: List[str]) -> bool:
+    """Every content token of each text has a counterpart in the other: the same stem, or
+    a one-letter spelling variant of a long word ("haemoglobin"). An added qualifier
+    ("chest pain at rest") or a different term of similar spelling is not a paraphrase."""
+    def covered(src, dst):
+        return all(tok in dst or (len(tok) >= 6 and any(_one_edit(tok, o) for o in dst)) for tok in src)
+    sa, sb = set(a), set(b)
+    return covered(sa, sb) and covered(sb, sa)
+
+class QuestionDeduplicator:
+    """
+    Near-duplicate detector for question texts (Jaccard similarity over shingles).
+    A match must also agree on signature() and have every content word aligned
+    (_aligned), since trigram overlap alone merges "hepatitis B" with "hepatitis C".
+
+    Lookups use an inverted index with prefix filtering: if J(A, B) >= t then
+    |A & B| >= o = ceil(t * |A|), so B must appear in at least k of any
+    |A| - o + k shingles of A. The query's rarest shingles are probed, posting
+    hits are counted in C (Counter), and only candidates reaching k hits are
+    verified with an exact Jaccard score.
+    """
+    def __init__(self, threshold: float = 0.75, min_hits: int = 2):
+        self.threshold = threshold
+        self.min_hits = min_hits
+        self._sets: Dict[str, Set[str]] = {}          # qid -> shingle set
+        self._postings: Dict[str, Set[str]] = {}      # shingle -> qids
+        self._keys: Dict[str, tuple] = {}             # qid -> (signature, content tokens)
+
+    def __len__(self):
+        return len(self._sets)
+
+    def add(self, qid: str, text: str):
+        if qid in self._sets:
+            self.remove(qid)
+        grams = shingles(text)
+        self._sets[qid] = grams
+        self._keys[qid] = (signature(text), _content_tokens(text))
+        for g in grams:
+            self._postings.setdefault(g, set()).add(qid)
+
+    def remove(self, qid: str):
+        self._keys.pop(qid, None)
+        for g in self._sets.pop(qid, ()):
+            posting = self._postings.get(g)
+            if posting is not None:
+                posting.discard(qid)
+                if not posting:
+                    del self._postings[g]
+
+    def _compatible(self, qid: str, key: tuple) -> bool:
+        sig, tokens = self._keys[qid]
+        return sig == key[0] and _aligned(tokens, key[1])
+
+    def find(self, text: str) -> Optional[Tuple[str, float]]:
+        """Returns (qid, similarity) of the closest indexed question above threshold, or None."""
+        query = shingles(text)
+        if not query:
+            return None
+        key = (signature(text), _content_tokens(text))
+
+        size = len(query)
+        min_overlap = max(1, math.ceil(self.threshold * size - 1e-9))
+        hits_needed = min(self.min_hits, min_overlap)
+        probe = sorted((self._postings.get(g, ()) for g in query), key=len)[:size - min_overlap + hits_needed]
+
+        counts = Counter()
+        for posting in probe:
+            counts.update(posting)
+
+        # Length filter: J(A, B) >= t implies t*|A| <= |B| <= |A|/t
+        lo, hi = self.threshold * size, size / self.threshold if self.threshold else float("inf")
+        best = None
+        for qid, hits in counts.items():
+            if hits < hits_needed:
+                continue
+            other = self._sets[qid]
+            if not lo <= len(other) <= hi:
+                continue
+            inter = len(query & other)
+            score = inter / (size + len(other) - inter)
+            if score >= self.threshold and (best is None or score > best[1]) and self._compatible(qid, key):
+                best = (qid, score)
+        return best
+
+    def find_brute_force(self, text: str) -> Optional[Tuple[str, float]]:
+        """Linear-scan reference implementation (used by the benchmark)."""
+        query = shingles(text)
+        key = (signature(text), _content_tokens(text))
+        best = None
+        for qid, other in self._sets.items():
+            inter = len(query & other)
+            union = len(query) + len(other) - inter
+            score = inter / union if union else 0.0
+            if score >= self.threshold and (best is None or score > best[1]) and self._compatible(qid, key):
+                best = (qid, score)
+        return best
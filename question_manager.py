@@ -1,61 +1,192 @@
+import re
 import uuid
+import bisect
+import threading
 from typing import List, Dict, Optional, Any
 
+from question_dedup import QuestionDeduplicator
+
+_PUNCT_RE = re.compile(r"[^\w\s]")
+_SPACE_RE = re.compile(r"\s+")
+
+# Fields kept for archived (asked / deleted) questions
+ARCHIVE_FIELDS = ("role", "content", "qid", "status", "answer")
+
+def normalize_text(text: str) -> str:
+    """Folds case, punctuation and whitespace so trivially different texts collide."""
+    return _SPACE_RE.sub(" ", _PUNCT_RE.sub(" ", text.lower())).strip()
+
 class QuestionPoolManager:
-    def __init__(self, initial_questions: List[Dict[str, Any]], 
-                 default_max_score: int = 10, 
-                 decay_step: int = 1, 
-                 min_score: int = 1):
-        self.questions = initial_questions
+    def __init__(self, initial_questions: List[Dict[str, Any]],
+                 default_max_score: int = 10,
+                 decay_step: int = 1,
+                 min_score: int = 1,
+                 similarity_threshold: Optional[float] = 0.75,
+                 max_active: Optional[int] = 50):
+        """
+        Args:
+            similarity_threshold: Shingle-Jaccard score at which a new text is treated as a
+                paraphrase of an existing question and merged into its qid. None disables
+                near-duplicate detection (exact normalized matches only).
+            max_active: Cap on active questions kept after each ranking; the lowest ranked
+                overflow is marked 'deleted'. None disables the cap.
+        """
         self.default_max_score = default_max_score
         self.decay_step = decay_step
         self.min_score = min_score
+        self.max_active = max_active
+
+        self._lock = threading.RLock()
+        self._live: Dict[str, Dict] = {}          # qid -> active question (the working set)
+        self._archive: Dict[str, Dict] = {}       # qid -> compact asked/deleted record
+        self._asked: List[str] = []               # qids in the order they were asked
+        self._by_qid: Dict[str, Dict] = {}        # qid -> live question or archive record
+        self._by_content: Dict[str, str] = {}     # normalized content -> qid
+        self._seq: Dict[str, int] = {}            # qid -> insertion order (stable tie-break)
+        self._active: List[tuple] = []            # sorted (rank, seq, qid) of live questions
+        self._recommend_cache: Optional[List[Dict]] = None
+        self._client_cache: Optional[List[Dict]] = None
+        self._dedup = QuestionDeduplicator(similarity_threshold) if similarity_threshold is not None else None
+
+        for q in initial_questions:
+            if q["qid"] in self._by_qid:
+                continue
+            self._index(q)
+            if q.get("status") is None:
+                self._live[q["qid"]] = q
+            else:
+                self._archive_question(q)
+        self._rebuild_active()
+
+    @property
+    def questions(self) -> List[Dict]:
+        """The live working set (active questions only)."""
+        return list(self._live.values())
+
+    # ---------------------------------------------------------
+    # INDEX MAINTENANCE
+    # ---------------------------------------------------------
+    def _index(self, q: Dict):
+        self._seq[q["qid"]] = len(self._seq)
+        self._by_qid[q["qid"]] = q
+        self._by_content.setdefault(normalize_text(q["content"]), q["qid"])
+        if self._dedup is not None:
+            self._dedup.add(q["qid"], q["content"])
+
+    def _active_key(self, q: Dict) -> tuple:
+        return (q.get("rank", 999), self._seq[q["qid"]], q["qid"])
+
+    def _invalidate(self):
+        self._recommend_cache = None
+        self._client_cache = None
+
+    def _activate(self, q: Dict):
+        bisect.insort(self._active, self._active_key(q))
+        self._invalidate()
+
+    def _deactivate(self, q: Dict):
+        key = self._active_key(q)
+        i = bisect.bisect_left(self._active, key)
+        if i < len(self._active) and self._active[i] == key:
+            del self._active[i]
+        self._invalidate()
+
+    def _rebuild_active(self):
+        self._active = sorted(self._active_key(q) for q in self._live.values())
+        self._invalidate()
+
+    # ---------------------------------------------------------
+    # ARCHIVE
+    # ---------------------------------------------------------
+    def _archive_question(self, q: Dict):
+        """Moves a question out of the working set into the compact archive."""
+        qid = q["qid"]
+        self._live.pop(qid, None)
+        record = {k: q[k] for k in ARCHIVE_FIELDS if k in q}
+        self._archive[qid] = record
+        self._by_qid[qid] = record
+        if record.get("status") == "asked" and qid not in self._asked:
+            self._asked.append(qid)
+        self._invalidate()
+
+    def _restore_question(self, qid: str) -> Dict:
+        """Brings an archived question back into the working set as active."""
+        record = self._archive.pop(qid)
+        if qid in self._asked:
+            self._asked.remove(qid)
+        q = dict(record)
+        q.update({"status": None, "rank": 999, "score": 0})
+        self._live[qid] = q
+        self._by_qid[qid] = q
+        return q
+
+    def _enforce_cap(self):
+        if self.max_active is None:
+            return
+        while len(self._active) > self.max_active:
+            _, _, qid = self._active.pop()
+            q = self._live[qid]
+            q["status"] = "deleted"
+            q["rank"] = 999
+            self._archive_question(q)
+
+    def get_archived(self, status: Optional[str] = None) -> List[Dict]:
+        """Archived records, optionally filtered by status ('asked' / 'deleted')."""
+        with self._lock:
+            return [dict(r) for r in self._archive.values() if status is None or r.get("status") == status]
 
     # ---------------------------------------------------------
     # FUNCTION 1: Add Questions (With "Resurrection" Logic)
     # ---------------------------------------------------------
     def add_questions_from_text(self, text_list: List[str]) -> List[Dict]:
         """
-        Adds questions. If a question already exists but was 'deleted', 
+        Adds questions. If a question already exists but was 'deleted',
         it 'resurrects' it (sets status back to None).
         """
         new_objects = []
-        
-        for text in text_list:
-            clean_text = text.strip()
-            if not clean_text:
-                continue
-                
-            # Check if content exists ANYWHERE in the pool (Active, Asked, or Deleted)
-            # We search efficiently by lower-case match
-            existing_q = next((q for q in self.questions if q["content"].lower().strip() == clean_text.lower()), None)
-
-            if existing_q:
-                # SCENARIO A: Question exists but was marked "deleted" by the ranker previously.
-                # ACTION: Resurrect it! The agent thinks it's relevant again.
-                if existing_q.get("status") == "deleted":
-                    existing_q["status"] = None  # Make active
-                    existing_q["rank"] = 999     # Reset rank
-                    existing_q["score"] = 0      # Reset score
-                    new_objects.append(existing_q)
-                
-                # SCENARIO B: Question exists and is "asked" or already active.
-                # ACTION: Do nothing. Don't duplicate.
-                continue
 
-            # SCENARIO C: Truly new question.
-            # ACTION: Create it.
-            new_qid = str(uuid.uuid4())[:8] 
-            new_q_obj = {
-                "role": "nurse",
-                "content": clean_text,
-                "qid": new_qid,
-                "score": 0,    
-                "rank": 999,   
-                "status": None 
-            }
-            self.questions.append(new_q_obj)
-            new_objects.append(new_q_obj)
+        with self._lock:
+            for text in text_list:
+                clean_text = text.strip()
+                if not clean_text:
+                    continue
+
+                # Check if content exists ANYWHERE in the pool (Active, Asked, or Deleted)
+                # via the normalized-content index, then as a near-duplicate paraphrase
+                existing_qid = self._by_content.get(normalize_text(clean_text))
+                if existing_qid is None and self._dedup is not None:
+                    match = self._dedup.find(clean_text)
+                    if match:
+                        existing_qid = match[0]
+
+                if existing_qid:
+                    existing_q = self._by_qid[existing_qid]
+                    # SCENARIO A: Question exists but was marked "deleted" by the ranker previously.
+                    # ACTION: Resurrect it from the archive! The agent thinks it's relevant again.
+                    if existing_q.get("status") == "deleted":
+                        existing_q = self._restore_question(existing_qid)
+                        self._activate(existing_q)
+                        new_objects.append(existing_q)
+
+                    # SCENARIO B: Question exists and is "asked" or already active.
+                    # ACTION: Do nothing. Don't duplicate.
+                    continue
+
+                # SCENARIO C: Truly new question.
+                # ACTION: Create it.
+                new_qid = str(uuid.uuid4())[:8]
+                new_q_obj = {
+                    "role": "nurse",
+                    "content": clean_text,
+                    "qid": new_qid,
+                    "score": 0,
+                    "rank": 999,
+                    "status": None
+                }
+                self._index(new_q_obj)
+                self._live[new_qid] = new_q_obj
+                self._activate(new_q_obj)
+                new_objects.append(new_q_obj)
 
         return new_objects
 
@@ -64,71 +195,111 @@ class QuestionPoolManager:
     # ---------------------------------------------------------
     def update_ranking(self, new_ranking_list: List[Dict]):
         """
-        Updates Rank/Score. 
-        - If an active question is NOT in the new list, mark it as "deleted".
+        Updates Rank/Score.
+        - If an active question is NOT in the new list, mark it as "deleted" and archive it.
+        - Active questions beyond max_active (lowest ranked first) are deleted the same way.
         - "deleted" just hides it from recommendations; it stays in get_questions().
         """
-        # 1. Map currently ACTIVE questions
-        active_map = {q["qid"]: q for q in self.questions if q.get("status") is None}
-        
-        # 2. Get QIDs from the new input
-        ranked_qids = set(item["qid"] for item in new_ranking_list)
-
-        # 3. Calculate max score for continuity
-        current_scores = [q["score"] for q in active_map.values() if "score" in q]
-        max_score = max(current_scores) if current_scores else self.default_max_score
-
-        # 4. Sort new input
-        sorted_new_input = sorted(new_ranking_list, key=lambda x: x["rank"])
-
-        # 5. Loop: Update Scores for kept questions
-        for index, item in enumerate(sorted_new_input):
-            qid = item["qid"]
-            if qid in active_map:
-                new_score = max(self.min_score, max_score - (index * self.decay_step))
-                active_map[qid]["rank"] = item["rank"]
-                active_map[qid]["score"] = new_score
-
-        # 6. Loop: Mark unmentioned questions as 'deleted'
-        for qid, q_obj in active_map.items():
-            if qid not in ranked_qids:
-                q_obj["status"] = "deleted"
-                q_obj["rank"] = 999 # Push to bottom logically
+        with self._lock:
+            # 1. Map currently ACTIVE questions
+            active_map = dict(self._live)
+
+            # 2. Get QIDs from the new input
+            ranked_qids = set(item["qid"] for item in new_ranking_list)
+
+            # 3. Calculate max score for continuity
+            current_scores = [q["score"] for q in active_map.values() if "score" in q]
+            max_score = max(current_scores) if current_scores else self.default_max_score
+
+            # 4. Sort new input
+            sorted_new_input = sorted(new_ranking_list, key=lambda x: x["rank"])
+
+            # 5. Loop: Update Scores for kept questions
+            for index, item in enumerate(sorted_new_input):
+                qid = item["qid"]
+                if qid in active_map:
+                    new_score = max(self.min_score, max_score - (index * self.decay_step))
+                    active_map[qid]["rank"] = item["rank"]
+                    active_map[qid]["score"] = new_score
+
+            # 6. Loop: Mark unmentioned questions as 'deleted'
+            for qid, q_obj in active_map.items():
+                if qid not in ranked_qids:
+                    q_obj["status"] = "deleted"
+                    q_obj["rank"] = 999 # Push to bottom logically
+                    self._archive_question(q_obj)
+
+            self._rebuild_active()
+            self._enforce_cap()
 
     # ---------------------------------------------------------
     # HELPER FUNCTIONS
     # ---------------------------------------------------------
     def get_recommend_question(self) -> List[Dict]:
-        """Returns active questions only (Clean Output)."""
-        active_questions = [q for q in self.questions if q.get("status") is None]
-        sorted_qs = sorted(active_questions, key=lambda x: x.get("rank", 999))
-
-        cleaned_list = []
-        for q in sorted_qs:
-            cleaned_list.append({
-                "role": q.get("role", "nurse"),
-                "content": q["content"],
-                "qid": q["qid"]
-            })
-        return cleaned_list
+        """Returns active questions only (Clean Output). Cached until the next mutation."""
+        with self._lock:
+            if self._recommend_cache is None:
+                self._recommend_cache = []
+                for _, _, qid in self._active:
+                    q = self._live[qid]
+                    self._recommend_cache.append({
+                        "role": q.get("role", "nurse"),
+                        "content": q["content"],
+                        "qid": q["qid"]
+                    })
+            return list(self._recommend_cache)
+
+    def get_client_view(self) -> List[Dict]:
+        """
+        What the client needs: asked questions (with answers) in the order they were
+        asked, followed by the active working set. Deleted questions are left out.
+        """
+        with self._lock:
+            if self._client_cache is None:
+                self._client_cache = [dict(self._archive[qid]) for qid in self._asked]
+                self._client_cache.extend(dict(q) for q in self._live.values())
+            return list(self._client_cache)
 
     def get_questions(self) -> List[Dict]:
         """
-        Returns the FULL history (Active, Asked, and Deleted).
-        Nothing is ever removed from this list.
+        Returns the FULL history (Active, Asked, and Deleted) in insertion order.
+        Archived questions come back in their compact form.
         """
-        return self.questions
+        with self._lock:
+            merged = list(self._live.values()) + list(self._archive.values())
+            return sorted(merged, key=lambda q: self._seq[q["qid"]])
+
+    def get_question(self, qid: str) -> Optional[Dict]:
+        return self._by_qid.get(qid)
 
     def update_status(self, qid: str, new_status: str) -> bool:
-        for q in self.questions:
-            if q["qid"] == qid:
+        with self._lock:
+            q = self._by_qid.get(qid)
+            if q is None:
+                return False
+            if qid in self._live:
+                self._deactivate(q)
                 q["status"] = new_status
-                return True
-        return False
-    
+                if new_status is None:
+                    self._activate(q)
+                else:
+                    self._archive_question(q)
+            elif new_status is None:
+                self._activate(self._restore_question(qid))
+            else:
+                if q.get("status") == "asked" and new_status != "asked":
+                    self._asked.remove(qid)
+                q["status"] = new_status
+                if new_status == "asked" and qid not in self._asked:
+                    self._asked.append(qid)
+                self._invalidate()
+            return True
+
     def update_answer(self, qid: str, answer: str) -> bool:
-        for q in self.questions:
-            if q["qid"] == qid:
-                q["answer"] = answer
-                return True
-        return False
\ No newline at end of file
+        with self._lock:
+            q = self._by_qid.get(qid)
+            if q is None:
+                return False
+            q["answer"] = answer
+            self._client_cache = None
+            return True
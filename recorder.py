@@ -0,0 +1,390 @@
+# --- recorder.py ---
+# Record/replay of model traffic for offline regression runs.
+#
+# Record: genai.Client is wrapped so every generate_content response and every Live
+# stream event is appended to recordings/<session_id>.jsonl.gz (session from
+# telemetry.current_session). Audio is stored as its length unless GENAI_RECORD_AUDIO=1.
+# Replay: genai.Client is replaced by a client serving one recording. Calls are matched
+# per channel (model + system instruction, i.e. per agent) on the request key first and
+# fall back to recorded order when the request differs, so concurrent calls of one agent
+# get their own responses. Any number of sessions can replay the same file, at full
+# speed (speed=0) or original timing (speed=1).
+#
+#   GENAI_RECORD_DIR=recordings            -> record
+#   GENAI_REPLAY=recordings/<id>.jsonl.gz  -> replay (GENAI_REPLAY_SPEED, default 0)
+import os
+import gzip
+import time
+import atexit
+import base64
+import asyncio
+import hashlib
+import logging
+import threading
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import serializer
+import telemetry
+
+logger = logging.getLogger("medforce-backend")
+
+def _instruction_text(config) -> str:
+    si = getattr(config, "system_instruction", None)
+    if si is None:
+        return ""
+    if isinstance(si, str):
+        return si
+    return "".join(getattr(p, "text", "") or "" for p in getattr(si, "parts", None) or [])
+
+def _channel(model, config) -> str:
+    """Stable id of the calling agent: model plus system instruction."""
+    return hashlib.sha256(f"{model}|{_instruction_text(config)}".encode()).hexdigest()[:12]
+
+def _request_key(contents) -> str:
+    return hashlib.sha256(serializer.dumps(contents).encode()).hexdigest()[:16]
+
+def _usage(response) -> Optional[Dict]:
+    u = getattr(response, "usage_metadata", None)
+    if u is None:
+        return None
+    return {k: getattr(u, k, None) for k in ("prompt_token_count", "candidates_token_count", "total_token_count")}
+
+# ---------------------------------------------------------
+# RECORD
+# ---------------------------------------------------------
+class Recorder:
+    def __init__(self, directory: str, keep_audio: bool = False, flush_every: int = 500):
+        self.directory = directory
+        self.keep_audio = keep_audio
+        self.flush_every = flush_every
+        self._buffers: Dict[str, List[Dict]] = {}
+        self._started: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        atexit.register(self.flush_all)
+
+    def path(self, session_id: str) -> str:
+        return os.path.join(self.directory, f"{os.path.basename(session_id)}.jsonl.gz")
+
+    def add(self, event: Dict):
+        session_id = telemetry.current_session.get() or "nosession"
+        with self._lock:
+            if session_id not in self._started:
+                self._started[session_id] = time.time()
+                self._buffers[session_id] = [{"k": "meta", "session": session_id, "started": self._started[session_id], "v": 1}]
+            event["t"] = round(time.time() - self._started[session_id], 4)
+            buf = self._buffers[session_id]
+            buf.append(event)
+            full = len(buf) >= self.flush_every
+        if full:
+            self.flush(session_id)
+
+    def flush(self, session_id: str = None):
+        session_id = session_id or telemetry.current_session.get() or "nosession"
+        with self._lock:
+            events = self._buffers.get(session_id)
+            if not events:
+                return
+            self._buffers[session_id] = []
+        # Appending gzip members keeps earlier flushes intact; gzip.open reads them as one stream
+        with gzip.open(self.path(session_id), "ab") as f:
+            f.write(b"".join(serializer.dumps_bytes(e) + b"\n" for e in events))
+
+    def close(self, session_id: str):
+        """Flushes a finished session and forgets it."""
+        self.flush(session_id)
+        with self._lock:
+            self._buffers.pop(session_id, None)
+            self._started.pop(session_id, None)
+
+    def flush_all(self):
+        for session_id in list(self._buffers):
+            try:
+                self.flush(session_id)
+            except Exception as e:
+                logger.error(f"Recorder Flush Error: {e}")
+
+class _RecordingModels:
+    def __init__(self, models, recorder: Recorder):
+        self._models = models
+        self._rec = recorder
+
+    async def generate_content(self, model, contents, config=None, **kwargs):
+        start = time.perf_counter()
+        response = await self._models.generate_content(model=model, contents=contents, config=config, **kwargs)
+        self._rec.add({
+            "k": "gen", "ch": _channel(model, config), "model": model, "key": _request_key(contents),
+            "dur": round(time.perf_counter() - start, 4), "text": response.text, "usage": _usage(response),
+        })
+        return response
+
+    async def generate_content_stream(self, model, contents, config=None, **kwargs):
+        start = time.perf_counter()
+        stream = await self._models.generate_content_stream(model=model, contents=contents, config=config, **kwargs)
+
+        async def recorded():
+            parts, last = [], None
+            async for chunk in stream:
+                parts.append(chunk.text or "")
+                last = chunk
+                yield chunk
+            # Replayed like a generate_content record; replay re-chunks the text
+            self._rec.add({
+                "k": "gen", "ch": _channel(model, config), "model": model, "key": _request_key(contents),
+                "dur": round(time.perf_counter() - start, 4), "text": "".join(parts), "usage": _usage(last),
+            })
+        return recorded()
+
+    def __getattr__(self, name):
+        return getattr(self._models, name)
+
+class _RecordingLiveSession:
+    def __init__(self, session, recorder: Recorder, channel: str):
+        self._session = session
+        self._rec = recorder
+        self._ch = channel
+        self._sent_at = time.perf_counter()
+
+    async def send(self, input=None, end_of_turn=False, **kwargs):
+        self._sent_at = time.perf_counter()
+        self._rec.add({"k": "live_send", "ch": self._ch, "key": _request_key(str(input))})
+        return await self._session.send(input=input, end_of_turn=end_of_turn, **kwargs)
+
+    async def receive(self):
+        async for response in self._session.receive():
+            event = {"k": "live", "ch": self._ch, "dt": round(time.perf_counter() - self._sent_at, 4)}
+            if data := response.data:
+                event["audio"] = base64.b64encode(data).decode() if self._rec.keep_audio else len(data)
+            sc = response.server_content
+            if sc is not None:
+                if sc.output_transcription and sc.output_transcription.text:
+                    event["text"] = sc.output_transcription.text
+                if sc.turn_complete:
+                    event["done"] = True
+            self._rec.add(event)
+            yield response
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+class _RecordingLiveConnection:
+    def __init__(self, cm, recorder: Recorder, channel: str):
+        self._cm = cm
+        self._rec = recorder
+        self._ch = channel
+
+    async def __aenter__(self):
+        session = await self._cm.__aenter__()
+        self._rec.add({"k": "live_open", "ch": self._ch})
+        return _RecordingLiveSession(session, self._rec, self._ch)
+
+    async def __aexit__(self, *exc):
+        try:
+            return await self._cm.__aexit__(*exc)
+        finally:
+            self._rec.flush()
+
+class _RecordingLive:
+    def __init__(self, live, recorder: Recorder):
+        self._live = live
+        self._rec = recorder
+
+    def connect(self, model=None, config=None, **kwargs):
+        return _RecordingLiveConnection(self._live.connect(model=model, config=config, **kwargs), self._rec, _channel(model, config))
+
+# ---------------------------------------------------------
+# REPLAY
+# ---------------------------------------------------------
+class ReplayExhausted(Exception):
+    pass
+
+class Replayer:
+    """Recorded calls grouped by channel; each replaying session consumes them independently."""
+    def __init__(self, path: str, speed: float = 0.0):
+        self.path = path
+        self.speed = speed
+        self.gen: Dict[str, List[Dict]] = {}
+        self.live: Dict[str, List[List[Dict]]] = {}   # channel -> turns -> events
+        self._keys: Dict[tuple, Dict[str, List[int]]] = {}  # (kind, channel) -> request key -> indices
+        self.stats = {"served": 0, "diverged": 0, "exhausted": 0}
+        self._used: Dict[tuple, set] = {}             # (session, kind, channel) -> consumed indices
+        self._cursors: Dict[tuple, int] = {}          # (session, kind, channel) -> first unconsumed index
+        self._lock = threading.Lock()
+        self._load()
+
+    def _index(self, kind: str, channel: str, key: Optional[str], i: int):
+        if key is not None:
+            self._keys.setdefault((kind, channel), {}).setdefault(key, []).append(i)
+
+    def _load(self):
+        open_turn: Dict[str, List[Dict]] = {}
+        with gzip.open(self.path, "rb") as f:
+            for line in f:
+                e = serializer.loads(line)
+                kind = e.get("k")
+                if kind == "gen":
+                    calls = self.gen.setdefault(e["ch"], [])
+                    self._index("gen", e["ch"], e.get("key"), len(calls))
+                    calls.append(e)
+                elif kind == "live_send":
+                    turn = open_turn[e["ch"]] = []
+                    turns = self.live.setdefault(e["ch"], [])
+                    self._index("live", e["ch"], e.get("key"), len(turns))
+                    turns.append(turn)
+                elif kind == "live" and e["ch"] in open_turn:
+                    open_turn[e["ch"]].append(e)
+        logger.info(f"▶️ Replay loaded {self.path}: {sum(map(len, self.gen.values()))} calls, "
+                    f"{sum(map(len, self.live.values()))} live turns")
+
+    def _next(self, kind: str, channel: str, items: list, request_key: str):
+        """First unconsumed recording with the same request key, else the next one in order."""
+        state = (telemetry.current_session.get(), kind, channel)
+        with self._lock:
+            used = self._used.setdefault(state, set())
+            i = next((j for j in self._keys.get((kind, channel), {}).get(request_key, ()) if j not in used), None)
+            if i is None:
+                i = next((j for j in range(self._cursors.get(state, 0), len(items)) if j not in used), None)
+                if i is None:
+                    self.stats["exhausted"] += 1
+                    raise ReplayExhausted(f"No recorded {kind} left for channel {channel}")
+                self.stats["diverged"] += 1  # request differs from the recording (logic/prompt changed)
+            used.add(i)
+            cursor = self._cursors.get(state, 0)
+            while cursor in used:
+                cursor += 1
+            self._cursors[state] = cursor
+            self.stats["served"] += 1
+            return items[i]
+
+    async def generate(self, model, contents, config):
+        channel = _channel(model, config)
+        e = self._next("gen", channel, self.gen.get(channel, []), _request_key(contents))
+        if self.speed:
+            await asyncio.sleep(e.get("dur", 0) * self.speed)
+        usage = e.get("usage")
+        return SimpleNamespace(text=e.get("text"), usage_metadata=SimpleNamespace(**usage) if usage else None)
+
+    def next_turn(self, channel, input=None):
+        return self._next("live", channel, self.live.get(channel, []), _request_key(str(input)))
+
+    def end_session(self, session_id: str):
+        with self._lock:
+            for state in [s for s in self._used if s[0] == session_id]:
+                self._used.pop(state, None)
+                self._cursors.pop(state, None)
+
+class _ReplayModels:
+    def __init__(self, replayer: Replayer):
+        self._r = replayer
+
+    async def generate_content(self, model, contents, config=None, **kwargs):
+        return await self._r.generate(model, contents, config)
+
+    async def generate_content_stream(self, model, contents, config=None, chunks: int = 4, **kwargs):
+        response = await self._r.generate(model, contents, config)
+        text = response.text or ""
+        step = max(1, -(-len(text) // chunks))
+
+        async def stream():
+            for i in range(0, max(1, len(text)), step):
+                last = i + step >= len(text)
+                yield SimpleNamespace(text=text[i:i + step], usage_metadata=response.usage_metadata if last else None)
+        return stream()
+
+class _ReplayLiveSession:
+    def __init__(self, replayer: Replayer, channel: str):
+        self._r = replayer
+        self._ch = channel
+        self._turn = []
+
+    async def send(self, input=None, end_of_turn=False, **kwargs):
+        self._turn = self._r.next_turn(self._ch, input)
+
+    async def receive(self):
+        last = 0.0
+        for e in self._turn:
+            if self._r.speed:
+                await asyncio.sleep(max(0.0, e["dt"] - last) * self._r.speed)
+                last = e["dt"]
+            audio = e.get("audio")
+            if audio is not None:
+                data = base64.b64decode(audio) if isinstance(audio, str) else b"\x00" * audio
+                yield SimpleNamespace(data=data, server_content=None)
+            if "text" in e or e.get("done"):
+                yield SimpleNamespace(data=None, server_content=SimpleNamespace(
+                    output_transcription=SimpleNamespace(text=e["text"]) if "text" in e else None,
+                    turn_complete=bool(e.get("done")),
+                ))
+
+class _ReplayLiveConnection:
+    def __init__(self, replayer: Replayer, channel: str):
+        self._r = replayer
+        self._ch = channel
+
+    async def __aenter__(self):
+        return _ReplayLiveSession(self._r, self._ch)
+
+    async def __aexit__(self, *exc):
+        return False
+
+class _ReplayLive:
+    def __init__(self, replayer: Replayer):
+        self._r = replayer
+
+    def connect(self, model=None, config=None, **kwargs):
+        return _ReplayLiveConnection(self._r, _channel(model, config))
+
+class ReplayClient:
+    """Drop-in for genai.Client serving Replayer.active."""
+    active: Optional[Replayer] = None
+
+    def __init__(self, *args, **kwargs):
+        self.aio = SimpleNamespace(models=_ReplayModels(self.active), live=_ReplayLive(self.active))
+        self.models = self.aio.models
+
+# ---------------------------------------------------------
+# INSTALL
+# ---------------------------------------------------------
+_active = None   # the installed Recorder or Replayer
+
+def install_recording(directory: str = "recordings", keep_audio: bool = False) -> Recorder:
+    """Wraps genai.Client process-wide so all model traffic is recorded."""
+    from google import genai
+
+    global _active
+    recorder = _active = Recorder(directory, keep_audio)
+    real_client = genai.Client
+
+    def recording_client(*args, **kwargs):
+        client = real_client(*args, **kwargs)
+        aio = SimpleNamespace(models=_RecordingModels(client.aio.models, recorder),
+                              live=_RecordingLive(client.aio.live, recorder))
+        return SimpleNamespace(aio=aio, models=client.models, client=client)
+
+    genai.Client = recording_client
+    logger.info(f"⏺️ Recording model traffic to {directory}/")
+    return recorder
+
+def install_replay(path: str, speed: float = 0.0) -> Replayer:
+    """Replaces genai.Client process-wide with a client serving the recording at `path`."""
+    from google import genai
+
+    global _active
+    ReplayClient.active = _active = Replayer(path, speed)
+    genai.Client = ReplayClient
+    return ReplayClient.active
+
+def end_session(session_id: str):
+    """Drops per-session recorder/replayer state once a session is over (flushing a recording)."""
+    if isinstance(_active, Recorder):
+        _active.close(session_id)
+    elif isinstance(_active, Replayer):
+        _active.end_session(session_id)
+
+def install_from_env():
+    if os.getenv("GENAI_REPLAY"):
+        return install_replay(os.environ["GENAI_REPLAY"], float(os.getenv("GENAI_REPLAY_SPEED", "0")))
+    if os.getenv("GENAI_RECORD_DIR"):
+        return install_recording(os.environ["GENAI_RECORD_DIR"], os.getenv("GENAI_RECORD_AUDIO", "0") == "1")
+    return None
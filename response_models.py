@@ -0,0 +1,385 @@
+# --- response_models.py ---
+# Typed shapes, response schemas (built once at import) and local validation/repair
+# for every logic agent's structured output. Validators build cleaned plain dicts/lists
+# from the decoded JSON (no model objects), drop or fix what they can, and raise
+# ResponseValidationError only when nothing usable is left, so agents fall back less.
+import logging
+from typing import Any, Iterable, List, Optional, Tuple, TypedDict
+
+import serializer
+import telemetry
+
+logger = logging.getLogger("medforce-backend")
+
+telemetry.METRICS.describe("medforce_parse_failures_total", "counter", "Agent responses that could not be used, by agent and kind.")
+telemetry.METRICS.describe("medforce_parse_repairs_total", "counter", "Agent responses repaired locally, by agent and kind.")
+
+class ResponseValidationError(ValueError):
+    pass
+
+# ---------------------------------------------------------
+# TYPES
+# ---------------------------------------------------------
+class RankedQuestion(TypedDict):
+    rank: int
+    qid: str
+
+class TriggerDecision(TypedDict):
+    should_run: bool
+    reason: str
+
+class Diagnosis(TypedDict):
+    diagnosis: str
+    did: str
+    indicators_point: List[str]
+
+class DiagnosisUpdate(TypedDict):
+    diagnosis_list: List[Diagnosis]
+    follow_up_questions: List[str]
+
+class Advice(TypedDict):
+    question: str
+    qid: Optional[str]
+    end_conversation: bool
+    reasoning: str
+
+class Highlight(TypedDict):
+    level: str
+    text: str
+
+# ---------------------------------------------------------
+# SCHEMAS (response_schema for generate_content)
+# ---------------------------------------------------------
+_DIAGNOSIS_ITEM = {"type": "OBJECT", "properties": {"diagnosis": { "type": "STRING" }, "did": { "type": "STRING" }, "indicators_point": { "type": "ARRAY", "items": { "type": "STRING" } }}, "required": ["diagnosis", "did", "indicators_point"]}
+
+RANKING_SCHEMA = {"type": "ARRAY", "items": {"type": "OBJECT", "properties": {"rank": { "type": "INTEGER" }, "qid": { "type": "STRING" }}, "required": ["rank", "qid"]}}
+TRIGGER_SCHEMA = {"type": "OBJECT", "properties": {"should_run": { "type": "BOOLEAN" }, "reason": { "type": "STRING" }}, "required": ["should_run", "reason"]}
+EVALUATION_SCHEMA = {"type": "ARRAY", "items": _DIAGNOSIS_ITEM}
+DIAGNOSIS_SCHEMA = {"type": "OBJECT", "properties": {"diagnosis_list": {"type": "ARRAY", "items": {**_DIAGNOSIS_ITEM, "required": ["diagnosis", "indicators_point", "did"]}}, "follow_up_questions": {"type": "ARRAY", "items": { "type": "STRING" }}}, "required": ["diagnosis_list", "follow_up_questions"]}
+ADVICE_SCHEMA = {"type": "OBJECT", "properties": {"question": { "type": "STRING" }, "qid": { "type": "STRING" }, "end_conversation": { "type": "BOOLEAN" }, "reasoning": { "type": "STRING" }}, "required": ["question", "end_conversation", "reasoning", "qid"]}
+# Streaming: the nurse only needs "question", so it is generated first
+ADVICE_STREAM_SCHEMA = {**ADVICE_SCHEMA, "propertyOrdering": ["question", "qid", "end_conversation", "reasoning"]}
+HIGHLIGHTS_SCHEMA = {"type": "ARRAY", "items": {"type": "OBJECT", "properties": {"level": { "type": "STRING", "enum": ["danger", "warning"] }, "text": { "type": "STRING" }}, "required": ["level", "text"]}}
+
+# ---------------------------------------------------------
+# DECODING
+# ---------------------------------------------------------
+def _close_json(text: str) -> Optional[str]:
+    """Closes the brackets of a truncated JSON document; None if it is not truncation or it
+    ends inside a string (a cut-off value must not pass as complete)."""
+    stack, in_string, escaped = [], False, False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "[{":
+            stack.append("]" if ch == "[" else "}")
+        elif ch in "]}":
+            if not stack:
+                return None
+            stack.pop()
+    if not stack or in_string:
+        return None
+    return text.rstrip().rstrip(",:") + "".join(reversed(stack))
+
+def _loads(text: str) -> Tuple[Any, Optional[str]]:
+    """loads_lenient, also saying which repair applied: None, "fence" or "truncation"."""
+    try:
+        return serializer.loads(text), None
+    except ValueError:
+        pass
+    body = (text or "").strip()
+    if body.startswith("```"):  # fenced block despite response_mime_type
+        body = body.strip("`").removeprefix("json").strip()
+        try:
+            return serializer.loads(body), "fence"
+        except ValueError:
+            pass
+    # Drop the incomplete tail element by element until the remainder closes cleanly
+    for _ in range(64):
+        closed = _close_json(body)
+        if closed is not None:
+            try:
+                return serializer.loads(closed), "truncation"
+            except ValueError:
+                pass
+        cut = max(body.rfind(","), body.rfind("{"), body.rfind("["))
+        if cut <= 0:
+            break
+        body = body[:cut + 1] if body[cut] in "[{" else body[:cut]
+    raise ResponseValidationError("Unparseable JSON")
+
+def loads_lenient(text: str) -> Tuple[Any, bool]:
+    """Decodes JSON, repairing truncated output by dropping the incomplete tail. Returns (data, repaired)."""
+    data, repair = _loads(text)
+    return data, repair is not None
+
+def _payload(response):
+    """Decoded structured output: the SDK's parsed value when present, else the text. Returns (data, repair)."""
+    parsed = getattr(response, "parsed", None)
+    if parsed is not None and not isinstance(parsed, (str, bytes)):
+        if hasattr(parsed, "model_dump"):
+            return parsed.model_dump(), None
+        if isinstance(parsed, list) and parsed and hasattr(parsed[0], "model_dump"):
+            return [p.model_dump() for p in parsed], None
+        return parsed, None
+    return _loads(response.text)
+
+def parse(agent: str, response, validator, *args):
+    """Decodes, validates and repairs a response; counts failures and repairs per agent."""
+    try:
+        data, repair = _payload(response)
+    except Exception:
+        telemetry.METRICS.inc("medforce_parse_failures_total", agent=agent, kind="json")
+        raise
+    if repair:
+        telemetry.METRICS.inc("medforce_parse_repairs_total", agent=agent, kind="json")
+    try:
+        if validator in _TAKES_REPAIRED:
+            result, fixed = validator(data, *args, repaired=repair == "truncation")
+        else:
+            result, fixed = validator(data, *args)
+    except ResponseValidationError:
+        telemetry.METRICS.inc("medforce_parse_failures_total", agent=agent, kind="validation")
+        raise
+    if fixed:
+        telemetry.METRICS.inc("medforce_parse_repairs_total", agent=agent, kind="validation")
+        logger.info(f"🩹 Repaired {agent} output")
+    return result
+
+class StreamingObjectParser:
+    """Incremental parser for one streamed JSON object: feed() text chunks as they arrive
+    and get back the top-level fields completed by that chunk, e.g. {"question": "..."}."""
+    def __init__(self):
+        self.text = ""
+        self.fields: dict = {}
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._key = None
+        self._key_start = None
+        self._value_start = None   # index of the current top-level value, once it has begun
+        self._expect_value = False
+
+    def _emit(self, end: int, out: dict):
+        raw = self.text[self._value_start:end].strip()
+        try:
+            value = serializer.loads(raw)
+        except ValueError:
+            value = None
+        if self._key is not None and value is not None:
+            self.fields[self._key] = out[self._key] = value
+        self._value_start, self._key = None, None
+
+    def feed(self, chunk: str) -> dict:
+        out = {}
+        self.text += chunk
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        if self._key_start is not None:
+                            self._key = serializer.loads(text[self._key_start:i + 1])
+                            self._key_start = None
+                        elif self._value_start is not None:
+                            self._emit(i + 1, out)
+                continue
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    if self._expect_value:
+                        self._value_start, self._expect_value = i, False
+                    else:
+                        self._key_start = i
+            elif ch in "[{":
+                self._depth += 1
+                if self._depth == 2 and self._expect_value:
+                    self._value_start, self._expect_value = i, False
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == 1 and self._value_start is not None:
+                    self._emit(i + 1, out)
+                elif self._depth == 0 and self._value_start is not None:
+                    self._emit(i, out)  # trailing scalar
+            elif self._depth == 1:
+                if ch == ":":
+                    self._expect_value = True
+                elif ch == ",":
+                    if self._value_start is not None:
+                        self._emit(i, out)  # scalar (true/false/number/null)
+                elif self._expect_value and not ch.isspace():
+                    self._value_start, self._expect_value = i, False
+        self._pos = len(text)
+        return out
+
+# ---------------------------------------------------------
+# VALIDATORS: (data, ...) -> (value, repaired)
+# ---------------------------------------------------------
+def _as_bool(value) -> Optional[bool]:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "false", "yes", "no"):
+        return value.strip().lower() in ("true", "yes")
+    if isinstance(value, (int, float)):
+        return bool(value)
+    return None
+
+def _str_list(value) -> Tuple[List[str], bool]:
+    if isinstance(value, str):
+        return [value], True
+    if not isinstance(value, list):
+        return [], value is not None
+    out = [str(v).strip() for v in value if v is not None and str(v).strip()]
+    return out, len(out) != len(value) or any(not isinstance(v, str) for v in value)
+
+def _unwrap_list(data, *keys):
+    """Arrays sometimes arrive wrapped in an object ({"ranking": [...]})."""
+    if isinstance(data, dict):
+        for key in keys + tuple(data):
+            if isinstance(data.get(key), list):
+                return data[key], True
+    return data, False
+
+def validate_ranking(data, valid_qids: Iterable[str], repaired: bool = False) -> Tuple[List[RankedQuestion], bool]:
+    """valid_qids in their current order. Questions the ranker leaves out get deleted, so when
+    a truncated response was repaired the cut-off qids are appended in that order instead."""
+    data, fixed = _unwrap_list(data, "ranking", "questions")
+    if not isinstance(data, list):
+        raise ResponseValidationError("Ranking is not a list")
+    valid_qids = list(valid_qids)
+    valid = set(valid_qids)
+    kept, seen = [], set()
+    for i, item in enumerate(data):
+        qid = str(item.get("qid", "")) if isinstance(item, dict) else ""
+        if qid not in valid or qid in seen:
+            fixed = True
+            continue
+        try:
+            rank = int(item.get("rank"))
+        except (TypeError, ValueError):
+            rank, fixed = i + 1, True
+        seen.add(qid)
+        kept.append((rank, i, qid))
+    if not kept and data:
+        raise ResponseValidationError("No known qids in ranking")
+    kept.sort()
+    ranking = [{"rank": n + 1, "qid": qid} for n, (_, _, qid) in enumerate(kept)]
+    fixed = fixed or any(rank != n + 1 for n, (rank, _, _) in enumerate(kept))
+    missing = [qid for qid in valid_qids if qid not in seen] if repaired else []
+    if missing:
+        ranking += [{"rank": len(ranking) + n + 1, "qid": qid} for n, qid in enumerate(missing)]
+        fixed = True
+    return ranking, fixed
+
+# Validators that parse() also tells whether the payload was cut off and repaired
+_TAKES_REPAIRED = {validate_ranking}
+
+def validate_trigger(data) -> Tuple[TriggerDecision, bool]:
+    if not isinstance(data, dict):
+        raise ResponseValidationError("Trigger decision is not an object")
+    should_run = _as_bool(data.get("should_run"))
+    if should_run is None:
+        raise ResponseValidationError("should_run missing")
+    reason = data.get("reason")
+    fixed = not isinstance(data.get("should_run"), bool) or not isinstance(reason, str)
+    return {"should_run": should_run, "reason": reason if isinstance(reason, str) else ""}, fixed
+
+def _validate_diagnosis_items(items) -> Tuple[List[Diagnosis], bool]:
+    if not isinstance(items, list):
+        raise ResponseValidationError("Diagnosis list is not a list")
+    out, fixed = [], False
+    for item in items:
+        if not isinstance(item, dict) or not str(item.get("diagnosis") or "").strip():
+            fixed = True
+            continue
+        indicators, ind_fixed = _str_list(item.get("indicators_point"))
+        did = str(item.get("did") or "").strip()
+        if not did:
+            # Stable id from the label so later cycles merge into the same entry
+            did = "D-" + "".join(c for c in item["diagnosis"].lower() if c.isalnum())[:24]
+            fixed = True
+        if ind_fixed or not isinstance(item.get("did"), str) or set(item) - {"diagnosis", "did", "indicators_point"}:
+            fixed = True
+        out.append({"diagnosis": str(item["diagnosis"]).strip(), "did": did, "indicators_point": indicators})
+    return out, fixed
+
+def validate_evaluation(data) -> Tuple[List[Diagnosis], bool]:
+    data, unwrapped = _unwrap_list(data, "diagnosis_list", "diagnoses")
+    items, fixed = _validate_diagnosis_items(data)
+    if not items and data:
+        raise ResponseValidationError("No usable diagnoses")
+    return items, fixed or unwrapped
+
+def validate_diagnosis(data) -> Tuple[DiagnosisUpdate, bool]:
+    if isinstance(data, list):  # bare diagnosis list
+        data, fixed = {"diagnosis_list": data}, True
+    elif isinstance(data, dict):
+        fixed = False
+    else:
+        raise ResponseValidationError("Diagnosis update is not an object")
+    if "diagnosis_list" not in data and "follow_up_questions" not in data:
+        raise ResponseValidationError("Diagnosis update has neither field")
+    items, items_fixed = _validate_diagnosis_items(data.get("diagnosis_list") or [])
+    questions, q_fixed = _str_list(data.get("follow_up_questions"))
+    return {"diagnosis_list": items, "follow_up_questions": questions}, fixed or items_fixed or q_fixed
+
+def validate_advice(data, valid_qids: Iterable[str] = None) -> Tuple[Advice, bool]:
+    if not isinstance(data, dict):
+        raise ResponseValidationError("Advice is not an object")
+    question = data.get("question")
+    if not isinstance(question, str) or not question.strip():
+        raise ResponseValidationError("No question in advice")
+    fixed = False
+    end = _as_bool(data.get("end_conversation"))
+    if end is None or not isinstance(data.get("end_conversation"), bool):
+        end, fixed = bool(end), True
+    qid = data.get("qid") or None
+    if qid is not None and valid_qids is not None and str(qid) not in set(valid_qids):
+        qid, fixed = None, True  # unknown qid would mark nothing as asked
+    reasoning = data.get("reasoning")
+    if not isinstance(reasoning, str):
+        reasoning, fixed = "", True
+    return {"question": question.strip(), "qid": str(qid) if qid is not None else None,
+            "end_conversation": end, "reasoning": reasoning}, fixed
+
+def validate_highlights(data, answer: str = None) -> Tuple[List[Highlight], bool]:
+    data, fixed = _unwrap_list(data, "highlights")
+    if not isinstance(data, list):
+        raise ResponseValidationError("Highlights are not a list")
+    out, seen = [], set()
+    lowered = answer.lower() if answer and len(answer.lower()) == len(answer) else None
+    for item in data:
+        text = item.get("text") if isinstance(item, dict) else None
+        if not isinstance(text, str) or not text.strip():
+            fixed = True
+            continue
+        level = item.get("level")
+        if level not in ("danger", "warning"):
+            level, fixed = "warning", True
+        if answer is not None and text not in answer:
+            # Must be an exact substring; recover the original casing if only that differs
+            pos = lowered.find(text.lower()) if lowered is not None else -1
+            fixed = True
+            if pos < 0:
+                continue
+            text = answer[pos:pos + len(text)]
+        if text in seen:
+            fixed = True
+            continue
+        seen.add(text)
+        out.append({"level": level, "text": text})
+    return out, fixed
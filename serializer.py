@@ -0,0 +1,53 @@
+# --- serializer.py ---
+# JSON encode/decode used on hot paths (HTTP responses, WebSocket frames, agent
+# prompts). Uses orjson when installed, stdlib json otherwise; both produce compact
+# UTF-8 JSON. JSON_BACKEND=stdlib forces the fallback.
+import os
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if os.getenv("JSON_BACKEND", "").lower() == "stdlib":
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "stdlib"
+
+if orjson is not None:
+    _OPTS = orjson.OPT_NON_STR_KEYS
+
+    def _default(obj):
+        # Same fallback the stdlib path uses for unknown types
+        return str(obj)
+
+    def dumps_bytes(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default, option=_OPTS)
+
+    def dumps(obj: Any) -> str:
+        return orjson.dumps(obj, default=_default, option=_OPTS).decode("utf-8")
+
+    def loads(data) -> Any:
+        return orjson.loads(data)
+else:
+    def dumps(obj: Any) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str)
+
+    def dumps_bytes(obj: Any) -> bytes:
+        return dumps(obj).encode("utf-8")
+
+    def loads(data) -> Any:
+        return json.loads(data)
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with the fast serializer."""
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
+
+async def send_json(websocket, data: Any):
+    """websocket.send_json equivalent (text frame) using the fast serializer."""
+    await websocket.send_text(dumps(data))
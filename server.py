@@ -1,17 +1,30 @@
 # --- server.py ---
 import os
-import json
+import asyncio
 import logging
+import time
 import traceback
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, Response, HTMLResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response, HTMLResponse
 from pydantic import BaseModel
 from google.cloud import storage
 from dotenv import load_dotenv
 
 # --- Local Modules ---
-from simulation import SimulationManager
+from simulation import SimulationManager, QUESTION_LIST
+import snapshot_store
+import cluster
+import telemetry
+import loop_monitor
+import batch_runner
+import analytics_store
+import recorder
+from static_assets import StaticAsset
+import serializer
+from serializer import FastJSONResponse
+from utils import invalidate_profile_cache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -19,7 +32,10 @@ logger = logging.getLogger("medforce-backend")
 
 load_dotenv()
 
-app = FastAPI()
+# GENAI_RECORD_DIR / GENAI_REPLAY switch model traffic to record or replay mode
+recorder.install_from_env()
+
+app = FastAPI(default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,6 +45,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compresses larger JSON/text responses (file listings, patient files); responses that
+# already carry a Content-Encoding (the precompressed admin UI) pass through untouched.
+app.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("GZIP_MIN_SIZE", "1000")))
+
+# Admin UI is read once; ADMIN_UI_RELOAD=1 re-reads it when the file changes (dev)
+ADMIN_UI = StaticAsset("admin_ui.html", "text/html", reload=os.getenv("ADMIN_UI_RELOAD", "0") == "1")
+
+@app.on_event("startup")
+async def check_cluster_config():
+    cluster.check_config()
+
+@app.on_event("startup")
+async def start_loop_monitor():
+    loop_monitor.start()
+
+@app.on_event("startup")
+async def load_analytics():
+    # Segments load in the background; the first query/record waits for it if needed
+    if analytics_store.ANALYTICS_ENABLED:
+        asyncio.get_running_loop().run_in_executor(None, analytics_store.get_store)
+
 # --- Pydantic Models ---
 
 class PatientFileRequest(BaseModel):
@@ -44,17 +81,87 @@ class AdminFileSaveRequest(BaseModel):
 class AdminPatientRequest(BaseModel):
     pid: str
 
+class BatchRequest(BaseModel):
+    pids: list = []        # empty = every patient
+    max_cycles: int = 12
+    concurrency: int = 4
+
 # --- Endpoints ---
 
 @app.get("/admin", response_class=HTMLResponse)
-async def get_admin_ui():
-    """Serves the Admin UI HTML file."""
-    try:
-        # Ensure admin_ui.html is in the same directory as server.py
-        with open("admin_ui.html", "r", encoding="utf-8") as f:
-            return HTMLResponse(content=f.read())
-    except FileNotFoundError:
+async def get_admin_ui(request: Request):
+    """Serves the Admin UI HTML file (precompressed, ETag-revalidated)."""
+    # Ensure admin_ui.html is in the same directory as server.py
+    response = ADMIN_UI.response(request.headers.get("accept-encoding"), request.headers.get("if-none-match"))
+    if response is None:
         return HTMLResponse(content="<h1>Error: admin_ui.html not found on server.</h1>", status_code=404)
+    return response
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint (this worker's counters, gauges and histograms)."""
+    return Response(content=telemetry.METRICS.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/admin/trace/{session_id}")
+async def get_session_trace(session_id: str):
+    """Per-stage spans of a recent session served by this worker."""
+    spans = telemetry.TRACES.get(session_id)
+    if spans is None:
+        entry = await asyncio.to_thread(cluster.get_registry().lookup, session_id)
+        return FastJSONResponse(status_code=404, content={
+            "error": "No trace for this session on this worker",
+            "worker_id": cluster.WORKER_ID,
+            "owner": entry["worker_id"] if entry else None,
+        })
+    return FastJSONResponse(content={"session_id": session_id, "worker_id": cluster.WORKER_ID, "spans": spans})
+
+@app.get("/api/admin/loop-health")
+async def get_loop_health():
+    """Event-loop lag and recent stalls (with stack traces when LOOP_DEBUG=1)."""
+    monitor = loop_monitor.get_monitor()
+    if monitor is None:
+        return FastJSONResponse(status_code=503, content={"error": "Loop monitor not running"})
+    return FastJSONResponse(content={"worker_id": cluster.WORKER_ID, **monitor.snapshot()})
+
+@app.post("/api/admin/batch")
+async def start_batch(request: BatchRequest):
+    """Starts a headless text-only batch of interviews; results go to batches/<job_id>.jsonl."""
+    try:
+        pids = request.pids or await asyncio.to_thread(batch_runner.list_patient_ids)
+        job = batch_runner.start_job(pids, request.max_cycles, request.concurrency)
+        logger.info(f"🧪 Batch {job['job_id']} started: {len(pids)} patients")
+        return FastJSONResponse(content=batch_runner.get_job(job["job_id"]))
+    except Exception as e:
+        logger.error(f"Batch Start Error: {e}")
+        return FastJSONResponse(status_code=500, content={"error": str(e)})
+
+@app.get("/api/admin/batch/{job_id}")
+async def get_batch(job_id: str):
+    """Progress and summary (throughput, cost) of a batch job on this worker."""
+    job = batch_runner.get_job(job_id)
+    if job is None:
+        return FastJSONResponse(status_code=404, content={"error": "Unknown batch job"})
+    return FastJSONResponse(content=job)
+
+@app.get("/api/admin/analytics")
+async def get_analytics(patient_id: str = None, top: int = 20, reload: bool = False, source: str = "live"):
+    """Cross-session aggregates: diagnosis frequency, question ask rates, turn latency percentiles.
+    Live sessions only by default; source=batch for batch runs, source=all for both."""
+    source = None if source == "all" else source
+    def query():
+        store = analytics_store.get_store(reload=reload)
+        return {
+            "worker_id": cluster.WORKER_ID,
+            "summary": store.summary(),
+            "diagnoses": store.diagnosis_frequency(patient_id, top, source),
+            "questions": store.question_ask_rates(patient_id, top, source),
+            "turn_latency": store.turn_latency(patient_id, source),
+        }
+    try:
+        return FastJSONResponse(content=await asyncio.to_thread(query))
+    except Exception as e:
+        logger.error(f"Analytics Query Error: {e}")
+        return FastJSONResponse(status_code=500, content={"error": str(e)})
 
 @app.websocket("/ws/simulation")
 async def websocket_endpoint(websocket: WebSocket):
@@ -67,15 +174,33 @@ async def websocket_endpoint(websocket: WebSocket):
         if isinstance(data, dict) and data.get("type") == "start":
             patient_id = data.get("patient_id", "P0001")
             gender = data.get("gender")
+            fast_start = bool(data.get("fast_start", False))
             
-            manager = SimulationManager(websocket, patient_id, gender)
+            manager = SimulationManager(websocket, patient_id, gender, fast_start=fast_start)
+            await manager.run()
+
+        elif isinstance(data, dict) and data.get("type") == "resume":
+            session_id = data.get("session_id")
+            # Another manager still drives this session, on this worker or another (e.g. it has
+            # not noticed the old socket drop yet). Workers cannot be addressed individually, so the
+            # client retries; any worker resumes it once the owner unregisters or its heartbeat goes stale.
+            owner = await asyncio.to_thread(cluster.get_registry().live_owner, session_id) if session_id else None
+            if owner:
+                stale_in = cluster.SESSION_TTL - (time.time() - owner["updated"])
+                await websocket.send_json({"type": "session_busy", "session_id": session_id,
+                                           "worker_id": owner["worker_id"], "retry_after": round(min(5.0, max(1.0, stale_in)), 1)})
+                return
+            manager = await SimulationManager.resume(websocket, session_id) if session_id else None
+            if manager is None:
+                await websocket.send_json({"type": "system", "message": f"Unknown or finished session: {session_id}"})
+                return
             await manager.run()
             
     except WebSocketDisconnect:
         logger.info("Client disconnected")
         if manager:
             manager.running = False
-            if hasattr(manager, 'logic_thread'): 
+            if manager.logic_thread: 
                 manager.logic_thread.stop()
     except Exception as e:
         traceback.print_exc()
@@ -85,6 +210,7 @@ async def websocket_endpoint(websocket: WebSocket):
 
 
 @app.post("/api/get-patient-file")
+@telemetry.gcs_endpoint("get_file")
 def get_patient_file(request: PatientFileRequest):
     """
     Retrieves a file from gs://clinic_sim/patient_profile/{pid}/{file_name}
@@ -101,7 +227,7 @@ def get_patient_file(request: PatientFileRequest):
 
         if not blob.exists():
             logger.warning(f"File not found: {blob_path}")
-            return JSONResponse(
+            return FastJSONResponse(
                 status_code=404, 
                 content={"error": "File not found", "path": blob_path}
             )
@@ -110,7 +236,7 @@ def get_patient_file(request: PatientFileRequest):
 
         if file_ext == 'json':
             content = blob.download_as_text()
-            return JSONResponse(content=json.loads(content))
+            return FastJSONResponse(content=serializer.loads(content))
         elif file_ext in ['md', 'txt']:
             content = blob.download_as_text()
             return Response(content=content, media_type="text/markdown")
@@ -124,7 +250,7 @@ def get_patient_file(request: PatientFileRequest):
 
     except Exception as e:
         logger.error(f"GCS API Error: {e}")
-        return JSONResponse(
+        return FastJSONResponse(
             status_code=500, 
             content={"error": str(e)}
         )
@@ -135,6 +261,7 @@ def get_patient_file(request: PatientFileRequest):
 # ==========================================
 
 @app.get("/api/admin/list-files/{pid}")
+@telemetry.gcs_endpoint("list_files")
 def list_patient_files(pid: str):
     """Lists all files in GCS for a specific patient ID."""
     BUCKET_NAME = "clinic_sim"
@@ -156,14 +283,15 @@ def list_patient_files(pid: str):
                     "updated": blob.updated.isoformat() if blob.updated else None
                 })
         
-        return JSONResponse(content={"files": file_list})
+        return FastJSONResponse(content={"files": file_list})
     except Exception as e:
         logger.error(f"List Files Error: {e}")
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        return FastJSONResponse(status_code=500, content={"error": str(e)})
 
 @app.post("/api/admin/save-file")
-def save_patient_file(request: AdminFileSaveRequest):
-    """Creates or Updates a text-based file."""
+@telemetry.gcs_endpoint("save_file")
+def save_patient_file(request: AdminFileSaveRequest, background_tasks: BackgroundTasks):
+    """Creates or Updates a text-based file. Saving patient_info.md re-warms its diagnosis snapshot."""
     BUCKET_NAME = "clinic_sim"
     blob_path = f"patient_profile/{request.pid}/{request.file_name}"
     
@@ -176,12 +304,18 @@ def save_patient_file(request: AdminFileSaveRequest):
         blob.upload_from_string(request.content, content_type="text/plain")
         
         logger.info(f"💾 Saved file: {blob_path}")
-        return JSONResponse(content={"message": "File saved successfully", "path": blob_path})
+        invalidate_profile_cache(request.pid, request.file_name)
+
+        if request.file_name == "patient_info.md":
+            background_tasks.add_task(snapshot_store.warm_patient, request.pid, request.content, QUESTION_LIST)
+
+        return FastJSONResponse(content={"message": "File saved successfully", "path": blob_path})
     except Exception as e:
         logger.error(f"Save File Error: {e}")
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        return FastJSONResponse(status_code=500, content={"error": str(e)})
 
 @app.delete("/api/admin/delete-file")
+@telemetry.gcs_endpoint("delete_file")
 def delete_patient_file(pid: str, file_name: str):
     """Deletes a file."""
     BUCKET_NAME = "clinic_sim"
@@ -194,16 +328,18 @@ def delete_patient_file(pid: str, file_name: str):
         
         if blob.exists():
             blob.delete()
+            invalidate_profile_cache(pid, file_name)
             logger.info(f"🗑️ Deleted file: {blob_path}")
-            return JSONResponse(content={"message": "File deleted successfully"})
+            return FastJSONResponse(content={"message": "File deleted successfully"})
         else:
-            return JSONResponse(status_code=404, content={"error": "File not found"})
+            return FastJSONResponse(status_code=404, content={"error": "File not found"})
             
     except Exception as e:
         logger.error(f"Delete File Error: {e}")
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        return FastJSONResponse(status_code=500, content={"error": str(e)})
 
 @app.get("/api/admin/list-patients")
+@telemetry.gcs_endpoint("list_patients")
 def list_patients():
     """Lists all 'folders' (prefixes) under patient_profile/"""
     BUCKET_NAME = "clinic_sim"
@@ -224,12 +360,13 @@ def list_patients():
             if parts:
                 patients.append(parts[-1])
                 
-        return JSONResponse(content={"patients": patients})
+        return FastJSONResponse(content={"patients": patients})
     except Exception as e:
         logger.error(f"List Patients Error: {e}")
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        return FastJSONResponse(status_code=500, content={"error": str(e)})
 
 @app.post("/api/admin/create-patient")
+@telemetry.gcs_endpoint("create_patient")
 def create_patient(request: AdminPatientRequest):
     """Creates a new patient folder by creating an initial empty file."""
     BUCKET_NAME = "clinic_sim"
@@ -242,15 +379,16 @@ def create_patient(request: AdminPatientRequest):
         blob = bucket.blob(blob_path)
         
         if blob.exists():
-             return JSONResponse(status_code=400, content={"error": "Patient already exists"})
+             return FastJSONResponse(status_code=400, content={"error": "Patient already exists"})
 
         blob.upload_from_string("# Patient Profile\nName: \nAge: ", content_type="text/markdown")
         
-        return JSONResponse(content={"message": "Patient created", "pid": request.pid})
+        return FastJSONResponse(content={"message": "Patient created", "pid": request.pid})
     except Exception as e:
-        return JSONResponse(status_code=500, content={"error": str(e)})
+        return FastJSONResponse(status_code=500, content={"error": str(e)})
 
 @app.delete("/api/admin/delete-patient")
+@telemetry.gcs_endpoint("delete_patient")
 def delete_patient(pid: str):
     """Deletes a patient folder and ALL files inside it."""
     BUCKET_NAME = "clinic_sim"
@@ -262,12 +400,14 @@ def delete_patient(pid: str):
         blobs = list(bucket.list_blobs(prefix=prefix))
         
         if not blobs:
-            return JSONResponse(status_code=404, content={"error": "Patient not found"})
+            return FastJSONResponse(status_code=404, content={"error": "Patient not found"})
 
         bucket.delete_blobs(blobs)
+        for blob in blobs:
+            invalidate_profile_cache(pid, blob.name[len(prefix):])
         logger.info(f"🗑️ Deleted patient folder: {prefix}")
-        return JSONResponse(content={"message": f"Deleted {len(blobs)} files for patient {pid}"})
+        return FastJSONResponse(content={"message": f"Deleted {len(blobs)} files for patient {pid}"})
             
     except Exception as e:
         logger.error(f"Delete Patient Error: {e}")
-        return JSONResponse(status_code=500, content={"error": str(e)})
\ No newline at end of file
+        return FastJSONResponse(status_code=500, content={"error": str(e)})
\ No newline at end of file
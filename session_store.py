@@ -0,0 +1,237 @@
+# --- session_store.py ---
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Optional, List, Dict, Any
+
+logger = logging.getLogger("medforce-backend")
+
+# Retention (seconds since the last checkpoint): finished sessions are only kept for
+# inspection, unfinished ones for resuming. Pruned at most every SESSION_PRUNE_INTERVAL.
+FINISHED_RETENTION = float(os.getenv("SESSION_RETENTION", str(24 * 3600)))
+IDLE_RETENTION = float(os.getenv("SESSION_IDLE_RETENTION", str(7 * 24 * 3600)))
+PRUNE_INTERVAL = float(os.getenv("SESSION_PRUNE_INTERVAL", "600"))
+
+class SessionStore:
+    """
+    Pluggable persistence for resumable simulations.
+
+    A session is a `meta` dict (patient_id, gender, ...) written once, the latest
+    `state` (question/diagnosis pools, loop variables), replaced on every checkpoint,
+    and the transcript, stored as append-only deltas so checkpoints stay small.
+    Old sessions are pruned on create() (see FINISHED_RETENTION / IDLE_RETENTION).
+    """
+    _last_prune = 0.0
+
+    def create(self, session_id: str, meta: Dict[str, Any]):
+        raise NotImplementedError
+
+    def prune(self, finished_ttl: float = None, idle_ttl: float = None) -> int:
+        """Deletes finished sessions older than finished_ttl and any older than idle_ttl; returns the count."""
+        raise NotImplementedError
+
+    def _maybe_prune(self):
+        now = time.time()
+        if now - self._last_prune < PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        try:
+            removed = self.prune()
+            if removed:
+                logger.info(f"🧹 Pruned {removed} old sessions")
+        except Exception as e:
+            logger.error(f"Session Prune Error: {e}")
+
+    def checkpoint(self, session_id: str, transcript_delta: List[Dict], state: Dict[str, Any], finished: bool = False):
+        raise NotImplementedError
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Returns {"meta", "state", "transcript", "finished"} or None if unknown."""
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+class SQLiteSessionStore(SessionStore):
+    def __init__(self, path: str = "sessions.db"):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, meta TEXT NOT NULL, state TEXT, "
+                "finished INTEGER NOT NULL DEFAULT 0, seq INTEGER NOT NULL DEFAULT 0, updated REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS transcript_deltas ("
+                "session_id TEXT NOT NULL, seq INTEGER NOT NULL, entries TEXT NOT NULL, "
+                "PRIMARY KEY (session_id, seq))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+
+    def _connect(self):
+        # One short-lived connection per call keeps this safe across threads
+        return sqlite3.connect(self.path, timeout=10)
+
+    def create(self, session_id, meta):
+        self._maybe_prune()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, meta, updated) VALUES (?, ?, ?)",
+                (session_id, json.dumps(meta), time.time())
+            )
+
+    def prune(self, finished_ttl=None, idle_ttl=None):
+        now = time.time()
+        finished_before = now - (FINISHED_RETENTION if finished_ttl is None else finished_ttl)
+        idle_before = now - (IDLE_RETENTION if idle_ttl is None else idle_ttl)
+        where = "(finished = 1 AND updated < ?) OR updated < ?"
+        with self._connect() as conn:
+            conn.execute(
+                f"DELETE FROM transcript_deltas WHERE session_id IN (SELECT session_id FROM sessions WHERE {where})",
+                (finished_before, idle_before)
+            )
+            return conn.execute(f"DELETE FROM sessions WHERE {where}", (finished_before, idle_before)).rowcount
+
+    def checkpoint(self, session_id, transcript_delta, state, finished=False):
+        with self._connect() as conn:
+            row = conn.execute("SELECT seq FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return
+            seq = row[0] + 1
+            if transcript_delta:
+                conn.execute(
+                    "INSERT INTO transcript_deltas (session_id, seq, entries) VALUES (?, ?, ?)",
+                    (session_id, seq, json.dumps(transcript_delta))
+                )
+            conn.execute(
+                "UPDATE sessions SET state = ?, finished = ?, seq = ?, updated = ? WHERE session_id = ?",
+                (json.dumps(state), int(finished), seq, time.time(), session_id)
+            )
+
+    def load(self, session_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT meta, state, finished FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            transcript = []
+            for (entries,) in conn.execute(
+                "SELECT entries FROM transcript_deltas WHERE session_id = ? ORDER BY seq", (session_id,)
+            ):
+                transcript.extend(json.loads(entries))
+        return {
+            "meta": json.loads(row[0]),
+            "state": json.loads(row[1]) if row[1] else None,
+            "transcript": transcript,
+            "finished": bool(row[2]),
+        }
+
+    def delete(self, session_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM transcript_deltas WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+class FileSessionStore(SessionStore):
+    """One directory per session: meta.json, state.json (replaced) and transcript.jsonl (appended)."""
+    def __init__(self, root: str = "sessions"):
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, session_id):
+        return os.path.join(self.root, os.path.basename(session_id))
+
+    def _write_json(self, path, data):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def create(self, session_id, meta):
+        self._maybe_prune()
+        with self._lock:
+            os.makedirs(self._dir(session_id), exist_ok=True)
+            self._write_json(os.path.join(self._dir(session_id), "meta.json"), meta)
+
+    def checkpoint(self, session_id, transcript_delta, state, finished=False):
+        d = self._dir(session_id)
+        with self._lock:
+            if not os.path.isdir(d):
+                return
+            if transcript_delta:
+                with open(os.path.join(d, "transcript.jsonl"), "a", encoding="utf-8") as f:
+                    for entry in transcript_delta:
+                        f.write(json.dumps(entry) + "\n")
+            self._write_json(os.path.join(d, "state.json"), {"state": state, "finished": finished})
+
+    def load(self, session_id):
+        d = self._dir(session_id)
+        try:
+            with open(os.path.join(d, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        state, finished = None, False
+        try:
+            with open(os.path.join(d, "state.json"), "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            state, finished = saved.get("state"), saved.get("finished", False)
+        except (OSError, ValueError):
+            pass
+        transcript = []
+        try:
+            with open(os.path.join(d, "transcript.jsonl"), "r", encoding="utf-8") as f:
+                transcript = [json.loads(line) for line in f if line.strip()]
+        except OSError:
+            pass
+        return {"meta": meta, "state": state, "transcript": transcript, "finished": finished}
+
+    def prune(self, finished_ttl=None, idle_ttl=None):
+        now = time.time()
+        finished_ttl = FINISHED_RETENTION if finished_ttl is None else finished_ttl
+        idle_ttl = IDLE_RETENTION if idle_ttl is None else idle_ttl
+        removed = 0
+        for name in os.listdir(self.root):
+            d = os.path.join(self.root, name)
+            state_path = os.path.join(d, "state.json")
+            try:
+                age = now - os.path.getmtime(state_path if os.path.exists(state_path) else os.path.join(d, "meta.json"))
+            except OSError:
+                continue
+            finished = False
+            if age > finished_ttl:
+                try:
+                    with open(state_path, "r", encoding="utf-8") as f:
+                        finished = bool(json.load(f).get("finished"))
+                except (OSError, ValueError):
+                    pass
+            if age > idle_ttl or (finished and age > finished_ttl):
+                self.delete(name)
+                removed += 1
+        return removed
+
+    def delete(self, session_id):
+        d = self._dir(session_id)
+        with self._lock:
+            for name in ("meta.json", "state.json", "transcript.jsonl"):
+                try: os.remove(os.path.join(d, name))
+                except OSError: pass
+            try: os.rmdir(d)
+            except OSError: pass
+
+_store = None
+
+def get_store() -> SessionStore:
+    """Process-wide store chosen by SESSION_STORE ('sqlite' or 'file')."""
+    global _store
+    if _store is None:
+        kind = os.getenv("SESSION_STORE", "sqlite").lower()
+        if kind == "file":
+            _store = FileSessionStore(os.getenv("SESSION_DIR", "sessions"))
+        else:
+            _store = SQLiteSessionStore(os.getenv("SESSION_DB", "sessions.db"))
+    return _store
@@ -1,21 +1,38 @@
 # --- simulation.py ---
+import os
 import asyncio
 import threading
 import copy
 import json
 import logging
+import time
+import uuid
 import datetime
 import contextlib
+import weakref
 from fastapi import WebSocket
 
 # Local Imports
 import agents
 import question_manager
 import diagnosis_manager
-from utils import fetch_gcs_text_internal
+import snapshot_store
+import session_store
+import cluster
+import highlight_matcher
+import telemetry
+import analytics_store
+import recorder
+from utils import fetch_gcs_texts_async
 
 logger = logging.getLogger("medforce-backend")
 
+# Refine the local patient-answer highlights with the highlighter model in the background
+HIGHLIGHT_REFINE = os.getenv("HIGHLIGHT_REFINE", "1") == "1"
+
+# Stream the advisor response and hand its "question" to the nurse before the rest arrives
+ADVISOR_STREAM = os.getenv("ADVISOR_STREAM", "1") == "1"
+
 # --- LOAD STATIC DATA ---
 try:
     with open("questions.json", 'r') as file:
@@ -27,6 +44,16 @@ except Exception as e:
     QUESTION_LIST = []
     NURSE_PROMPT = "You are a nurse."
 
+# Live objects on this worker, read by the /metrics collector below
+_ACTIVE_MANAGERS = weakref.WeakSet()
+_LOGIC_THREADS = weakref.WeakSet()
+
+def _collect_metrics():
+    yield "medforce_active_sessions", {}, sum(1 for m in list(_ACTIVE_MANAGERS) if m.running)
+    yield "medforce_logic_pending_turns", {}, sum(t.pending_turns() for t in list(_LOGIC_THREADS) if t.running)
+
+telemetry.METRICS.add_collector(_collect_metrics)
+
 class TranscriptManager:
     def __init__(self):
         self.history = []
@@ -38,14 +65,69 @@ class TranscriptManager:
             if speaker == "PATIENT": entry["highlight"] = highlight_data or []
             self.history.append(entry)
             logger.info(f"📝 {speaker}: {text[:50]}...")
+            return len(self.history) - 1
+
+    def update_highlight(self, index, highlight_data):
+        with self._lock:
+            if 0 <= index < len(self.history):
+                self.history[index]["highlight"] = highlight_data
     
     def get_history(self):
         with self._lock:
             return copy.deepcopy(self.history)
 
+    def entries_since(self, count):
+        with self._lock:
+            return copy.deepcopy(self.history[count:])
+
+    def restore(self, entries):
+        with self._lock:
+            self.history = list(entries)
+
+async def enter_concurrently(stack, *contexts):
+    """Enters async contexts in parallel; every one that opened is closed with the stack, even if another failed."""
+    tasks = [asyncio.ensure_future(cm.__aenter__()) for cm in contexts]
+    try:
+        await asyncio.wait(tasks)
+    finally:
+        for cm, task in zip(contexts, tasks):
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled() and task.exception() is None:
+                stack.push_async_exit(cm)
+    return [task.result() for task in tasks]
+
+async def run_logic_cycle(history, dm, qm, diagnoser, evaluator, ranker, cycle=0):
+    """One clinical logic pass over the transcript; returns the consolidated diagnoses."""
+    # 1. Diagnose
+    with telemetry.span("logic:diagnose", cycle=cycle, turns=len(history)):
+        diag_res = await diagnoser.get_diagnosis_update(history, dm.get_diagnosis_basic())
+        dm.update_diagnoses(diag_res.get("diagnosis_list"))
+    
+    # 2. Evaluate (local merge; evaluator model only for ambiguous candidates)
+    with telemetry.span("logic:consolidate", cycle=cycle):
+        avoided = await dm.consolidate(
+            diag_res.get("diagnosis_list"),
+            lambda pool, ambiguous: evaluator.evaluate_diagnoses(pool, ambiguous, history)
+        )
+    if avoided:
+        logger.info(f"🧮 Local merge, evaluator skipped ({dm.merge_stats})")
+    
+    # 3. Questions
+    qm.add_questions_from_text(diag_res.get("follow_up_questions"))
+    
+    # 4. Rank
+    with telemetry.span("logic:rank", cycle=cycle):
+        diag_stream = dm.get_consolidated_diagnoses()
+        q_list = qm.get_recommend_question()
+        ranked_q = await ranker.rank_questions(history, diag_stream, q_list)
+        qm.update_ranking(ranked_q)
+    return diag_stream
+
 class ClinicalLogicThread(threading.Thread):
-    def __init__(self, transcript_manager, qm, dm, shared_state, main_loop, websocket):
+    def __init__(self, transcript_manager, qm, dm, shared_state, main_loop, websocket, processed_count=0, session_id=None):
         super().__init__()
+        self.session_id = session_id
         self.tm = transcript_manager
         self.qm = qm
         self.dm = dm
@@ -55,11 +137,16 @@ class ClinicalLogicThread(threading.Thread):
         
         self.running = True
         self.daemon = True 
-        self.last_processed_count = 0
+        self.last_processed_count = processed_count
+        _LOGIC_THREADS.add(self)
+
+    def pending_turns(self):
+        return max(0, len(self.tm.history) - self.last_processed_count)
 
     def run(self):
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
+        telemetry.current_session.set(self.session_id)
         
         self.trigger = agents.DiagnosisTriggerAgent()
         self.diagnoser = agents.DiagnoseAgent(patient_info=self.shared_state.get('patient_info'))
@@ -76,7 +163,8 @@ class ClinicalLogicThread(threading.Thread):
                     self.websocket.send_json({"type": type_str, "data": data}),
                     self.main_loop
                 )
-                future.result(timeout=1)
+                # Await instead of future.result() so this thread's loop is not blocked
+                await asyncio.wait_for(asyncio.wrap_future(future), timeout=1)
             except Exception:
                 pass
 
@@ -89,30 +177,17 @@ class ClinicalLogicThread(threading.Thread):
                 if current_len > self.last_processed_count:
                     logger.info(f"⚡ New Transcript Detected ({current_len} turns). Running Logic...")
                     
-                    # 1. Diagnose
-                    diag_res = await self.diagnoser.get_diagnosis_update(history, self.dm.get_diagnosis_basic())
-                    self.dm.update_diagnoses(diag_res.get("diagnosis_list"))
-                    
-                    # 2. Evaluate
-                    merged_diag = await self.evaluator.evaluate_diagnoses(
-                        self.dm.get_consolidated_diagnoses_basic(),
-                        diag_res.get("diagnosis_list"), 
-                        history
+                    cycle = self.shared_state.get("cycle", 0)
+
+                    # 1-4. Diagnose, evaluate, questions, rank
+                    diag_stream = await run_logic_cycle(
+                        history, self.dm, self.qm, self.diagnoser, self.evaluator, self.ranker, cycle
                     )
-                    self.dm.set_consolidated_diagnoses(merged_diag)
-                    
-                    # 3. Questions
-                    self.qm.add_questions_from_text(diag_res.get("follow_up_questions"))
-                    
-                    # 4. Rank
-                    diag_stream = self.dm.get_consolidated_diagnoses()
-                    q_list = self.qm.get_recommend_question()
-                    ranked_q = await self.ranker.rank_questions(history, diag_stream, q_list)
-                    self.qm.update_ranking(ranked_q)
 
                     # 5. Push
-                    await self._push_update("diagnosis", diag_stream)
-                    await self._push_update("questions", self.qm.get_questions())
+                    with telemetry.span("logic:push", cycle=cycle):
+                        await self._push_update("diagnosis", diag_stream)
+                        await self._push_update("questions", self.qm.get_client_view())
                     
                     self.shared_state["ranked_questions"] = self.qm.get_recommend_question()
                     
@@ -128,15 +203,71 @@ class ClinicalLogicThread(threading.Thread):
         self.running = False
 
 class SimulationManager:
-    def __init__(self, websocket: WebSocket, patient_id: str, gender:str = "Male"):
-        self.websocket = websocket
+    def __init__(self, websocket: WebSocket, patient_id: str, gender:str = "Male", fast_start: bool = False,
+                 session_id: str = None, store: session_store.SessionStore = None):
+        # Every send is timed/counted per message type (see telemetry.py)
+        self.websocket = telemetry.InstrumentedWebSocket(websocket)
+        self.session_id = session_id or uuid.uuid4().hex
+        # Identifies this manager's registry entry (a resumed session gets a new owner)
+        self.owner = uuid.uuid4().hex
+        self.store = store or session_store.get_store()
+        self.restored = False
+        self._restored_state = False
+        self._checkpointed_turns = 0
+        self.patient_id = patient_id
+        self.gender = gender
+        # fast_start: begin the interview on the static questions.json ranking
+        # while the initial diagnosis completes in the background.
+        self.fast_start = fast_start
+
+        # Profile text is fetched asynchronously in run() (see _load_profile)
+        self.PATIENT_PROMPT = None
+        self.PATIENT_INFO = None
+
+        self.tm = TranscriptManager()
+        self.qm = question_manager.QuestionPoolManager(copy.deepcopy(QUESTION_LIST))
+        self.dm = diagnosis_manager.DiagnosisManager()
         
-        self.PATIENT_PROMPT = fetch_gcs_text_internal(patient_id, "patient_system.md")
-        self.PATIENT_INFO = fetch_gcs_text_internal(patient_id, "patient_info.md")
+        self.cycle = 0
+        self.shared_state = {
+            "ranked_questions": self.qm.get_recommend_question(),
+            "cycle": 0,
+            "patient_info" : None
+        }
+        self.running = False
+        self.logic_thread = None
+        self.init_task = None
+        self._bg_tasks = set()
+        self._pending_advice = None  # streamed advice still completing while the nurse speaks
+
+        # Main loop variables (persisted in checkpoints so a session can resume mid-interview)
+        self.loop_state = {
+            "next_instruction": "Intoduce yourself and tell the patient you have patient data and will asked further question for detailed health condition.",
+            "patient_last_words": "Hello.",
+            "interview_end": False,
+            "last_qid": None,
+        }
+
+        # Startup timings in seconds, relative to the start of run()
+        self.timings = {}
+        self._t0 = None
+
+    def _mark(self, name):
+        self.timings[name] = round(time.perf_counter() - self._t0, 3)
+
+    async def _load_profile(self):
+        """Fetches the patient prompt and info in parallel, off the event loop."""
+        with telemetry.span("profile_load"):
+            self.PATIENT_PROMPT, self.PATIENT_INFO = await fetch_gcs_texts_async(
+                self.patient_id, ["patient_system.md", "patient_info.md"]
+            )
+        self.shared_state["patient_info"] = self.PATIENT_INFO
+        self._mark("profile_loaded")
 
+    def _build_agents(self):
         # Voice Agents
         self.nurse = agents.TextBridgeAgent("NURSE", NURSE_PROMPT, "Aoede")
-        if gender == "Male":
+        if self.gender == "Male":
             self.patient = agents.TextBridgeAgent("PATIENT", self.PATIENT_PROMPT, "Puck")
         else:
             self.patient = agents.TextBridgeAgent("PATIENT", self.PATIENT_PROMPT, "Laomedeia")
@@ -147,131 +278,336 @@ class SimulationManager:
         self.diagnoser = agents.DiagnoseAgent(patient_info=self.PATIENT_INFO)
         self.evaluator = agents.DiagnoseEvaluatorAgent()
         self.ranker = agents.QuestionRankingAgent(patient_info=self.PATIENT_INFO)
-        
-        self.tm = TranscriptManager()
-        self.qm = question_manager.QuestionPoolManager(copy.deepcopy(QUESTION_LIST))
-        self.dm = diagnosis_manager.DiagnosisManager()
-        
-        self.cycle = 0
-        self.shared_state = {
-            "ranked_questions": self.qm.get_recommend_question(),
-            "cycle": 0,
-            "patient_info" : self.PATIENT_INFO
-        }
-        self.running = False
 
-    async def run(self):
-        self.running = True
-        await self.websocket.send_json({"type": "system", "message": "Initializing Agents..."})
-
-        # --- INITIALIZATION PHASE ---
+    async def _run_initial_logic(self):
+        """Initial diagnosis state (snapshot or fresh pass), then hands over to the logic thread."""
         try:
-            logger.info("⚡ Running Initial Diagnosis (Main Thread)...")
-            initial_history = [{"speaker": "PATIENT_INFO", "text": self.PATIENT_INFO}]
+            with telemetry.span("init:snapshot_load"):
+                snapshot = await asyncio.to_thread(
+                    snapshot_store.load_snapshot, self.patient_id, self.PATIENT_INFO, QUESTION_LIST
+                )
+            if snapshot:
+                logger.info("📸 Loaded Initial Diagnosis Snapshot")
+            else:
+                logger.info("⚡ Running Initial Diagnosis (Main Thread)...")
+                with telemetry.span("init:compute"):
+                    snapshot = await snapshot_store.compute_initial_state(
+                        self.PATIENT_INFO, QUESTION_LIST, self.diagnoser, self.evaluator, self.ranker
+                    )
+                if not self.PATIENT_INFO.startswith("System: Error"):
+                    snapshot_store.save_snapshot_background(self.patient_id, self.PATIENT_INFO, QUESTION_LIST, snapshot)
 
-            diag_res = await self.diagnoser.get_diagnosis_update(initial_history, self.dm.get_diagnosis_basic())
-            self.dm.update_diagnoses(diag_res.get("diagnosis_list"))
-            
-            merged_diag = await self.evaluator.evaluate_diagnoses(
-                self.dm.get_consolidated_diagnoses_basic(),
-                diag_res.get("diagnosis_list"), 
-                initial_history
-            )
-            self.dm.set_consolidated_diagnoses(merged_diag)
-            
-            self.qm.add_questions_from_text(diag_res.get("follow_up_questions"))
+            self.qm = snapshot_store.apply_snapshot(snapshot, self.dm, self.qm)
             diag_stream = self.dm.get_consolidated_diagnoses()
-            q_list = self.qm.get_recommend_question()
-            
-            ranked_q = await self.ranker.rank_questions(initial_history, diag_stream, q_list)
-            self.qm.update_ranking(ranked_q)
 
             self.shared_state["ranked_questions"] = self.qm.get_recommend_question()
             await self.websocket.send_json({"type": "diagnosis", "data": diag_stream})
-            await self.websocket.send_json({"type": "questions", "data": self.qm.get_questions()})
+            await self.websocket.send_json({"type": "questions", "data": self.qm.get_client_view()})
             
-            logger.info("✅ Init Logic Complete")
+            self._mark("init_logic")
+            logger.info(f"✅ Init Logic Complete ({self.timings['init_logic']}s)")
 
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             logger.error(f"Init Error: {e}")
             await self.websocket.send_json({"type": "system", "message": "Init Error, proceeding..."})
 
         # --- START BACKGROUND MONITORING ---
-        self.logic_thread = ClinicalLogicThread(
-            self.tm, self.qm, self.dm, self.shared_state, 
-            asyncio.get_running_loop(), self.websocket
-        )
-        self.logic_thread.start()
+        self._start_logic_thread()
+
+    def _start_logic_thread(self, processed_count=0):
+        if self.running:
+            self.logic_thread = ClinicalLogicThread(
+                self.tm, self.qm, self.dm, self.shared_state, 
+                asyncio.get_running_loop(), self.websocket, processed_count, self.session_id
+            )
+            self.logic_thread.start()
+
+    # ---------------------------------------------------------
+    # PERSISTENCE / RESUME
+    # ---------------------------------------------------------
+    def _export_state(self):
+        return {
+            "questions": self.qm.get_questions(),
+            "diagnoses": self.dm.get_diagnosis_basic(),
+            "consolidated_diagnoses": self.dm.get_consolidated_diagnoses_basic(),
+            "merge_stats": dict(self.dm.merge_stats),
+            "ranked_questions": self.shared_state.get("ranked_questions", []),
+            "cycle": self.cycle,
+            "loop": dict(self.loop_state),
+        }
+
+    def _restore(self, saved):
+        state = saved.get("state") or {}
+        self.tm.restore(saved.get("transcript", []))
+        self._checkpointed_turns = len(self.tm.history)
+        if "questions" in state:
+            self.qm = question_manager.QuestionPoolManager(state["questions"])
+        self.dm.update_diagnoses(state.get("diagnoses", []))
+        self.dm.set_consolidated_diagnoses(state.get("consolidated_diagnoses", []))
+        self.dm.merge_stats.update(state.get("merge_stats", {}))
+        self.cycle = state.get("cycle", 0)
+        self.shared_state["cycle"] = self.cycle
+        self.shared_state["ranked_questions"] = state.get("ranked_questions") or self.qm.get_recommend_question()
+        self.loop_state.update(state.get("loop", {}))
+        self.restored = True
+        # Disconnected before the first checkpoint: nothing to restore but the transcript
+        self._restored_state = bool(state)
+
+    @classmethod
+    async def resume(cls, websocket: WebSocket, session_id: str, store: session_store.SessionStore = None):
+        """Rebuilds a manager from its last checkpoint, or returns None if the session is unknown/finished."""
+        store = store or session_store.get_store()
+        saved = await asyncio.to_thread(store.load, session_id)
+        if not saved or saved.get("finished"):
+            return None
+        meta = saved["meta"]
+        manager = cls(websocket, meta["patient_id"], meta.get("gender"), session_id=session_id, store=store)
+        manager._restore(saved)
+        return manager
+
+    async def _checkpoint(self, finished=False):
+        """Persists the transcript delta since the last checkpoint plus the current state."""
+        try:
+            with telemetry.span("checkpoint", cycle=self.cycle):
+                delta = self.tm.entries_since(self._checkpointed_turns)
+                await asyncio.to_thread(self.store.checkpoint, self.session_id, delta, self._export_state(), finished)
+                self._checkpointed_turns += len(delta)
+                # Doubles as the registry heartbeat
+                await asyncio.to_thread(cluster.get_registry().register, self.session_id, None, self.owner)
+        except Exception as e:
+            logger.error(f"Checkpoint Error: {e}")
+
+    async def _record_analytics(self):
+        """Appends the session's final diagnoses, questions and turn timings to the analytics store."""
+        if not analytics_store.ANALYTICS_ENABLED or not self.tm.history:
+            return
+        duration = time.perf_counter() - self._t0
+        try:
+            await asyncio.to_thread(
+                analytics_store.get_store().record_session,
+                self.session_id, self.patient_id, self.dm.get_consolidated_diagnoses(), self.qm.get_questions(),
+                turn_spans=telemetry.TRACES.get(self.session_id) or [], cycles=self.cycle, turns=len(self.tm.history),
+                ended=self.loop_state["interview_end"], started=time.time() - duration, duration=duration,
+            )
+        except Exception as e:
+            logger.error(f"Analytics Record Error: {e}")
+
+    async def _refine_highlights(self, turn_id, index, text, diagnosis_context, local):
+        """Model pass over a patient answer; its result replaces the local highlights in transcript and client."""
+        try:
+            refined = await self.highlighter.highlight_text(text, diagnosis_context)
+            merged = highlight_matcher.final_highlights(text, local, refined)
+            if merged == local:
+                return
+            self.tm.update_highlight(index, merged)
+            await self.websocket.send_json({"type": "highlights", "id": turn_id, "speaker": "PATIENT", "highlights": merged})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Highlight Refine Error: {e}")
+
+    async def _send_metrics(self):
+        await self.websocket.send_json({"type": "metrics", "data": dict(self.timings)})
 
+    async def run(self):
+        self.running = True
+        self._t0 = time.perf_counter()
+        # Spans and model calls from here on (incl. tasks/threads spawned below) land in this session's trace
+        telemetry.current_session.set(self.session_id)
+        _ACTIVE_MANAGERS.add(self)
+        # Claim the session for this worker; the route token lets reconnects land back here
+        registry = cluster.get_registry()
+        await asyncio.to_thread(registry.register, self.session_id, None, self.owner)
+        await self.websocket.send_json({
+            "type": "session", "session_id": self.session_id, "resumed": self.restored,
+            "route": cluster.make_route_token(), "worker_id": cluster.WORKER_ID
+        })
+        await self.websocket.send_json({"type": "system", "message": "Initializing Agents..."})
+
+        await self._load_profile()
+        self._build_agents()
+
+        if self._restored_state:
+            # State comes from the checkpoint: push it and skip the init pipeline
+            await self.websocket.send_json({"type": "diagnosis", "data": self.dm.get_consolidated_diagnoses()})
+            await self.websocket.send_json({"type": "questions", "data": self.qm.get_client_view()})
+            self._start_logic_thread(processed_count=len(self.tm.history))
+        else:
+            if not self.restored:
+                meta = {"patient_id": self.patient_id, "gender": self.gender, "created": time.time()}
+                await asyncio.to_thread(self.store.create, self.session_id, meta)
+
+            # --- INITIALIZATION PHASE (concurrent with voice connect) ---
+            self.init_task = asyncio.create_task(self._run_initial_logic())
+
+        try:
+            await self._run_voice_loop()
+        finally:
+            if self.init_task and not self.init_task.done():
+                self.init_task.cancel()
+            for task in list(self._bg_tasks):
+                task.cancel()
+            if self.logic_thread:
+                self.logic_thread.stop()
+            await self._record_analytics()
+            await asyncio.to_thread(recorder.end_session, self.session_id)
+            # Only our own entry: the session may have been resumed by another manager meanwhile
+            await asyncio.to_thread(registry.unregister, self.session_id, self.owner)
+
+    async def _stream_advice(self):
+        """Sets the next instruction as soon as the streamed question is complete; the rest of
+        the advice (qid, end flag, reasoning) is applied while the nurse is already speaking."""
+        ls = self.loop_state
+        loop = asyncio.get_running_loop()
+        question_ready = loop.create_future()
+        start = time.perf_counter()
+
+        def on_question(question):
+            if not question_ready.done():
+                question_ready.set_result((question, time.perf_counter()))
+
+        with telemetry.span("advisor", cycle=self.cycle, streamed=True) as attrs:
+            advice = asyncio.create_task(self.advisor.stream_advise(
+                self.tm.get_history(), self.shared_state["ranked_questions"], on_question=on_question
+            ))
+            await asyncio.wait({question_ready, advice}, return_when=asyncio.FIRST_COMPLETED)
+            if question_ready.done():
+                question, ready_at = question_ready.result()
+            else:
+                question, ready_at = (await advice)[0], time.perf_counter()
+            attrs["question_s"] = round(ready_at - start, 4)
+        telemetry.METRICS.observe("medforce_advisor_question_seconds", ready_at - start)
+
+        ls["next_instruction"] = question or "Continue assessment."
+        self.cycle += 1
+
+        async def finish():
+            try:
+                _, reasoning, status, qid = await advice
+            except Exception as e:
+                logger.error(f"Main Loop Logic Error: {e}")
+                return
+            # Time the nurse gained by not waiting for qid/end_conversation/reasoning
+            telemetry.METRICS.observe("medforce_advisor_head_start_seconds", max(0.0, time.perf_counter() - ready_at))
+            if qid:
+                self.qm.update_status(qid, "asked")
+                ls["last_qid"] = qid
+            ls["interview_end"] = status
+            await self.websocket.send_json({"type": "system", "message": f"Logic: {reasoning}"})
+            await self._checkpoint()
+
+        self._pending_advice = asyncio.create_task(finish())
+        self._bg_tasks.add(self._pending_advice)
+        self._pending_advice.add_done_callback(self._bg_tasks.discard)
+
+    async def _run_voice_loop(self):
         # --- START VOICE LOOPS ---
         async with contextlib.AsyncExitStack() as stack:
-            self.nurse.set_session(await stack.enter_async_context(self.nurse.get_connection_context()))
-            self.patient.set_session(await stack.enter_async_context(self.patient.get_connection_context()))
+            with telemetry.span("voice_connect"):
+                nurse_session, patient_session = await enter_concurrently(
+                    stack, self.nurse.get_connection_context(), self.patient.get_connection_context())
+            self.nurse.set_session(nurse_session)
+            self.patient.set_session(patient_session)
+            if self.restored:
+                history = self.tm.get_history()
+                await asyncio.gather(self.nurse.seed_history(history), self.patient.seed_history(history))
+            self._mark("voice_connected")
+
+            if self.init_task and not self.fast_start:
+                await self.init_task
+
             await self.websocket.send_json({"type": "system", "message": "Starting Assessment."})
 
-            next_instruction = "Intoduce yourself and tell the patient you have patient data and will asked further question for detailed health condition."
-            patient_last_words = "Hello."
-            interview_end = False
-            last_qid = None
+            ls = self.loop_state
             
             while self.running:
                 self.shared_state["cycle"] = self.cycle 
 
                 # 1. NURSE
-                nurse_input = f"Patient said: '{patient_last_words}'\n[SUPERVISOR: {next_instruction}]"
-                nurse_text, _ = await self.nurse.speak_and_stream(nurse_input, self.websocket)
+                nurse_input = f"Patient said: '{ls['patient_last_words']}'\n[SUPERVISOR: {ls['next_instruction']}]"
+                with telemetry.span("nurse_turn", cycle=self.cycle):
+                    nurse_text, _ = await self.nurse.speak_and_stream(nurse_input, self.websocket)
                 
                 if not nurse_text: nurse_text = "[The nurse waits]"
                 self.tm.log("NURSE", nurse_text)
 
+                if self._pending_advice:
+                    await self._pending_advice
+                    self._pending_advice = None
+
+                if "first_audio" not in self.timings and self.nurse.first_audio_at:
+                    self.timings["first_audio"] = round(self.nurse.first_audio_at - self._t0, 3)
+                    logger.info(f"🔊 Time to first audio: {self.timings['first_audio']}s")
+                    await self._send_metrics()
+
                 await asyncio.sleep(0.5)
-                await self.websocket.send_json({"type": "questions", "data": self.qm.get_questions()})
+                await self.websocket.send_json({"type": "questions", "data": self.qm.get_client_view()})
 
                 # 2. PATIENT
                 current_diagnosis_context = self.dm.get_consolidated_diagnoses_basic()
-                patient_text, highlight_result = await self.patient.speak_and_stream(
-                    nurse_text, 
-                    self.websocket, 
-                    highlighter=self.highlighter, 
-                    diagnosis_context=current_diagnosis_context
-                )
+                with telemetry.span("patient_turn", cycle=self.cycle):
+                    patient_text, highlight_result = await self.patient.speak_and_stream(
+                        nurse_text, 
+                        self.websocket, 
+                        highlighter=self.highlighter, 
+                        diagnosis_context=current_diagnosis_context
+                    )
                 
                 if patient_text:
-                    patient_last_words = patient_text
+                    ls["patient_last_words"] = patient_text
                 else:
                     patient_text = "[The patient nods]"
-                    patient_last_words = "(Silent)"
-
-                if last_qid:
-                    self.qm.update_answer(last_qid, patient_text)
-                    await self.websocket.send_json({"type": "questions", "data": self.qm.get_questions()})
-
-                self.tm.log("PATIENT", patient_text, highlight_data=highlight_result)
+                    ls["patient_last_words"] = "(Silent)"
+
+                if ls["last_qid"]:
+                    self.qm.update_answer(ls["last_qid"], patient_text)
+                    await self.websocket.send_json({"type": "questions", "data": self.qm.get_client_view()})
+
+                entry_index = self.tm.log("PATIENT", patient_text, highlight_data=highlight_result)
+                if HIGHLIGHT_REFINE and ls["patient_last_words"] != "(Silent)" and current_diagnosis_context:
+                    task = asyncio.create_task(self._refine_highlights(
+                        self.patient.last_turn_id, entry_index, patient_text, current_diagnosis_context, highlight_result
+                    ))
+                    self._bg_tasks.add(task)
+                    task.add_done_callback(self._bg_tasks.discard)
                 await asyncio.sleep(0.5)
                 await self.websocket.send_json({"type": "turn", "data": "finish cycle"})
-                if interview_end: break
+                if ls["interview_end"]: break
 
                 # 3. ADVISOR
+                if ADVISOR_STREAM:
+                    await self._stream_advice()
+                    if self.websocket.client_state.name == "DISCONNECTED": break
+                    continue
+
                 try:
                     current_ranked = self.shared_state["ranked_questions"]
-                    question, reasoning, status, qid = await self.advisor.get_advise(self.tm.get_history(), current_ranked)
+                    advice_start = time.perf_counter()
+                    with telemetry.span("advisor", cycle=self.cycle):
+                        question, reasoning, status, qid = await self.advisor.get_advise(self.tm.get_history(), current_ranked)
+                    telemetry.METRICS.observe("medforce_advisor_question_seconds", time.perf_counter() - advice_start)
                     
                     if qid: 
                         self.qm.update_status(qid, "asked")
-                        last_qid = qid
+                        ls["last_qid"] = qid
                     
                     await self.websocket.send_json({"type": "system", "message": f"Logic: {reasoning}"})
                     
-                    next_instruction = question
-                    interview_end = status
+                    ls["next_instruction"] = question
+                    ls["interview_end"] = status
                     self.cycle += 1
 
                 except Exception as e:
                     logger.error(f"Main Loop Logic Error: {e}")
-                    next_instruction = "Continue assessment."
+                    ls["next_instruction"] = "Continue assessment."
 
-                if self.websocket.client_state.name == "DISCONNECTED": break
+                await self._checkpoint()
 
-            await self.websocket.send_json({"type": "turn", "data": "end"})
+                if self.websocket.client_state.name == "DISCONNECTED": break
 
-        self.logic_thread.stop()
\ No newline at end of file
+            if self._pending_advice:
+                await asyncio.gather(self._pending_advice, return_exceptions=True)
+            await self._checkpoint(finished=ls["interview_end"])
+            await self.websocket.send_json({"type": "turn", "data": "end"})
\ No newline at end of file
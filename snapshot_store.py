@@ -0,0 +1,194 @@
+# --- snapshot_store.py ---
+import sys
+import copy
+import json
+import hashlib
+import asyncio
+import logging
+from google.cloud import storage
+
+# Local Imports
+import agents
+import cluster
+import telemetry
+import question_manager
+import diagnosis_manager
+
+logger = logging.getLogger("medforce-backend")
+
+BUCKET_NAME = "clinic_sim"
+SNAPSHOT_PREFIX = "snapshots"
+
+# Everything the initial diagnosis depends on besides patient_info.md itself
+PROMPT_FILES = [
+    "patient_profile/diagnoser.md",
+    "patient_profile/diagnosis_eval.md",
+    "patient_profile/q_ranker.md",
+]
+
+# Bump when the snapshot format or the local logic behind it changes (diagnosis merge,
+# question dedup, active cap), so snapshots built by older code are not reused
+SNAPSHOT_VERSION = 2
+
+# Snapshots are cached under "snapshot:<key>" in the (possibly cross-worker) cluster cache
+_prompt_version = None
+# Background saves; held here so they are not garbage collected mid-upload
+_pending_saves = set()
+
+def prompt_version() -> str:
+    """Hash of the snapshot version, prompt files and model names used by the initial logic pass."""
+    global _prompt_version
+    if _prompt_version is None:
+        h = hashlib.sha256()
+        h.update(f"v{SNAPSHOT_VERSION}|".encode())
+        for path in PROMPT_FILES:
+            try:
+                with open(path, "rb") as f: h.update(f.read())
+            except OSError:
+                h.update(path.encode())
+        h.update(f"{agents.DIAGNOSER_MODEL}|{agents.EVALUATOR_MODEL}|{agents.RANKER_MODEL}".encode())
+        _prompt_version = h.hexdigest()[:16]
+    return _prompt_version
+
+def snapshot_key(patient_info: str, question_list: list) -> str:
+    h = hashlib.sha256()
+    h.update(patient_info.encode("utf-8"))
+    h.update(json.dumps(question_list, sort_keys=True).encode("utf-8"))
+    h.update(prompt_version().encode())
+    return h.hexdigest()[:32]
+
+def _blob_path(pid: str, key: str) -> str:
+    return f"{SNAPSHOT_PREFIX}/{pid}/{key}.json"
+
+# ---------------------------------------------------------
+# LOAD / SAVE
+# ---------------------------------------------------------
+def load_snapshot(pid: str, patient_info: str, question_list: list):
+    """Returns the stored snapshot for this profile content, or None."""
+    key = snapshot_key(patient_info, question_list)
+    cache = cluster.get_cache()
+    cached = cache.get(f"snapshot:{key}")
+    if cached is not None:
+        return cached
+    try:
+        with telemetry.gcs_op("load_snapshot"):
+            blob = storage.Client().bucket(BUCKET_NAME).blob(_blob_path(pid, key))
+            if not blob.exists():
+                return None
+            snapshot = json.loads(blob.download_as_text())
+    except Exception as e:
+        logger.error(f"Snapshot Load Error: {e}")
+        return None
+    cache.set(f"snapshot:{key}", snapshot)
+    return snapshot
+
+def save_snapshot(pid: str, patient_info: str, question_list: list, snapshot: dict):
+    key = snapshot_key(patient_info, question_list)
+    cluster.get_cache().set(f"snapshot:{key}", snapshot)
+    try:
+        with telemetry.gcs_op("save_snapshot"):
+            blob = storage.Client().bucket(BUCKET_NAME).blob(_blob_path(pid, key))
+            blob.upload_from_string(json.dumps(snapshot), content_type="application/json")
+        logger.info(f"📸 Saved snapshot: {_blob_path(pid, key)}")
+    except Exception as e:
+        logger.error(f"Snapshot Save Error: {e}")
+
+def save_snapshot_background(pid: str, patient_info: str, question_list: list, snapshot: dict) -> asyncio.Task:
+    """save_snapshot off the event loop without awaiting it; the task is kept until done."""
+    task = asyncio.create_task(asyncio.to_thread(save_snapshot, pid, patient_info, question_list, snapshot))
+    _pending_saves.add(task)
+    task.add_done_callback(_pending_saves.discard)
+    return task
+
+# ---------------------------------------------------------
+# COMPUTE
+# ---------------------------------------------------------
+async def compute_initial_state(patient_info, question_list, diagnoser, evaluator, ranker):
+    """
+    Runs the initial diagnosis -> evaluation -> ranking pass on patient_info alone.
+    Returns a snapshot dict holding the resulting diagnosis pools and question pool.
+    """
+    dm = diagnosis_manager.DiagnosisManager()
+    qm = question_manager.QuestionPoolManager(copy.deepcopy(question_list))
+    initial_history = [{"speaker": "PATIENT_INFO", "text": patient_info}]
+
+    diag_res = await diagnoser.get_diagnosis_update(initial_history, dm.get_diagnosis_basic())
+    dm.update_diagnoses(diag_res.get("diagnosis_list"))
+
+    await dm.consolidate(
+        diag_res.get("diagnosis_list"),
+        lambda pool, ambiguous: evaluator.evaluate_diagnoses(pool, ambiguous, initial_history)
+    )
+
+    qm.add_questions_from_text(diag_res.get("follow_up_questions"))
+    ranked_q = await ranker.rank_questions(initial_history, dm.get_consolidated_diagnoses(), qm.get_recommend_question())
+    qm.update_ranking(ranked_q)
+
+    return {
+        "prompt_version": prompt_version(),
+        "diagnoses": dm.get_diagnosis_basic(),
+        "consolidated_diagnoses": dm.get_consolidated_diagnoses_basic(),
+        "follow_up_questions": diag_res.get("follow_up_questions", []),
+        "questions": copy.deepcopy(qm.get_questions()),
+    }
+
+def apply_snapshot(snapshot: dict, dm, qm):
+    """
+    Loads a snapshot into the DiagnosisManager and returns a QuestionPoolManager built
+    from it. Progress already made on `qm` (asked status, answers) is carried over,
+    so this is safe to call after the interview has started (fast_start).
+    """
+    dm.update_diagnoses(snapshot.get("diagnoses", []))
+    dm.set_consolidated_diagnoses(snapshot.get("consolidated_diagnoses", []))
+
+    new_qm = question_manager.QuestionPoolManager(copy.deepcopy(snapshot.get("questions", [])))
+    for q in qm.get_questions():
+        if q.get("status") == "asked":
+            new_qm.update_status(q["qid"], "asked")
+        if "answer" in q:
+            new_qm.update_answer(q["qid"], q["answer"])
+    return new_qm
+
+async def warm_patient(pid: str, patient_info: str, question_list: list):
+    """Computes and stores the snapshot for one patient (no-op if already stored)."""
+    if await asyncio.to_thread(load_snapshot, pid, patient_info, question_list) is not None:
+        return False
+    snapshot = await compute_initial_state(
+        patient_info, question_list,
+        agents.DiagnoseAgent(patient_info=patient_info),
+        agents.DiagnoseEvaluatorAgent(),
+        agents.QuestionRankingAgent(patient_info=patient_info),
+    )
+    await asyncio.to_thread(save_snapshot, pid, patient_info, question_list, snapshot)
+    return True
+
+# ==========================================
+# BATCH WARM-UP
+# python snapshot_store.py            -> all patients
+# python snapshot_store.py P0001 ...  -> selected patients
+# ==========================================
+async def _warm_all(pids, question_list):
+    from utils import fetch_gcs_text_internal
+    for pid in pids:
+        patient_info = await asyncio.to_thread(fetch_gcs_text_internal, pid, "patient_info.md")
+        if patient_info.startswith("System: Error"):
+            logger.warning(f"Skipping {pid}: {patient_info}")
+            continue
+        created = await warm_patient(pid, patient_info, question_list)
+        logger.info(f"{'📸 Warmed' if created else '✔️ Up to date'}: {pid}")
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+
+    with open("questions.json", "r") as f:
+        question_list = json.load(f)
+
+    pids = sys.argv[1:]
+    if not pids:
+        blobs = storage.Client().list_blobs(BUCKET_NAME, prefix="patient_profile/", delimiter="/")
+        list(blobs)
+        pids = [p.rstrip('/').split('/')[-1] for p in blobs.prefixes]
+
+    asyncio.run(_warm_all(pids, question_list))
@@ -0,0 +1,85 @@
+# --- static_assets.py ---
+# In-memory static files with precompressed variants and ETag revalidation.
+import os
+import gzip
+import hashlib
+import logging
+import threading
+from typing import Optional
+
+from fastapi.responses import Response
+
+logger = logging.getLogger("medforce-backend")
+
+try:
+    import brotli  # optional; gzip is always available
+except ImportError:
+    brotli = None
+
+class StaticAsset:
+    """
+    A file read once and kept as raw/gzip/brotli bytes with a content ETag.
+    With reload=True (dev) the file's mtime is checked on each request.
+    """
+    def __init__(self, path: str, media_type: str, reload: bool = False, cache_control: str = "no-cache"):
+        self.path = path
+        self.media_type = media_type
+        self.reload = reload
+        self.cache_control = cache_control
+        self._lock = threading.Lock()
+        self._mtime = None
+        self.variants = {}
+        self.etag = None
+        self._load()
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+            with open(self.path, "rb") as f:
+                raw = f.read()
+        except OSError:
+            self.variants, self.etag, self._mtime = {}, None, None
+            return
+        variants = {"identity": raw, "gzip": gzip.compress(raw, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants["br"] = brotli.compress(raw, quality=11)
+        with self._lock:
+            self.variants = variants
+            self.etag = '"%s"' % hashlib.sha256(raw).hexdigest()[:16]
+            self._mtime = mtime
+        logger.info(f"📦 Loaded {self.path} ({len(raw)} B, gzip {len(variants['gzip'])} B)")
+
+    def _maybe_reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            self._load()
+
+    @property
+    def available(self) -> bool:
+        return bool(self.variants)
+
+    def _pick_encoding(self, accept_encoding: str) -> str:
+        offered = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in offered and encoding in self.variants:
+                return encoding
+        return "identity"
+
+    def response(self, accept_encoding: Optional[str] = None, if_none_match: Optional[str] = None) -> Optional[Response]:
+        """Response for a request, a 304 when the client's ETag matches, or None if the file is missing."""
+        if self.reload:
+            self._maybe_reload()
+        with self._lock:
+            variants, etag = self.variants, self.etag
+        if not variants:
+            return None
+        headers = {"ETag": etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if if_none_match and etag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        encoding = self._pick_encoding(accept_encoding)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=variants[encoding], media_type=self.media_type, headers=headers)
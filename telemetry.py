@@ -0,0 +1,267 @@
+# --- telemetry.py ---
+# Process-local metrics (rendered in Prometheus text format at /metrics) and
+# per-session traces (spans per cycle stage, at /api/admin/trace/{session_id}).
+# Each uvicorn worker keeps its own; scrape every worker, and fetch a trace from
+# the worker that owns the session (see the session's route token).
+import os
+import time
+import bisect
+import logging
+import functools
+import threading
+import contextlib
+import contextvars
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import serializer
+
+logger = logging.getLogger("medforce-backend")
+
+TRACE_MAX_SESSIONS = int(os.getenv("TRACE_MAX_SESSIONS", "200"))
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "2000"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Session the current task/thread works for; asyncio tasks and to_thread copy it
+current_session: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_session", default=None)
+# False for work that should stay out of TRACES (batch interviews), so it cannot evict live sessions
+trace_enabled: contextvars.ContextVar[bool] = contextvars.ContextVar("trace_enabled", default=True)
+# Optional per-task usage totals ({model: {"calls", "prompt_tokens", "completion_tokens"}}), e.g. per batch interview
+usage_sink: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar("usage_sink", default=None)
+
+# ---------------------------------------------------------
+# METRICS
+# ---------------------------------------------------------
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(labels: Tuple, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class Metrics:
+    """Minimal counter/gauge/histogram registry; label sets are keyword arguments."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Tuple[str, str, tuple]] = {}   # name -> (type, help, buckets)
+        self._values: Dict[str, Dict[Tuple, object]] = {}
+        self._collectors = []
+
+    def describe(self, name: str, kind: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS):
+        self._meta[name] = (kind, help_text, tuple(buckets))
+        self._values.setdefault(name, {})
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._values.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, value: float, **labels):
+        buckets = self._meta.get(name, ("histogram", "", DEFAULT_BUCKETS))[2]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            h = series.get(key)
+            if h is None:
+                h = series[key] = [[0] * (len(buckets) + 1), 0.0, 0]  # per-bucket counts, sum, count
+            h[0][bisect.bisect_left(buckets, value)] += 1
+            h[1] += value
+            h[2] += 1
+
+    def add_collector(self, fn: Callable[[], Iterable[Tuple[str, Dict, float]]]):
+        """fn() yields (gauge_name, labels, value) at render time, for values owned elsewhere."""
+        self._collectors.append(fn)
+
+    def get(self, name: str, **labels):
+        with self._lock:
+            return self._values.get(name, {}).get(tuple(sorted(labels.items())))
+
+    def render(self) -> str:
+        for fn in self._collectors:
+            try:
+                for name, labels, value in fn():
+                    self.set(name, value, **labels)
+            except Exception as e:
+                logger.error(f"Metrics Collector Error: {e}")
+
+        out = []
+        with self._lock:
+            for name in sorted(self._values):
+                kind, help_text, buckets = self._meta.get(name, ("untyped", "", DEFAULT_BUCKETS))
+                if help_text:
+                    out.append(f"# HELP {name} {help_text}")
+                out.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(self._values[name].items()):
+                    if kind != "histogram":
+                        out.append(f"{name}{_labels(key)} {_fmt(value)}")
+                        continue
+                    counts, total, count = value
+                    running = 0
+                    for le, n in zip(buckets + (float("inf"),), counts):
+                        running += n
+                        le_label = 'le="%s"' % _fmt(le)
+                        out.append(f"{name}_bucket{_labels(key, le_label)} {running}")
+                    out.append(f"{name}_sum{_labels(key)} {_fmt(total)}")
+                    out.append(f"{name}_count{_labels(key)} {count}")
+        return "\n".join(out) + "\n"
+
+METRICS = Metrics()
+METRICS.describe("medforce_model_call_seconds", "histogram", "Latency of generate_content calls by agent.")
+METRICS.describe("medforce_model_calls_total", "counter", "generate_content calls by agent and outcome.")
+METRICS.describe("medforce_model_tokens_total", "counter", "Tokens reported in usage metadata by agent and kind.")
+METRICS.describe("medforce_model_inflight", "gauge", "generate_content calls currently awaiting a response.")
+METRICS.describe("medforce_agent_fallbacks_total", "counter", "Agent calls that returned their fallback value.")
+METRICS.describe("medforce_voice_first_chunk_seconds", "histogram", "Live turn: send to first audio chunk, by speaker.")
+METRICS.describe("medforce_voice_turn_seconds", "histogram", "Live turn: send to turn_complete, by speaker.")
+METRICS.describe("medforce_advisor_question_seconds", "histogram", "Advisor call start to the nurse's next question being available.")
+METRICS.describe("medforce_advisor_head_start_seconds", "histogram", "Time the nurse starts speaking before the full advice has arrived (streaming).")
+METRICS.describe("medforce_gcs_op_seconds", "histogram", "Latency of GCS operations by op.")
+METRICS.describe("medforce_gcs_errors_total", "counter", "Failed GCS operations by op.")
+METRICS.describe("medforce_ws_send_seconds", "histogram", "WebSocket send_json latency by message type.")
+METRICS.describe("medforce_ws_messages_total", "counter", "WebSocket messages sent by type.")
+METRICS.describe("medforce_ws_send_errors_total", "counter", "Failed WebSocket sends by type.")
+METRICS.describe("medforce_stage_seconds", "histogram", "Duration of simulation cycle stages.")
+METRICS.describe("medforce_active_sessions", "gauge", "Simulations running on this worker.")
+METRICS.describe("medforce_logic_pending_turns", "gauge", "Transcript turns not yet processed by logic threads.")
+
+# ---------------------------------------------------------
+# TRACES
+# ---------------------------------------------------------
+class TraceStore:
+    """Most recent spans of the most recent sessions, bounded in both dimensions."""
+    def __init__(self, max_sessions: int = TRACE_MAX_SESSIONS, max_spans: int = TRACE_MAX_SPANS):
+        self.max_sessions = max_sessions
+        self.max_spans = max_spans
+        self._sessions: "OrderedDict[str, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, session_id: str, span: Dict):
+        with self._lock:
+            spans = self._sessions.get(session_id)
+            if spans is None:
+                if len(self._sessions) >= self.max_sessions:
+                    self._sessions.popitem(last=False)
+                spans = self._sessions[session_id] = deque(maxlen=self.max_spans)
+            else:
+                self._sessions.move_to_end(session_id)
+            spans.append(span)
+
+    def get(self, session_id: str) -> Optional[list]:
+        with self._lock:
+            spans = self._sessions.get(session_id)
+            return list(spans) if spans is not None else None
+
+    def sessions(self) -> list:
+        with self._lock:
+            return list(self._sessions)
+
+TRACES = TraceStore()
+
+@contextlib.contextmanager
+def span(stage: str, **attrs):
+    """Times a block into medforce_stage_seconds and the current session's trace."""
+    start_wall, start = time.time(), time.perf_counter()
+    error = None
+    try:
+        yield attrs
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        METRICS.observe("medforce_stage_seconds", duration, stage=stage)
+        session_id = current_session.get()
+        if session_id and trace_enabled.get():
+            record = {"stage": stage, "start": round(start_wall, 3), "duration": round(duration, 4), **attrs}
+            if error:
+                record["error"] = error
+            TRACES.add(session_id, record)
+
+# ---------------------------------------------------------
+# INSTRUMENTATION HELPERS
+# ---------------------------------------------------------
+def record_model_call(agent: str, model: str, seconds: float, response=None, error: bool = False):
+    METRICS.observe("medforce_model_call_seconds", seconds, agent=agent)
+    METRICS.inc("medforce_model_calls_total", agent=agent, model=model, outcome="error" if error else "ok")
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = (getattr(usage, "prompt_token_count", 0) or 0) if usage is not None else 0
+    completion_tokens = (getattr(usage, "candidates_token_count", 0) or 0) if usage is not None else 0
+    if usage is not None:
+        METRICS.inc("medforce_model_tokens_total", prompt_tokens, agent=agent, kind="prompt")
+        METRICS.inc("medforce_model_tokens_total", completion_tokens, agent=agent, kind="completion")
+    sink = usage_sink.get()
+    if sink is not None:
+        totals = sink.setdefault(model, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        totals["calls"] += 1
+        totals["prompt_tokens"] += prompt_tokens
+        totals["completion_tokens"] += completion_tokens
+    session_id = current_session.get()
+    if session_id and trace_enabled.get():
+        record = {"stage": f"model:{agent}", "start": round(time.time() - seconds, 3), "duration": round(seconds, 4)}
+        if usage is not None:
+            record["tokens"] = getattr(usage, "total_token_count", None)
+        if error:
+            record["error"] = True
+        TRACES.add(session_id, record)
+
+def record_fallback(agent: str):
+    METRICS.inc("medforce_agent_fallbacks_total", agent=agent)
+
+@contextlib.contextmanager
+def gcs_op(op: str):
+    """Times a (blocking) GCS operation."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        METRICS.inc("medforce_gcs_errors_total", op=op)
+        raise
+    finally:
+        METRICS.observe("medforce_gcs_op_seconds", time.perf_counter() - start, op=op)
+
+def gcs_endpoint(op: str):
+    """gcs_op for a (sync) endpoint that is a thin wrapper around GCS calls; its 5xx responses
+    count as errors, since the endpoints turn GCS exceptions into error responses."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with gcs_op(op):
+                response = fn(*args, **kwargs)
+            if getattr(response, "status_code", 200) >= 500:
+                METRICS.inc("medforce_gcs_errors_total", op=op)
+            return response
+        return wrapper
+    return decorate
+
+class InstrumentedWebSocket:
+    """Wraps a WebSocket so every send_json is timed and counted by message type."""
+    def __init__(self, websocket):
+        self._ws = websocket
+
+    async def send_json(self, data):
+        msg_type = data.get("type", "unknown") if isinstance(data, dict) else "unknown"
+        start = time.perf_counter()
+        try:
+            await serializer.send_json(self._ws, data)
+        except Exception:
+            METRICS.inc("medforce_ws_send_errors_total", type=msg_type)
+            raise
+        finally:
+            METRICS.observe("medforce_ws_send_seconds", time.perf_counter() - start, type=msg_type)
+        METRICS.inc("medforce_ws_messages_total", type=msg_type)
+
+    def __getattr__(self, name):
+        return getattr(self._ws, name)
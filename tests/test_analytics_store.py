@@ -0,0 +1,67 @@
+import glob
+import os
+
+import analytics_store
+from analytics_store import AnalyticsStore
+
+def session(store, session_id, patient, dids, asked=(), source="live", stage_ms=()):
+    return store.record_session(
+        session_id, patient,
+        [{"did": d, "diagnosis": f"Dx {d}", "indicators_point": ["x"]} for d in dids],
+        [{"qid": q, "status": "asked" if q in asked else None, "answer": "yes" if q in asked else None} for q in ("q1", "q2")],
+        turn_spans=[{"stage": "advisor", "duration": ms / 1000} for ms in stage_ms],
+        cycles=3, source=source,
+    )
+
+def test_queries_count_live_sessions_by_default(tmp_path):
+    store = AnalyticsStore(str(tmp_path))
+    session(store, "S1", "P1", ["D1", "D2"], asked=["q1"], stage_ms=[100, 300])
+    session(store, "S2", "P2", ["D1"])
+    session(store, "B1", "P1", ["D3", "D3"], asked=["q2"], source="batch", stage_ms=[900])
+
+    freq = store.diagnosis_frequency()
+    assert freq["sessions"] == 2
+    assert [(d["did"], d["count"], d["session_rate"]) for d in freq["diagnoses"]] == [("D1", 2, 1.0), ("D2", 1, 0.5)]
+    assert store.diagnosis_frequency(source="batch")["diagnoses"] == [
+        {"did": "D3", "diagnosis": "Dx D3", "count": 2, "session_rate": 1.0}]
+    assert store.diagnosis_frequency(source=None)["sessions"] == 3
+
+    rates = {q["qid"]: q for q in store.question_ask_rates()["questions"]}
+    assert rates["q1"]["asked"] == 1 and rates["q1"]["ask_rate"] == 0.5 and rates["q2"]["asked"] == 0
+    assert store.turn_latency()["stages"]["advisor"] == {"count": 2, "mean_ms": 200.0, "p50_ms": 100, "p95_ms": 300, "p99_ms": 300}
+    assert store.summary()["by_source"] == {"live": 2, "batch": 1}
+
+def test_patient_filter_matches_aggregates(tmp_path):
+    store = AnalyticsStore(str(tmp_path))
+    session(store, "S1", "P1", ["D1"], asked=["q1"], stage_ms=[100])
+    session(store, "S2", "P2", ["D2"])
+    session(store, "B1", "P1", ["D3"], source="batch")
+    one = store.diagnosis_frequency("P1")
+    assert one["sessions"] == 1 and [d["did"] for d in one["diagnoses"]] == ["D1"]
+    assert [d["did"] for d in store.diagnosis_frequency("P1", source=None)["diagnoses"]] == ["D1", "D3"]
+    assert store.turn_latency("P1")["stages"]["advisor"]["count"] == 1
+    assert store.diagnosis_frequency("nobody")["sessions"] == 0
+
+def test_resumed_session_supersedes_and_survives_reload(tmp_path):
+    store = AnalyticsStore(str(tmp_path))
+    session(store, "S1", "P1", ["D1"])
+    session(store, "S1", "P1", ["D2"])
+    assert [d["did"] for d in store.diagnosis_frequency()["diagnoses"]] == ["D2"]
+    reloaded = AnalyticsStore(str(tmp_path))
+    assert reloaded.summary()["sessions"] == 1 and reloaded.summary()["superseded"] == 1
+    assert [d["did"] for d in reloaded.diagnosis_frequency()["diagnoses"]] == ["D2"]
+
+def test_reload_keeps_appending_to_the_same_segment(tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics_store, "_store", AnalyticsStore(str(tmp_path)))
+    session(analytics_store.get_store(), "S1", "P1", ["D1"], asked=["q1"])
+    reloaded = analytics_store.get_store(reload=True)
+    session(reloaded, "S2", "P2", ["D2"], asked=["q2"])
+    session(reloaded, "S1", "P1", ["D3"])  # supersedes a row loaded from disk
+    assert len(glob.glob(os.path.join(str(tmp_path), "seg-*"))) == 1
+
+    fresh = AnalyticsStore(str(tmp_path))
+    for store in (reloaded, fresh):
+        assert store.summary()["sessions"] == 2
+        assert sorted(d["did"] for d in store.diagnosis_frequency()["diagnoses"]) == ["D2", "D3"]
+        assert {q["qid"]: q["asked"] for q in store.question_ask_rates()["questions"]} == {"q1": 0, "q2": 1}
+        assert [d["did"] for d in store.diagnosis_frequency("P2")["diagnoses"]] == ["D2"]
@@ -0,0 +1,68 @@
+import contextvars
+import threading
+import time
+
+import batch_runner
+import telemetry
+
+def wait_for(job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = batch_runner.get_job(job_id)
+        if job["status"] != "running":
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+def test_jobs_run_off_the_caller_thread_and_are_pruned(monkeypatch):
+    threads = []
+
+    async def fake_batch(pids, out_path, max_cycles, concurrency, progress=None):
+        threads.append(threading.current_thread())
+        progress["done"] = len(pids)
+        return {"interviews": len(pids)}
+
+    monkeypatch.setattr(batch_runner, "run_batch", fake_batch)
+    monkeypatch.setattr(batch_runner, "JOBS", {})
+    job = wait_for(batch_runner.start_job(["P1", "P2"])["job_id"])
+    assert job["status"] == "finished" and job["done"] == 2 and job["summary"] == {"interviews": 2}
+    assert "task" not in job and job["ended"]
+    assert threads and threads[0] is not threading.current_thread()
+
+    monkeypatch.setattr(batch_runner, "JOB_TTL", 0)
+    time.sleep(0.01)
+    assert batch_runner.get_job(job["job_id"]) is None
+
+def test_job_limits_are_clamped(monkeypatch):
+    seen = []
+
+    async def fake_batch(pids, out_path, max_cycles, concurrency, progress=None):
+        seen.append((max_cycles, concurrency))
+        return {}
+
+    monkeypatch.setattr(batch_runner, "run_batch", fake_batch)
+    monkeypatch.setattr(batch_runner, "JOBS", {})
+    job = wait_for(batch_runner.start_job(["P1"], max_cycles=10_000, concurrency=10_000)["job_id"])
+    assert seen == [(batch_runner.MAX_CYCLES, batch_runner.MAX_CONCURRENCY)]
+    assert (job["max_cycles"], job["concurrency"]) == seen[0]
+
+def test_max_jobs_drops_oldest_finished(monkeypatch):
+    monkeypatch.setattr(batch_runner, "MAX_JOBS", 2)
+    now = time.time()
+    monkeypatch.setattr(batch_runner, "JOBS", {
+        "old": {"ended": now - 2}, "newer": {"ended": now - 1}, "running": {"ended": None}})
+    batch_runner._prune_jobs()
+    assert set(batch_runner.JOBS) == {"newer", "running"}
+
+def test_untraced_context_stays_out_of_traces():
+    def work(session_id, traced):
+        telemetry.current_session.set(session_id)
+        telemetry.trace_enabled.set(traced)
+        with telemetry.span("logic:rank"):
+            pass
+        telemetry.record_model_call("ranker", "m", 0.01)
+
+    contextvars.copy_context().run(work, "batch-x", False)
+    contextvars.copy_context().run(work, "live-x", True)
+    assert telemetry.TRACES.get("batch-x") is None
+    assert [s["stage"] for s in telemetry.TRACES.get("live-x")] == ["logic:rank", "model:ranker"]
@@ -0,0 +1,38 @@
+import pytest
+
+import cluster
+
+def test_route_token_round_trip():
+    token = cluster.make_route_token("w1")
+    assert cluster.parse_route_token(token) == "w1"
+    payload, sig = token.rsplit(".", 1)
+    assert cluster.parse_route_token(f"{payload}.{'0' * len(sig)}") is None
+
+def test_shared_backend_without_route_secret_only_warns(monkeypatch, caplog):
+    monkeypatch.setattr(cluster, "ROUTE_SECRET", None)
+    monkeypatch.setenv("CLUSTER_BACKEND", "local")
+    cluster.check_config()
+    assert not caplog.records
+    monkeypatch.setenv("CLUSTER_BACKEND", "sqlite")
+    cluster.check_config()
+    assert "ROUTE_SECRET" in caplog.text
+
+def test_live_owner_compares_owner_tokens(monkeypatch):
+    registry = cluster.LocalRegistry()
+    registry.register("S1", owner="m1")  # still running on this worker
+    assert registry.live_owner("S1")["owner"] == "m1"
+    assert registry.live_owner("S1", owner="m1") is None
+    registry.register("S2", "other", owner="m2")
+    assert registry.live_owner("S2")["worker_id"] == "other"
+    monkeypatch.setattr(cluster, "SESSION_TTL", 0)
+    assert registry.live_owner("S1") is None and registry.live_owner("S2") is None
+
+@pytest.mark.parametrize("backend", ["local", "sqlite"])
+def test_unregister_only_by_current_owner(backend, tmp_path):
+    registry = cluster.LocalRegistry() if backend == "local" else cluster.SQLiteRegistry(str(tmp_path / "cluster.db"))
+    registry.register("S1", "w1", owner="old")
+    registry.register("S1", "w2", owner="new")  # resumed elsewhere
+    registry.unregister("S1", owner="old")
+    assert registry.lookup("S1")["owner"] == "new"
+    registry.unregister("S1", owner="new")
+    assert registry.lookup("S1") is None
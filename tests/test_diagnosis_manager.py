@@ -0,0 +1,69 @@
+import asyncio
+
+from diagnosis_manager import DiagnosisManager
+
+LIVER = ["elevated ALT", "fatigue", "RUQ pain", "hepatomegaly"]
+
+def make_dm(pool):
+    dm = DiagnosisManager()
+    dm.set_consolidated_diagnoses(pool)
+    return dm
+
+def test_merge_on_exact_did():
+    dm = make_dm([{"did": "D1", "diagnosis": "NAFLD", "indicators_point": ["fatigue"]}])
+    merged, ambiguous = dm.merge_locally([{"did": "D1", "diagnosis": "Fatty liver", "indicators_point": ["fatigue", "obesity"]}])
+    assert ambiguous == []
+    assert merged == [{"did": "D1", "diagnosis": "NAFLD", "indicators_point": ["fatigue", "obesity"]}]
+
+def test_merge_on_normalized_name():
+    dm = make_dm([{"did": "D1", "diagnosis": "Hepatitis C", "indicators_point": ["jaundice"]}])
+    merged, ambiguous = dm.merge_locally([{"did": "D9", "diagnosis": "  hepatitis-c ", "indicators_point": ["Jaundice", "dark urine"]}])
+    assert ambiguous == []
+    assert [d["did"] for d in merged] == ["D1"]
+    assert merged[0]["indicators_point"] == ["jaundice", "dark urine"]
+
+def test_same_indicators_different_disease_is_ambiguous():
+    dm = make_dm([{"did": "D1", "diagnosis": "NAFLD", "indicators_point": LIVER}])
+    cand = {"did": "D8", "diagnosis": "Hepatitis C", "indicators_point": list(LIVER)}
+    merged, ambiguous = dm.merge_locally([cand])
+    assert ambiguous == [cand]
+    assert merged == [{"did": "D1", "diagnosis": "NAFLD", "indicators_point": LIVER}]
+
+def test_synonym_without_shared_indicators_is_ambiguous():
+    dm = make_dm([{"did": "D1", "diagnosis": "NAFLD", "indicators_point": ["obesity"]}])
+    cand = {"did": "D7", "diagnosis": "Non-alcoholic fatty liver disease", "indicators_point": ["insulin resistance"]}
+    merged, ambiguous = dm.merge_locally([cand])
+    assert ambiguous == [cand]
+    assert [d["did"] for d in merged] == ["D1"]
+
+def test_empty_pool_adds_candidates():
+    dm = DiagnosisManager()
+    merged, ambiguous = dm.merge_locally([
+        {"did": "D1", "diagnosis": "NAFLD", "indicators_point": ["obesity"]},
+        {"did": "D2", "diagnosis": "Hepatitis C", "indicators_point": ["IV drug use"]},
+    ])
+    assert ambiguous == []
+    assert [d["did"] for d in merged] == ["D1", "D2"]
+
+def test_consolidate_escalates_only_ambiguous():
+    dm = make_dm([{"did": "D1", "diagnosis": "NAFLD", "indicators_point": LIVER}])
+    calls = []
+
+    async def escalate(pool, ambiguous):
+        calls.append(ambiguous)
+        return pool + ambiguous
+
+    assert asyncio.run(dm.consolidate([{"did": "D1", "diagnosis": "NAFLD", "indicators_point": ["obesity"]}], escalate))
+    assert calls == []
+    assert not asyncio.run(dm.consolidate([{"did": "D8", "diagnosis": "Hepatitis C", "indicators_point": LIVER}], escalate))
+    assert len(calls) == 1
+    assert [d["did"] for d in dm.get_consolidated_diagnoses()] == ["D1", "D8"]
+    assert dm.merge_stats == {"local": 1, "escalated": 1}
+
+def test_update_diagnoses_orders_by_probability():
+    dm = DiagnosisManager()
+    dm.update_diagnoses([{"did": "A", "diagnosis": "A", "indicators_point": ["x"]},
+                         {"did": "B", "diagnosis": "B", "indicators_point": ["1", "2", "3", "4", "5", "6"]}])
+    dm.update_diagnoses([{"did": "A", "diagnosis": "A", "indicators_point": ["x", "y"]}])
+    assert [d["did"] for d in dm._get_sorted_list()] == ["B", "A"]
+    assert dm._by_did["A"]["indicators_point"] == ["x", "y"]
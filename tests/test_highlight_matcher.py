@@ -0,0 +1,43 @@
+from highlight_matcher import collapse_overlaps, final_highlights, local_highlights
+
+LIVER = [{"did": "D1", "diagnosis": "Hepatitis", "indicators_point": ["Jaundice (yellow skin)", "Dark urine", "nausea and vomiting"]}]
+
+def texts(items):
+    return [h["text"] for h in items]
+
+def test_red_flag_and_indicator_matches():
+    out = local_highlights("I've had chest pain and my urine looks dark urine lately, plus some jaundice.", LIVER)
+    assert {"level": "danger", "text": "chest pain"} in out
+    assert {"level": "warning", "text": "jaundice"} in out
+    assert "dark urine" in texts(out)
+
+def test_negated_findings_are_not_flagged():
+    assert local_highlights("No, I have no chest pain at all.", LIVER) == []
+    assert local_highlights("I am not confused", LIVER) == []
+    assert local_highlights("I don’t have any nausea.", LIVER) == []
+
+def test_negation_does_not_cross_clauses():
+    out = local_highlights("No fever, but I fainted yesterday.", LIVER)
+    assert texts(out) == ["fainted"]
+
+def test_word_of_indicator_phrase_not_matched_alone():
+    assert local_highlights("My skin is itchy.", LIVER) == []
+    assert texts(local_highlights("I noticed yellow skin last week.", LIVER)) == ["yellow skin"]
+
+def test_whole_words_and_plurals():
+    ctx = [{"indicators_point": ["headache"]}]
+    assert texts(local_highlights("Bad headaches every morning.", ctx)) == ["headaches"]
+    assert local_highlights("Some headachey feeling.", ctx) == []
+
+def test_refined_replaces_local():
+    answer = "I was confused for a moment, then fine."
+    local = [{"level": "danger", "text": "confused"}]
+    assert final_highlights(answer, local, []) == []
+    assert final_highlights(answer, local, None) == local
+
+def test_overlapping_spans_collapse_to_longest():
+    answer = "My eyes show yellow jaundice since Monday."
+    items = [{"level": "danger", "text": "jaundice"}, {"level": "warning", "text": "yellow jaundice"},
+             {"level": "warning", "text": "Monday"}]
+    assert collapse_overlaps(answer, items) == [{"level": "danger", "text": "yellow jaundice"},
+                                                {"level": "warning", "text": "Monday"}]
@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import pytest
+
+import response_models
+from question_dedup import QuestionDeduplicator
+from question_manager import QuestionPoolManager
+
+@pytest.mark.parametrize("indexed, query", [
+    ("Any history of hepatitis B?", "Any history of hepatitis C?"),
+    ("Any chest pain?", "Any chest pain at rest?"),
+    ("Do you smoke?", "Did you smoke?"),
+    ("Any pain in your left knee?", "Any pain in your right knee?"),
+    ("Do you drink alcohol?", "Do you not drink alcohol?"),
+    ("Taking 2 tablets a day?", "Taking 3 tablets a day?"),
+])
+def test_distinct_questions_are_not_merged(indexed, query):
+    dedup = QuestionDeduplicator()
+    dedup.add("q", indexed)
+    assert dedup.find(query) is None
+    assert dedup.find_brute_force(query) is None
+
+@pytest.mark.parametrize("indexed, query", [
+    ("Any allergies to drugs?", "Drug Allergies"),
+    ("Any chest pain?", "Do you have any chest pains?"),
+    ("Any haemoglobin problems?", "Any hemoglobin problems?"),
+])
+def test_paraphrases_are_merged(indexed, query):
+    dedup = QuestionDeduplicator()
+    dedup.add("q", indexed)
+    assert dedup.find(query)[0] == "q"
+
+def make_pool(*texts):
+    qm = QuestionPoolManager([])
+    return qm, [q["qid"] for q in qm.add_questions_from_text(list(texts))]
+
+def test_ranking_orders_active_questions():
+    qm, (a, b, c) = make_pool("Any fever?", "Any jaundice?", "Any itching?")
+    qm.update_ranking([{"rank": 1, "qid": c}, {"rank": 2, "qid": a}, {"rank": 3, "qid": b}])
+    assert [q["qid"] for q in qm.get_recommend_question()] == [c, a, b]
+
+def test_unranked_questions_are_archived_and_resurrected():
+    qm, (a, b) = make_pool("Any fever?", "Any jaundice?")
+    qm.update_ranking([{"rank": 1, "qid": b}])
+    assert [q["qid"] for q in qm.get_recommend_question()] == [b]
+    assert qm.get_archived("deleted") == [{"role": "nurse", "content": "Any fever?", "qid": a, "status": "deleted"}]
+    # Asking it again (as a paraphrase) brings it back under the same qid
+    assert [q["qid"] for q in qm.add_questions_from_text(["Do you have any fevers?"])] == [a]
+    assert {q["qid"] for q in qm.get_recommend_question()} == {a, b}
+
+def test_filtered_ranker_response_deletes_omitted_questions():
+    qm, (a, b, c) = make_pool("Any fever?", "Any jaundice?", "Any itching?")
+    response = SimpleNamespace(parsed=None, text=f'[{{"rank": 1, "qid": "{c}"}}, {{"rank": 2, "qid": "{a}"}}]')
+    ranking = response_models.parse("ranker", response, response_models.validate_ranking, [a, b, c])
+    qm.update_ranking(ranking)
+    assert [q["qid"] for q in qm.get_recommend_question()] == [c, a]
+    assert qm.get_question(b)["status"] == "deleted"
+
+def test_asked_questions_keep_order_and_are_not_readded():
+    qm, (a, b, c) = make_pool("Any fever?", "Any jaundice?", "Any itching?")
+    qm.update_status(c, "asked")
+    qm.update_answer(c, "yes")
+    qm.update_status(a, "asked")
+    assert [q["qid"] for q in qm.get_client_view()] == [c, a, b]
+    assert qm.get_client_view()[0]["answer"] == "yes"
+    assert qm.add_questions_from_text(["any itching"]) == []
+    assert [q["qid"] for q in qm.get_questions()] == [a, b, c]
+
+def test_cap_deletes_lowest_ranked():
+    qm = QuestionPoolManager([], max_active=2)
+    a, b, c = (q["qid"] for q in qm.add_questions_from_text(["Any fever?", "Any jaundice?", "Any itching?"]))
+    qm.update_ranking([{"rank": 1, "qid": b}, {"rank": 2, "qid": c}, {"rank": 3, "qid": a}])
+    assert [q["qid"] for q in qm.get_recommend_question()] == [b, c]
+    assert qm.get_question(a)["status"] == "deleted"
@@ -0,0 +1,39 @@
+import asyncio
+from types import SimpleNamespace
+
+import recorder
+import telemetry
+
+def config(instruction):
+    return SimpleNamespace(system_instruction=instruction)
+
+def record(tmp_path, calls):
+    rec = recorder.Recorder(str(tmp_path))
+    telemetry.current_session.set("S1")
+    for contents, text in calls:
+        rec.add({"k": "gen", "ch": recorder._channel("m", config("ranker")), "model": "m",
+                 "key": recorder._request_key(contents), "dur": 0, "text": text, "usage": None})
+    rec.close("S1")
+    return rec
+
+def test_close_forgets_session(tmp_path):
+    rec = record(tmp_path, [("a", "A")])
+    assert rec._buffers == {} and rec._started == {}
+
+def test_replay_matches_request_key_before_order(tmp_path):
+    record(tmp_path, [("first prompt", "1"), ("second prompt", "2"), ("third prompt", "3")])
+    replayer = recorder.Replayer(str(tmp_path / "S1.jsonl.gz"))
+
+    async def session(name, prompts):
+        telemetry.current_session.set(name)
+        return [(await replayer.generate("m", p, config("ranker"))).text for p in prompts]
+
+    async def main():
+        # Concurrent calls arriving out of recorded order still get their own responses
+        return await asyncio.gather(session("R1", ["second prompt", "first prompt", "changed prompt"]),
+                                    session("R2", ["third prompt"]))
+
+    assert asyncio.run(main()) == [["2", "1", "3"], ["3"]]
+    assert replayer.stats == {"served": 4, "diverged": 1, "exhausted": 0}
+    replayer.end_session("R1")
+    assert all(state[0] != "R1" for state in replayer._used)
@@ -0,0 +1,81 @@
+import pytest
+
+import response_models as rm
+from response_models import ResponseValidationError, StreamingObjectParser, loads_lenient
+
+def test_loads_lenient_plain_and_fenced():
+    assert loads_lenient('{"a": 1}') == ({"a": 1}, False)
+    assert loads_lenient('```json\n[1, 2]\n```') == ([1, 2], True)
+
+def test_loads_lenient_drops_truncated_tail():
+    data, repaired = loads_lenient('[{"rank": 1, "qid": "a"}, {"rank": 2, "qid": "b"}, {"rank": 3, "qi')
+    assert repaired
+    # The cut-off field is dropped; the validators discard the incomplete item
+    assert data == [{"rank": 1, "qid": "a"}, {"rank": 2, "qid": "b"}, {"rank": 3}]
+
+def test_loads_lenient_never_completes_a_cut_string():
+    data, _ = loads_lenient('{"question": "Do you drink", "reasoning": "Alcohol is a ma')
+    assert data == {"question": "Do you drink"}
+
+def test_loads_lenient_gives_up_on_garbage():
+    with pytest.raises(ResponseValidationError):
+        loads_lenient("not json at all")
+
+def test_streaming_parser_emits_fields_as_they_complete():
+    parser = StreamingObjectParser()
+    assert parser.feed('{"question": "Any fev') == {}
+    assert parser.feed('er?", "qid": "q1", "end_conversation": fal') == {"question": "Any fever?", "qid": "q1"}
+    assert parser.feed('se, "reasoning": "x \\" y", "tags": ["a", {"b": 1}]}') == {
+        "end_conversation": False, "reasoning": 'x " y', "tags": ["a", {"b": 1}]}
+    assert parser.fields["question"] == "Any fever?"
+
+def test_validate_ranking_renumbers_and_drops_unknown():
+    ranking, fixed = rm.validate_ranking([{"rank": 5, "qid": "b"}, {"rank": 2, "qid": "a"}, {"rank": 1, "qid": "zz"}], ["a", "b"])
+    assert ranking == [{"rank": 1, "qid": "a"}, {"rank": 2, "qid": "b"}]
+    assert fixed
+
+def test_validate_ranking_appends_cut_off_qids_in_previous_order():
+    data, repaired = loads_lenient('[{"rank": 1, "qid": "c"}, {"rank": 2, "qid": "a"}, {"rank": 3, "q')
+    ranking, fixed = rm.validate_ranking(data, ["a", "b", "c", "d"], repaired=repaired)
+    assert [r["qid"] for r in ranking] == ["c", "a", "b", "d"]
+    assert [r["rank"] for r in ranking] == [1, 2, 3, 4]
+    assert fixed
+
+class FakeResponse:
+    parsed = None
+
+    def __init__(self, text):
+        self.text = text
+
+def test_parse_ranking_keeps_omissions_of_a_complete_response():
+    ranking = rm.parse("ranker", FakeResponse('[{"rank": 1, "qid": "c"}, {"rank": 2, "qid": "a"}]'),
+                       rm.validate_ranking, ["a", "b", "c", "d"])
+    assert ranking == [{"rank": 1, "qid": "c"}, {"rank": 2, "qid": "a"}]
+    assert rm.validate_ranking([{"rank": 1, "qid": "c"}], ["a", "c"]) == ([{"rank": 1, "qid": "c"}], False)
+
+def test_parse_ranking_backfills_only_a_truncated_response():
+    fenced = rm.parse("ranker", FakeResponse('```json\n[{"rank": 1, "qid": "c"}]\n```'), rm.validate_ranking, ["a", "c"])
+    assert [r["qid"] for r in fenced] == ["c"]
+    cut = rm.parse("ranker", FakeResponse('[{"rank": 1, "qid": "c"}, {"rank": 2, "qi'), rm.validate_ranking, ["a", "c"])
+    assert [r["qid"] for r in cut] == ["c", "a"]
+
+def test_validate_ranking_rejects_unknown_only():
+    with pytest.raises(ResponseValidationError):
+        rm.validate_ranking([{"rank": 1, "qid": "x"}], ["a"])
+
+def test_validate_diagnosis_repairs_items():
+    out, fixed = rm.validate_diagnosis([{"diagnosis": "Hepatitis C", "indicators_point": "jaundice"}, {"did": "D2"}])
+    assert out == {"diagnosis_list": [{"diagnosis": "Hepatitis C", "did": "D-hepatitisc", "indicators_point": ["jaundice"]}],
+                   "follow_up_questions": []}
+    assert fixed
+
+def test_validate_advice_clears_unknown_qid():
+    out, fixed = rm.validate_advice({"question": " Any fever? ", "qid": "zz", "end_conversation": "no"}, ["a"])
+    assert out == {"question": "Any fever?", "qid": None, "end_conversation": False, "reasoning": ""}
+    assert fixed
+
+def test_validate_highlights_keeps_exact_substrings():
+    out, fixed = rm.validate_highlights([{"level": "danger", "text": "CHEST PAIN"}, {"level": "odd", "text": "fever"},
+                                         {"level": "warning", "text": "missing"}], "Chest pain and fever")
+    assert out == [{"level": "danger", "text": "Chest pain"}, {"level": "warning", "text": "fever"}]
+    assert fixed
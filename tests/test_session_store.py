@@ -0,0 +1,81 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+import session_store
+
+@pytest.fixture(params=["sqlite", "file"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return session_store.SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    return session_store.FileSessionStore(str(tmp_path / "sessions"))
+
+def test_checkpoints_append_transcript_and_replace_state(store):
+    store.create("S1", {"patient_id": "P0001", "gender": "Female"})
+    store.checkpoint("S1", [{"speaker": "NURSE", "text": "Hello"}], {"cycle": 0})
+    store.checkpoint("S1", [], {"cycle": 1})
+    store.checkpoint("S1", [{"speaker": "PATIENT", "text": "Hi"}], {"cycle": 2}, finished=True)
+    saved = store.load("S1")
+    assert saved["meta"] == {"patient_id": "P0001", "gender": "Female"}
+    assert saved["state"] == {"cycle": 2}
+    assert [e["text"] for e in saved["transcript"]] == ["Hello", "Hi"]
+    assert saved["finished"]
+
+def test_unknown_session(store):
+    assert store.load("nope") is None
+    store.checkpoint("nope", [{"speaker": "NURSE", "text": "x"}], {})
+    assert store.load("nope") is None
+
+def test_prune_removes_finished_then_idle_sessions(store):
+    store.create("done", {"patient_id": "P1"})
+    store.checkpoint("done", [{"speaker": "NURSE", "text": "x"}], {}, finished=True)
+    store.create("open", {"patient_id": "P2"})
+    store.checkpoint("open", [{"speaker": "NURSE", "text": "y"}], {})
+    time.sleep(0.01)
+    assert store.prune(finished_ttl=0, idle_ttl=3600) == 1
+    assert store.load("done") is None and store.load("open") is not None
+    assert store.prune(finished_ttl=3600, idle_ttl=0) == 1
+    assert store.load("open") is None
+
+class FakeWebSocket:
+    async def send_json(self, data):
+        pass
+
+def test_manager_resumes_from_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import simulation
+
+    store = session_store.SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    first = simulation.SimulationManager(FakeWebSocket(), "P0001", "Female", store=store)
+    asyncio.run(asyncio.to_thread(store.create, first.session_id, {"patient_id": "P0001", "gender": "Female"}))
+    first.tm.log("NURSE", "How are you?")
+    first.tm.log("PATIENT", "Tired.")
+    qid = first.qm.get_recommend_question()[0]["qid"]
+    first.qm.update_status(qid, "asked")
+    first.dm.set_consolidated_diagnoses([{"did": "D1", "diagnosis": "NAFLD", "indicators_point": ["fatigue"]}])
+    first.cycle = 3
+    asyncio.run(first._checkpoint())
+
+    resumed = asyncio.run(simulation.SimulationManager.resume(FakeWebSocket(), first.session_id, store=store))
+    assert resumed.restored and resumed.gender == "Female" and resumed.cycle == 3
+    assert resumed.owner != first.owner
+    assert [e["text"] for e in resumed.tm.get_history()] == ["How are you?", "Tired."]
+    assert resumed.qm.get_question(qid)["status"] == "asked"
+    assert resumed.dm.get_consolidated_diagnoses_basic()[0]["did"] == "D1"
+
+    asyncio.run(asyncio.to_thread(store.checkpoint, first.session_id, [], resumed._export_state(), True))
+    assert asyncio.run(simulation.SimulationManager.resume(FakeWebSocket(), first.session_id, store=store)) is None
+
+def test_resume_before_first_checkpoint_reruns_init(tmp_path, monkeypatch):
+    monkeypatch.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import simulation
+
+    store = session_store.SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    store.create("S1", {"patient_id": "P0001", "gender": "Male"})
+    resumed = asyncio.run(simulation.SimulationManager.resume(FakeWebSocket(), "S1", store=store))
+    assert resumed.restored and not resumed._restored_state
+    store.checkpoint("S1", [{"speaker": "NURSE", "text": "Hello"}], resumed._export_state())
+    resumed = asyncio.run(simulation.SimulationManager.resume(FakeWebSocket(), "S1", store=store))
+    assert resumed._restored_state
@@ -0,0 +1,43 @@
+import asyncio
+import contextlib
+
+import pytest
+
+import simulation
+
+def make_connection(events, name, fail=False):
+    @contextlib.asynccontextmanager
+    async def connect():
+        await asyncio.sleep(0.01 if fail else 0)
+        if fail:
+            raise ConnectionError(name)
+        events.append(f"open {name}")
+        try:
+            yield name
+        finally:
+            events.append(f"close {name}")
+    return connect()
+
+def test_enter_concurrently_opens_both():
+    events = []
+
+    async def run():
+        async with contextlib.AsyncExitStack() as stack:
+            sessions = await simulation.enter_concurrently(
+                stack, make_connection(events, "nurse"), make_connection(events, "patient"))
+            assert sessions == ["nurse", "patient"]
+        return events
+
+    assert sorted(asyncio.run(run())) == ["close nurse", "close patient", "open nurse", "open patient"]
+
+def test_enter_concurrently_closes_the_survivor():
+    events = []
+
+    async def run():
+        async with contextlib.AsyncExitStack() as stack:
+            await simulation.enter_concurrently(
+                stack, make_connection(events, "nurse"), make_connection(events, "patient", fail=True))
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(run())
+    assert events == ["open nurse", "close nurse"]
@@ -0,0 +1,14 @@
+from types import SimpleNamespace
+
+import telemetry
+
+def test_gcs_endpoint_times_calls_and_counts_error_responses():
+    @telemetry.gcs_endpoint("test_op")
+    def endpoint(fail):
+        return SimpleNamespace(status_code=500 if fail else 200)
+
+    assert endpoint(False).status_code == 200
+    assert endpoint(fail=True).status_code == 500
+    rendered = telemetry.METRICS.render()
+    assert 'medforce_gcs_op_seconds_count{op="test_op"} 2' in rendered
+    assert 'medforce_gcs_errors_total{op="test_op"} 1' in rendered
@@ -1,23 +1,53 @@
 # --- utils.py ---
+import os
+import asyncio
 import logging
 from google.cloud import storage
 
+import cluster
+import telemetry
+
 logger = logging.getLogger("medforce-backend")
 
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "300"))
+
+def _profile_cache_key(pid: str, filename: str) -> str:
+    return f"profile:{pid}/{filename}"
+
+def invalidate_profile_cache(pid: str, filename: str):
+    cluster.get_cache().delete(_profile_cache_key(pid, filename))
+
 def fetch_gcs_text_internal(pid: str, filename: str) -> str:
-    """Fetches text content from GCS for internal logic use."""
+    """Fetches text content from GCS for internal logic use (cached across workers)."""
+    cache = cluster.get_cache()
+    cached = cache.get(_profile_cache_key(pid, filename))
+    if cached is not None:
+        return cached
+    text = _download_gcs_text(pid, filename)
+    if not text.startswith("System: Error"):
+        cache.set(_profile_cache_key(pid, filename), text, ttl=PROFILE_CACHE_TTL)
+    return text
+
+def _download_gcs_text(pid: str, filename: str) -> str:
     BUCKET_NAME = "clinic_sim"
     try:
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(BUCKET_NAME)
-        blob_path = f"patient_profile/{pid}/{filename}"
-        blob = bucket.blob(blob_path)
-        
-        if not blob.exists():
-            logger.warning(f"File not found in GCS: {blob_path}")
-            return f"System: Error - File {filename} not found."
+        with telemetry.gcs_op("download_profile"):
+            storage_client = storage.Client()
+            bucket = storage_client.bucket(BUCKET_NAME)
+            blob_path = f"patient_profile/{pid}/{filename}"
+            blob = bucket.blob(blob_path)
             
-        return blob.download_as_text()
+            if not blob.exists():
+                logger.warning(f"File not found in GCS: {blob_path}")
+                return f"System: Error - File {filename} not found."
+                
+            return blob.download_as_text()
     except Exception as e:
         logger.error(f"GCS Internal Error: {e}")
-        return "System: Error loading profile."
\ No newline at end of file
+        return "System: Error loading profile."
+
+async def fetch_gcs_texts_async(pid: str, filenames: list) -> list:
+    """Fetches several profile files concurrently without blocking the event loop."""
+    return await asyncio.gather(*(
+        asyncio.to_thread(fetch_gcs_text_internal, pid, name) for name in filenames
+    ))